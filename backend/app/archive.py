@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Streamed ZIP/TAR archives of result files.
+
+Archives are written into a small in-memory buffer that is drained after
+every chunk, so a batch of hundreds of results is sent without building the
+whole archive in memory or on disk. Results are already compressed images,
+so ZIP entries are stored, not deflated.
+"""
+from __future__ import annotations
+
+import tarfile
+import zipfile
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple
+
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+ARCHIVE_MEDIA_TYPES = {"zip": "application/zip", "tar": "application/x-tar"}
+
+ArchiveEntry = Tuple[str, Path]
+
+
+class _DrainBuffer:
+    """Write-only file object whose contents are taken out by :meth:`drain`."""
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        if data:
+            self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def iter_zip(entries: Iterable[ArchiveEntry], chunk_size: int = ARCHIVE_CHUNK_SIZE) -> Iterator[bytes]:
+    buffer = _DrainBuffer()
+    # buffer tidak bisa di-seek: zipfile menulis data descriptor setelah tiap entri
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for name, path in entries:
+            with path.open("rb") as source, archive.open(name, mode="w", force_zip64=True) as target:
+                while chunk := source.read(chunk_size):
+                    target.write(chunk)
+                    yield buffer.drain()
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def iter_tar(entries: Iterable[ArchiveEntry], chunk_size: int = ARCHIVE_CHUNK_SIZE) -> Iterator[bytes]:
+    buffer = _DrainBuffer()
+    with tarfile.open(fileobj=buffer, mode="w|", bufsize=chunk_size) as archive:  # type: ignore[call-overload]
+        for name, path in entries:
+            info = archive.gettarinfo(str(path), arcname=name)
+            with path.open("rb") as source:
+                archive.addfile(info, source)
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def iter_archive(kind: str, entries: Iterable[ArchiveEntry]) -> Iterator[bytes]:
+    if kind not in ARCHIVE_MEDIA_TYPES:
+        raise ValueError(f"Format arsip {kind} tidak didukung")
+    writer = iter_zip if kind == "zip" else iter_tar
+    return (chunk for chunk in writer(entries) if chunk)
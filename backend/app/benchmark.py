@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+"""
+Operation benchmark: ``python -m app.benchmark run`` / ``compare``.
+
+Runs every registry operation (with its registry defaults and a few
+representative params) and every legacy ``img_ops.OPERATION_MAP`` handler
+over synthetic gray/BGR/BGRA images from 0.25 to 50 MP, through the same
+``img_ops`` entry points the job pipeline uses (tiling included). Each case
+records the median wall time, throughput (MP/s) and the peak traced memory of
+one warm-up run into a JSON report; ``compare`` diffs two reports and exits
+non-zero when a case regressed beyond the threshold.
+
+Operations declared ``executor="process"`` are measured in-process: the
+numbers cover the operation itself, not the pool round-trip.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import math
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence
+
+import cv2
+import numpy as np
+
+from . import img_ops
+from .schemas import OperationEnum
+from .services import image_ops as registry_ops
+
+logger = logging.getLogger("aintra.benchmark")
+
+REPORT_VERSION = 1
+DEFAULT_SIZES = (0.25, 1.0, 4.0, 16.0, 50.0)
+MODES = ("gray", "bgr", "bgra")
+DEFAULT_REPEAT = 3
+# kasus lambat (50 MP) berhenti mengulang setelah anggaran ini habis
+DEFAULT_MAX_SECONDS = 30.0
+DEFAULT_THRESHOLD = 0.15
+DEFAULT_MEMORY_THRESHOLD = 0.25
+# selisih di bawah ini dianggap noise pengukuran, berapa pun rasionya
+DEFAULT_MIN_DELTA_MS = 2.0
+LEGACY_PREFIX = "legacy:"
+
+# parameter representatif selain default registry: cabang yang jalur kodenya berbeda
+REGISTRY_VARIANTS: Mapping[str, Mapping[str, Dict[str, Any]]] = {
+    "negative": {"luma": {"mode": "luma", "blend": 0.5}},
+    "gamma": {"gamma_2": {"gamma": 2.2}},
+    "hist_eq_clahe": {"he_gray": {"mode": "he_gray"}, "clahe_16": {"clip_limit": 4.0, "tile_grid": 16}},
+    "gaussian": {"k15": {"ksize": 15, "sigma": 3.0}},
+    "median": {"k15": {"ksize": 15}},
+    "bilateral": {"d19": {"d": 19, "sigmaColor": 150.0, "sigmaSpace": 150.0}},
+    "sharpen": {"unsharp": {"method": "unsharp", "ksize": 7, "alpha": 1.5}},
+    "edges": {"sobel": {"mode": "sobel", "ksize": 5}, "canny_l2": {"aperture": 5, "l2grad": True}},
+    "morph": {"close_k15": {"op": "close", "kernel": 15, "iter": 3}},
+    "geo": {"affine": {"rotate_deg": 30.0, "scale": 1.5, "tx": 20.0, "ty": -20.0}},
+    "thresh_global": {"tozero": {"thresh": 90.0, "type": "tozero"}},
+    "thresh_adapt_otsu": {"otsu": {"method": "otsu", "pre_blur": True}, "block51": {"block_size": 51}},
+    "nlmeans": {"search31": {"template": 7, "search": 31}},
+    "hsv_adjust": {"shift": {"delta_h": 30.0, "scale_s": 1.3, "scale_v": 0.9}},
+    "contrast_stretch": {"narrow": {"p_low": 10.0, "p_high": 90.0}},
+}
+
+LEGACY_VARIANTS: Mapping[OperationEnum, Mapping[str, Dict[str, Any]]] = {
+    OperationEnum.HISTOGRAM_MATCH: {"luminance": {"mode": "luminance"}},
+    OperationEnum.ACTIVE_CONTOUR: {"mask": {"output": "mask", "max_iter": 100}},
+    OperationEnum.FEATURES: {
+        category: {"category": category}
+        for category in ("geometry", "texture_glcm", "texture_lbp", "texture_hog", "color_kmeans")
+    },
+    OperationEnum.HSV_THRESHOLD: {"mask": {"output": "mask"}},
+    OperationEnum.KMEANS_COLOR: {"k8": {"K": 8, "attempts": 5}},
+}
+
+
+@dataclass(frozen=True)
+class BenchmarkCase:
+    name: str
+    variant: str
+    operation: img_ops.OperationKey
+    params: Dict[str, Any]
+
+
+def iter_cases(operations: Optional[Iterable[str]] = None) -> List[BenchmarkCase]:
+    """Registry cases (params validated up front) followed by the legacy handlers."""
+    wanted = set(operations) if operations else None
+    cases: List[BenchmarkCase] = []
+    for canonical in registry_ops.CANONICAL_OPERATIONS:
+        if wanted is not None and canonical not in wanted:
+            continue
+        variants = {"defaults": {}, **REGISTRY_VARIANTS.get(canonical, {})}
+        for variant, params in variants.items():
+            operation, validated = img_ops.resolve_operation(canonical, params)
+            cases.append(BenchmarkCase(canonical, variant, operation, validated))
+    for operation in img_ops.OPERATION_MAP:
+        name = LEGACY_PREFIX + operation.value
+        if wanted is not None and name not in wanted:
+            continue
+        variants = {"defaults": {}, **LEGACY_VARIANTS.get(operation, {})}
+        for variant, params in variants.items():
+            cases.append(BenchmarkCase(name, variant, operation, dict(params)))
+    if wanted is not None:
+        unknown = wanted - {case.name for case in cases}
+        if unknown:
+            raise ValueError(f"Operasi tidak dikenal: {', '.join(sorted(unknown))}")
+    return cases
+
+
+def image_shape(megapixels: float) -> tuple[int, int]:
+    """Height and width of a 3:2 frame holding ``megapixels`` million pixels."""
+    width = max(8, int(round(math.sqrt(megapixels * 1e6 * 1.5))))
+    return max(8, int(round(width / 1.5))), width
+
+
+def synthetic_image(megapixels: float, mode: str, seed: int = 0) -> np.ndarray:
+    """Deterministic test frame: gradients, filled shapes and mild noise, so edges and thresholds do real work."""
+    if mode not in MODES:
+        raise ValueError(f"Mode citra tidak dikenal: {mode}")
+    height, width = image_shape(megapixels)
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:, :, 0] = (x + y) / 2
+    image[:, :, 1] = y
+    image[:, :, 2] = 255 - x
+    radius_max = max(2, min(height, width) // 6)
+    for _ in range(12):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        color = tuple(int(c) for c in rng.integers(0, 256, size=3))
+        cv2.circle(image, center, int(rng.integers(1, radius_max)), color, -1)
+    noise = rng.integers(0, 24, size=(height, width), dtype=np.uint8)
+    cv2.add(image, cv2.merge([noise, noise, noise]), dst=image)
+    if mode == "gray":
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if mode == "bgra":
+        alpha = np.broadcast_to((255 - y / 2).astype(np.uint8), (height, width))
+        return np.dstack([image, alpha])
+    return image
+
+
+def measure(
+    case: BenchmarkCase,
+    image: np.ndarray,
+    target: np.ndarray,
+    *,
+    repeat: int = DEFAULT_REPEAT,
+    max_seconds: float = DEFAULT_MAX_SECONDS,
+) -> Dict[str, Any]:
+    """Warm-up run under tracemalloc for the peak, then up to ``repeat`` timed runs."""
+    megapixels = image.shape[0] * image.shape[1] / 1e6
+
+    def once() -> np.ndarray:
+        result, _ = img_ops.apply_operation_with_metrics(image, case.operation, case.params, target=target)
+        return result
+
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = once()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    shape = list(result.shape)
+    del result
+    timings: List[float] = []
+    while len(timings) < max(1, repeat):
+        start = time.perf_counter()
+        once()
+        timings.append(time.perf_counter() - start)
+        if sum(timings) >= max_seconds:
+            break
+    seconds = statistics.median(timings)
+    return {
+        "seconds": seconds,
+        "min_seconds": min(timings),
+        "runs": len(timings),
+        "mp_per_s": megapixels / seconds if seconds > 0 else None,
+        "peak_mb": max(peak, 0) / (1024 * 1024),
+        "output_shape": shape,
+    }
+
+
+def case_key(name: str, variant: str, mode: str, megapixels: float) -> str:
+    return f"{name}[{variant}]/{mode}/{megapixels:g}MP"
+
+
+def environment() -> Dict[str, Any]:
+    import scipy
+    import skimage
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": cv2.getNumberOfCPUs(),
+        "opencv": cv2.__version__,
+        "opencv_threads": cv2.getNumThreads(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "scikit_image": skimage.__version__,
+    }
+
+
+def max_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process, or None where ``resource`` is unavailable (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux melaporkan KiB, macOS byte
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run(
+    *,
+    sizes: Sequence[float] = DEFAULT_SIZES,
+    modes: Sequence[str] = MODES,
+    operations: Optional[Iterable[str]] = None,
+    repeat: int = DEFAULT_REPEAT,
+    max_seconds: float = DEFAULT_MAX_SECONDS,
+) -> Dict[str, Any]:
+    """Benchmark every case on every size and mode; failing cases are recorded, not raised."""
+    cases = iter_cases(operations)
+    results: List[Dict[str, Any]] = []
+    for megapixels in sizes:
+        for mode in modes:
+            # satu citra (dan target histogram-match) hidup pada satu waktu: 50 MP BGRA = 200 MB
+            image = synthetic_image(megapixels, mode)
+            target = synthetic_image(megapixels, mode, seed=1)
+            for case in cases:
+                key = case_key(case.name, case.variant, mode, megapixels)
+                entry: Dict[str, Any] = {
+                    "key": key,
+                    "operation": case.name,
+                    "variant": case.variant,
+                    "params": case.params,
+                    "mode": mode,
+                    "megapixels": megapixels,
+                    "shape": list(image.shape),
+                }
+                try:
+                    entry.update(measure(case, image, target, repeat=repeat, max_seconds=max_seconds))
+                    logger.info("%s: %.1f ms, %.1f MP/s", key, entry["seconds"] * 1000, entry["mp_per_s"] or 0)
+                except Exception as exc:  # noqa: BLE001 - satu kasus gagal tidak menghentikan run
+                    # pesan OpenCV memuat signature C++ panjang; baris terakhir sudah cukup
+                    message = (str(exc).strip().splitlines() or [""])[-1][:200]
+                    entry["error"] = f"{type(exc).__name__}: {message}"
+                    logger.warning("%s gagal: %s", key, entry["error"])
+                results.append(entry)
+            del image, target
+    env = environment()
+    env["max_rss_mb"] = max_rss_mb()
+    return {
+        "version": REPORT_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": env,
+        "results": results,
+    }
+
+
+def compare(
+    baseline: Mapping[str, Any],
+    current: Mapping[str, Any],
+    *,
+    threshold: float = DEFAULT_THRESHOLD,
+    memory_threshold: float = DEFAULT_MEMORY_THRESHOLD,
+    min_delta_ms: float = DEFAULT_MIN_DELTA_MS,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Match cases by key and sort them into regressions, improvements and missing/new cases."""
+    before = {entry["key"]: entry for entry in baseline.get("results", [])}
+    after = {entry["key"]: entry for entry in current.get("results", [])}
+    findings: Dict[str, List[Dict[str, Any]]] = {"regressions": [], "improvements": [], "missing": [], "new": []}
+    for key, old in before.items():
+        new = after.get(key)
+        if new is None:
+            findings["missing"].append({"key": key})
+            continue
+        if "error" in new:
+            if "error" not in old:
+                findings["regressions"].append({"key": key, "metric": "error", "current": new["error"]})
+            continue
+        if "error" in old:
+            continue
+        delta_ms = (new["seconds"] - old["seconds"]) * 1000
+        ratio = new["seconds"] / old["seconds"] if old["seconds"] > 0 else math.inf
+        finding = {"key": key, "metric": "seconds", "baseline": old["seconds"], "current": new["seconds"], "ratio": ratio}
+        if ratio > 1 + threshold and delta_ms > min_delta_ms:
+            findings["regressions"].append(finding)
+        elif ratio < 1 / (1 + threshold) and -delta_ms > min_delta_ms:
+            findings["improvements"].append(finding)
+        old_peak, new_peak = old.get("peak_mb"), new.get("peak_mb")
+        # di bawah 1 MB puncak memori didominasi alokasi kecil yang tidak stabil
+        if old_peak is not None and new_peak is not None and max(old_peak, new_peak) >= 1.0:
+            if new_peak > max(old_peak, 1.0) * (1 + memory_threshold):
+                findings["regressions"].append(
+                    {"key": key, "metric": "peak_mb", "baseline": old_peak, "current": new_peak, "ratio": new_peak / max(old_peak, 1.0)}
+                )
+    findings["new"] = [{"key": key} for key in after if key not in before]
+    return findings
+
+
+def format_comparison(findings: Mapping[str, List[Dict[str, Any]]], baseline: Mapping[str, Any], current: Mapping[str, Any]) -> str:
+    lines: List[str] = []
+    old_env, new_env = baseline.get("environment", {}), current.get("environment", {})
+    for name in ("opencv", "numpy", "scipy", "scikit_image", "python", "cpu_count"):
+        if old_env.get(name) != new_env.get(name):
+            lines.append(f"lingkungan {name}: {old_env.get(name)} -> {new_env.get(name)}")
+    for title, label in (("regressions", "REGRESI"), ("improvements", "lebih cepat")):
+        for item in sorted(findings[title], key=lambda item: -item.get("ratio", math.inf)):
+            if item["metric"] == "error":
+                lines.append(f"{label} {item['key']}: gagal ({item['current']})")
+            elif item["metric"] == "peak_mb":
+                lines.append(f"{label} {item['key']}: memori {item['baseline']:.1f} -> {item['current']:.1f} MB (x{item['ratio']:.2f})")
+            else:
+                lines.append(
+                    f"{label} {item['key']}: {item['baseline'] * 1000:.1f} -> {item['current'] * 1000:.1f} ms (x{item['ratio']:.2f})"
+                )
+    if findings["missing"]:
+        lines.append(f"{len(findings['missing'])} kasus baseline tidak ada di hasil baru")
+    if findings["new"]:
+        lines.append(f"{len(findings['new'])} kasus baru tanpa baseline")
+    lines.append(f"{len(findings['regressions'])} regresi, {len(findings['improvements'])} lebih cepat")
+    return "\n".join(lines)
+
+
+def _float_list(value: str) -> List[float]:
+    return [float(item) for item in value.split(",") if item.strip()]
+
+
+def _name_list(value: str) -> List[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.benchmark", description="Benchmark operasi citra")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="jalankan benchmark dan tulis laporan JSON")
+    run_parser.add_argument("-o", "--output", type=Path, default=Path("benchmark.json"))
+    run_parser.add_argument("--sizes", type=_float_list, default=list(DEFAULT_SIZES), help="megapiksel, mis. 0.25,1,4")
+    run_parser.add_argument("--modes", type=_name_list, default=list(MODES), help="gray,bgr,bgra")
+    run_parser.add_argument("--ops", type=_name_list, default=None, help="mis. gaussian,legacy:kmeans-color")
+    run_parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    run_parser.add_argument("--max-seconds", type=float, default=DEFAULT_MAX_SECONDS)
+    compare_parser = commands.add_parser("compare", help="bandingkan dua laporan; exit 1 bila ada regresi")
+    compare_parser.add_argument("baseline", type=Path)
+    compare_parser.add_argument("current", type=Path)
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    compare_parser.add_argument("--memory-threshold", type=float, default=DEFAULT_MEMORY_THRESHOLD)
+    compare_parser.add_argument("--min-delta-ms", type=float, default=DEFAULT_MIN_DELTA_MS)
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        unknown_modes = set(args.modes) - set(MODES)
+        if unknown_modes:
+            parser.error(f"mode tidak dikenal: {', '.join(sorted(unknown_modes))}")
+        try:
+            report = run(
+                sizes=args.sizes, modes=args.modes, operations=args.ops, repeat=args.repeat, max_seconds=args.max_seconds
+            )
+        except ValueError as exc:
+            parser.error(str(exc))
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        logger.info("Laporan %d kasus ditulis ke %s", len(report["results"]), args.output)
+        return 0
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    current = json.loads(args.current.read_text(encoding="utf-8"))
+    findings = compare(
+        baseline,
+        current,
+        threshold=args.threshold,
+        memory_threshold=args.memory_threshold,
+        min_delta_ms=args.min_delta_ms,
+    )
+    print(format_comparison(findings, baseline, current))
+    return 1 if findings["regressions"] else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    sys.exit(main())
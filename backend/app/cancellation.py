@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+"Latest request wins" for interactive work such as previews.
+
+Each scope (client + image) holds the token of its newest request; starting
+a new one cancels the previous token, so a preview computed for a slider
+position the user already left stops at its next checkpoint instead of
+occupying a worker. Used only from the event loop, so no locking.
+"""
+from __future__ import annotations
+
+from typing import Dict, Hashable, Optional
+
+from .services.progress import CancelToken
+
+SUPERSEDED = "Digantikan permintaan yang lebih baru"
+
+
+class LatestWins:
+    def __init__(self) -> None:
+        self._current: Dict[Hashable, CancelToken] = {}
+
+    def enter(self, scope: Hashable, timeout: Optional[float] = None) -> CancelToken:
+        """Register new work for ``scope`` and cancel the work it replaces."""
+        previous = self._current.get(scope)
+        if previous is not None:
+            previous.cancel(SUPERSEDED)
+        token = CancelToken(timeout)
+        self._current[scope] = token
+        return token
+
+    def leave(self, scope: Hashable, token: CancelToken) -> None:
+        if self._current.get(scope) is token:
+            del self._current[scope]
+
+    def __len__(self) -> int:
+        return len(self._current)
+
+
+__all__ = ["SUPERSEDED", "LatestWins"]
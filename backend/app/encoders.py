@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Output encoder policies.
+
+PNG at OpenCV's default settings is slow for large photos and heavy for
+previews that are thrown away after the next slider move. Each endpoint has
+a default :class:`EncodePolicy` (env-configurable); clients may override the
+format per request (``format`` field) or through the ``Accept`` header.
+"""
+from __future__ import annotations
+
+import os
+import time
+from dataclasses import dataclass, replace
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from . import storage
+
+MEDIA_TYPES = {"png": "image/png", "webp": "image/webp", "jpeg": "image/jpeg"}
+EXTENSIONS = {"png": ".png", "webp": ".webp", "jpeg": ".jpg"}
+_ACCEPT_ALIASES = {"image/png": "png", "image/webp": "webp", "image/jpeg": "jpeg", "image/jpg": "jpeg"}
+# OpenCV: kualitas WebP > 100 berarti lossless
+WEBP_LOSSLESS_QUALITY = 101
+
+
+@dataclass(frozen=True)
+class EncodePolicy:
+    format: str = "png"
+    quality: int = 80
+    png_compression: int = 1
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES[self.format]
+
+    @property
+    def extension(self) -> str:
+        return EXTENSIONS[self.format]
+
+    @property
+    def tag(self) -> str:
+        """Short id used in cache keys: the same pixels encoded differently are different entries."""
+        if self.format == "png":
+            return f"png:{self.png_compression}"
+        return f"{self.format}:{self.quality}"
+
+    def imwrite_params(self) -> List[int]:
+        if self.format == "png":
+            return [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression]
+        if self.format == "webp":
+            return [cv2.IMWRITE_WEBP_QUALITY, self.quality]
+        return [cv2.IMWRITE_JPEG_QUALITY, min(self.quality, 100)]
+
+
+def _policy_from_env(prefix: str, *, format: str, quality: int, png_compression: int) -> EncodePolicy:
+    fmt = os.getenv(f"AINTRA_{prefix}_FORMAT", format).strip().lower()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt not in MEDIA_TYPES:
+        raise ValueError(f"AINTRA_{prefix}_FORMAT tidak dikenal: {fmt}")
+    return EncodePolicy(
+        format=fmt,
+        quality=max(1, min(WEBP_LOSSLESS_QUALITY, int(os.getenv(f"AINTRA_{prefix}_QUALITY", str(quality))))),
+        png_compression=max(0, min(9, int(os.getenv(f"AINTRA_{prefix}_PNG_COMPRESSION", str(png_compression))))),
+    )
+
+
+# Preview default tetap PNG (klien lama menganggap data:image/png) tetapi dengan kompresi tercepat;
+# WebP/JPEG lossy dipakai bila diminta lewat `format` atau header Accept.
+PREVIEW_POLICY = _policy_from_env("PREVIEW", format="png", quality=80, png_compression=1)
+# Hasil akhir: PNG dengan kompresi sedang; bila WebP diminta, default-nya lossless.
+RESULT_POLICY = _policy_from_env("RESULT", format="png", quality=WEBP_LOSSLESS_QUALITY, png_compression=3)
+
+
+def format_from_accept(accept: str) -> Optional[str]:
+    """First supported image type in ``Accept`` with the highest q value."""
+    best: Optional[Tuple[float, int, str]] = None
+    for index, item in enumerate(accept.lower().split(",")):
+        parts = [part.strip() for part in item.split(";")]
+        fmt = _ACCEPT_ALIASES.get(parts[0])
+        if fmt is None:
+            continue
+        q = 1.0
+        for part in parts[1:]:
+            if part.startswith("q="):
+                try:
+                    q = float(part[2:])
+                except ValueError:
+                    q = 0.0
+        if q <= 0:
+            continue
+        candidate = (-q, index, fmt)
+        if best is None or candidate < best:
+            best = candidate
+    return best[2] if best else None
+
+
+def negotiate(default: EncodePolicy, requested: Optional[str] = None, accept: str = "") -> EncodePolicy:
+    fmt = requested or format_from_accept(accept) or default.format
+    if fmt == default.format:
+        return default
+    return replace(default, format=fmt)
+
+
+def encode(image: np.ndarray, policy: EncodePolicy) -> Tuple[bytes, float]:
+    """Encode with ``policy``; returns the bytes and the encode time in milliseconds."""
+    start = time.perf_counter()
+    data = storage.encode_for_save(image, policy.extension, policy.imwrite_params())
+    return data, (time.perf_counter() - start) * 1000.0
+
+
+def media_type_for(path) -> str:
+    suffix = str(path).rsplit(".", 1)[-1].lower()
+    for fmt, extension in EXTENSIONS.items():
+        if extension == f".{suffix}":
+            return MEDIA_TYPES[fmt]
+    return "application/octet-stream"
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+Execution backends for operation handlers.
+
+Most handlers are OpenCV calls that release the GIL and run fine on a
+thread pool. Pure-Python / scikit-image handlers (snake, GLCM, HOG, ...)
+hold the GIL, so they are declared ``executor="process"`` in the registry
+and routed to a ``ProcessPoolExecutor``. Pixel data crosses the process
+boundary through ``multiprocessing.shared_memory`` instead of pickling.
+
+Progress reported by a handler (see ``services/progress.py``) reaches the
+caller's sink directly on the thread backend; a process child writes it to
+an 8-byte slot behind the output buffer, which the parent polls. A second
+slot carries the cancellation flag the other way. Cancelled or overdue
+work is abandoned right away and stops at its next checkpoint.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import shutil
+import struct
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+import numpy as np
+
+from . import img_ops, telemetry
+from .img_ops import OperationKey
+from .services import progress, tiling
+
+PROCESS_WORKERS = max(1, int(os.getenv("AINTRA_PROCESS_WORKERS", str(os.cpu_count() or 1))))
+# "0" mematikan process pool sehingga seluruh operasi berjalan di thread (mis. untuk debugging).
+PROCESS_POOL_ENABLED = os.getenv("AINTRA_PROCESS_POOL", "1").strip().lower() not in {"0", "false", "no", "off"}
+SHM_DIR = "/dev/shm"
+# Hasil operasi selalu uint8 dengan maksimal 4 kanal, jadi buffer keluaran dialokasikan H*W*4.
+MAX_RESULT_CHANNELS = 4
+# dua float64 tepat setelah buffer keluaran: progres (0..1) dari anak, flag batal dari induk
+CONTROL_SLOT = struct.Struct("d")
+PROGRESS_OFFSET = 0
+CANCEL_OFFSET = CONTROL_SLOT.size
+CONTROL_SIZE = 2 * CONTROL_SLOT.size
+PROGRESS_POLL_SECONDS = max(0.05, progress.PROGRESS_INTERVAL)
+# seberapa cepat pembatalan/deadline disadari oleh pihak yang menunggu
+CANCEL_POLL_SECONDS = 0.1
+
+T = TypeVar("T")
+
+OperationResult = Tuple[np.ndarray, Dict[str, float]]
+
+logger = logging.getLogger("aintra.executors")
+
+
+class _SharedFlagToken(progress.CancelToken):
+    """Child-side token: the parent raises a flag in shared memory (it also enforces the deadline)."""
+
+    __slots__ = ("_buf", "_offset")
+
+    def __init__(self, buf: memoryview, offset: int) -> None:
+        super().__init__()
+        self._buf = buf
+        self._offset = offset
+
+    def check(self) -> None:
+        if CONTROL_SLOT.unpack_from(self._buf, self._offset)[0]:
+            raise progress.OperationCancelled("Dibatalkan")
+
+
+def _discard_result(future: "asyncio.Future[Any]") -> None:
+    # hasil/exception pekerjaan yang sudah ditinggalkan tidak dibutuhkan lagi
+    if not future.cancelled():
+        future.exception()
+
+
+async def wait_cancellable(
+    future: "asyncio.Future[T]",
+    token: Optional[progress.CancelToken],
+    *,
+    on_cancel: Optional[Callable[[], None]] = None,
+    on_tick: Optional[Callable[[], None]] = None,
+    probe: Optional[Callable[[], Awaitable[bool]]] = None,
+) -> T:
+    """
+    Await ``future`` while watching ``token``.
+
+    Once the token is cancelled or its deadline passes, the work is
+    abandoned: ``on_cancel`` runs and the token's error is raised without
+    waiting for the worker, which stops at its next checkpoint. ``on_tick``
+    runs on every poll; ``probe`` returning True (e.g. client disconnected)
+    cancels the token.
+    """
+    if token is None and on_tick is None:
+        return await future
+    poll = PROGRESS_POLL_SECONDS if on_tick is not None else CANCEL_POLL_SECONDS
+    try:
+        while not future.done():
+            timeout = poll
+            remaining = token.remaining() if token is not None else None
+            if remaining is not None:
+                timeout = max(0.0, min(timeout, remaining))
+            await asyncio.wait({future}, timeout=timeout)
+            if on_tick is not None:
+                on_tick()
+            if future.done() or token is None:
+                continue
+            if probe is not None and await probe():
+                token.cancel("Klien terputus")
+            if token.cancelled:
+                if on_cancel is not None:
+                    on_cancel()
+                future.add_done_callback(_discard_result)
+                token.check()
+    except asyncio.CancelledError:
+        # penunggu dibatalkan (mis. stop): pekerjaan ikut dihentikan di checkpoint berikutnya
+        if token is not None:
+            token.cancel()
+        if on_cancel is not None:
+            on_cancel()
+        future.add_done_callback(_discard_result)
+        raise
+    return future.result()
+
+
+def _init_child(tile_workers: int) -> None:
+    # tiap anak mendapat bagian CPU-nya sendiri untuk thread tile (lihat services/tiling.py)
+    tiling.limit_workers(tile_workers)
+
+
+def _run_in_child(
+    src_name: str,
+    shape: Tuple[int, ...],
+    dtype: str,
+    out_name: str,
+    out_capacity: int,
+    operation: OperationKey,
+    params: Dict[str, Any],
+    target: Optional[np.ndarray],
+) -> Tuple[Optional[Tuple[int, ...]], Optional[np.ndarray], Dict[str, float], List[telemetry.Observation]]:
+    # Segmen dibuat dan di-unlink oleh proses induk; anak (spawn) berbagi resource tracker yang sama.
+    src = SharedMemory(name=src_name)
+    out = SharedMemory(name=out_name)
+    try:
+        try:
+            image = np.ndarray(shape, dtype=np.dtype(dtype), buffer=src.buf)
+            sink = partial(CONTROL_SLOT.pack_into, out.buf, out_capacity + PROGRESS_OFFSET)
+            token = _SharedFlagToken(out.buf, out_capacity + CANCEL_OFFSET)
+            # registry telemetri anak tidak pernah di-scrape: observasi dikirim balik ke induk
+            with progress.reporting(sink, token), telemetry.capture() as observed:
+                processed, metrics = img_ops.apply_operation_with_metrics(image, operation, params, target)
+            del image
+        finally:
+            src.close()
+
+        processed = np.ascontiguousarray(processed)
+        if processed.nbytes > out_capacity:
+            return None, processed, metrics, observed
+        view = np.ndarray(processed.shape, dtype=processed.dtype, buffer=out.buf)
+        view[...] = processed
+        del view
+    finally:
+        out.close()
+    return processed.shape, None, metrics, observed
+
+
+def _apply_reporting(
+    sink: Optional[progress.Sink],
+    token: Optional[progress.CancelToken],
+    image: np.ndarray,
+    operation: OperationKey,
+    params: Dict[str, Any],
+    target: Optional[np.ndarray],
+) -> OperationResult:
+    if sink is None and token is None:
+        return img_ops.apply_operation_with_metrics(image, operation, params, target)
+    with progress.reporting(sink, token):
+        return img_ops.apply_operation_with_metrics(image, operation, params, target)
+
+
+class ProcessBackend:
+    """Run operations in worker processes, exchanging pixels through shared memory."""
+
+    def __init__(self, workers: int = PROCESS_WORKERS) -> None:
+        self._workers = max(1, int(workers))
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _ensure_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: fork setelah thread OpenCV/uvicorn berjalan rawan deadlock.
+            self._pool = telemetry.TrackedProcessPool(
+                max_workers=self._workers,
+                mp_context=get_context("spawn"),
+                initializer=_init_child,
+                initargs=(max(1, (os.cpu_count() or 1) // self._workers),),
+                pool="process",
+            )
+        return self._pool
+
+    _quota_unchecked_logged = False
+
+    @classmethod
+    def can_accept(cls, image: np.ndarray) -> bool:
+        """Check /dev/shm has room for input + output; writing past its quota raises SIGBUS."""
+        if not os.path.isdir(SHM_DIR):
+            # macOS/Windows: shared memory tidak berbentuk filesystem dan tidak punya kuota yang bisa dicek
+            if not cls._quota_unchecked_logged:
+                cls._quota_unchecked_logged = True
+                logger.info("%s tidak ada, kuota shared memory tidak diperiksa", SHM_DIR)
+            return True
+        required = image.nbytes + image.shape[0] * image.shape[1] * MAX_RESULT_CHANNELS
+        try:
+            return shutil.disk_usage(SHM_DIR).free > required
+        except OSError:
+            return False
+
+    async def run(
+        self,
+        image: np.ndarray,
+        operation: OperationKey,
+        params: Dict[str, Any],
+        target: Optional[np.ndarray] = None,
+        progress_sink: Optional[progress.Sink] = None,
+        token: Optional[progress.CancelToken] = None,
+    ) -> OperationResult:
+        image = np.ascontiguousarray(image)
+        out_capacity = image.shape[0] * image.shape[1] * MAX_RESULT_CHANNELS
+        src = SharedMemory(create=True, size=max(1, image.nbytes))
+        out = SharedMemory(create=True, size=out_capacity + CONTROL_SIZE)
+        try:
+            staged = np.ndarray(image.shape, dtype=image.dtype, buffer=src.buf)
+            staged[...] = image
+            del staged
+            CONTROL_SLOT.pack_into(out.buf, out_capacity + PROGRESS_OFFSET, 0.0)
+            CONTROL_SLOT.pack_into(out.buf, out_capacity + CANCEL_OFFSET, 0.0)
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self._ensure_pool(),
+                _run_in_child,
+                src.name,
+                image.shape,
+                image.dtype.str,
+                out.name,
+                out_capacity,
+                operation,
+                params,
+                target,
+            )
+
+            def forward_progress() -> None:
+                progress_sink(CONTROL_SLOT.unpack_from(out.buf, out_capacity + PROGRESS_OFFSET)[0])
+
+            def raise_cancel_flag() -> None:
+                # segmen di-unlink di bawah, tetapi mapping anak tetap hidup sampai ia selesai
+                CONTROL_SLOT.pack_into(out.buf, out_capacity + CANCEL_OFFSET, 1.0)
+
+            shape, inline, metrics, observed = await wait_cancellable(
+                future,
+                token,
+                on_cancel=raise_cancel_flag,
+                on_tick=forward_progress if progress_sink is not None else None,
+            )
+            telemetry.replay(observed)
+            if inline is not None:
+                return inline, metrics
+            view = np.ndarray(shape, dtype=np.uint8, buffer=out.buf)
+            # hasil besar disalin ke memmap, bukan ke RAM (ambang yang sama dengan keluaran tiling)
+            result = tiling.allocate_output(shape, np.uint8)
+            result[...] = view
+            del view
+            return result, metrics
+        finally:
+            for shm in (src, out):
+                shm.close()
+                shm.unlink()
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+class OperationRunner:
+    """Dispatch each operation to the backend declared for it in the registry."""
+
+    def __init__(self, threads: Optional[Executor] = None, process: Optional[ProcessBackend] = None) -> None:
+        self.threads = threads
+        self.process = process if process is not None else (ProcessBackend() if PROCESS_POOL_ENABLED else None)
+
+    def backend_for(self, operation: OperationKey, image: np.ndarray) -> str:
+        if self.process is None or img_ops.executor_for(operation) != "process":
+            return "thread"
+        if not self.process.can_accept(image):
+            logger.warning("shared memory penuh, operasi %s dijalankan di thread", img_ops.operation_name(operation))
+            return "thread"
+        return "process"
+
+    async def run(
+        self,
+        image: np.ndarray,
+        operation: OperationKey,
+        params: Dict[str, Any],
+        target: Optional[np.ndarray] = None,
+        progress_sink: Optional[progress.Sink] = None,
+        token: Optional[progress.CancelToken] = None,
+    ) -> OperationResult:
+        """
+        Run one operation; ``progress_sink`` receives the handler's 0..1
+        reports (from any thread) and ``token`` cancels it cooperatively.
+        """
+        process = self.process
+        if process is not None and self.backend_for(operation, image) == "process":
+            return await process.run(image, operation, params, target, progress_sink, token)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self.threads,
+            _apply_reporting,
+            progress_sink,
+            token,
+            image,
+            operation,
+            params,
+            target,
+        )
+        return await wait_cancellable(future, token)
+
+    def shutdown(self) -> None:
+        if self.process is not None:
+            self.process.shutdown()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Per-channel and luminance histograms: computation, summary statistics and
+raster rendering.
+
+Histograms are computed once from an array that is already in memory (a
+job result before it is encoded, an upload the first time it is decoded)
+and persisted next to the image by :func:`storage.store_histogram`, so the
+histogram endpoints never re-decode the image. Counts are stored as a
+``(channels + 1, 256)`` int64 array: the colour channels in OpenCV order
+followed by the luminance row.
+"""
+from __future__ import annotations
+
+from typing import Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+BINS = 256
+# calcHist menghitung dengan float32: eksak hanya sampai 2^24 piksel per bin
+_CALC_HIST_MAX_PIXELS = 1 << 24
+BAR_COLOR = (15, 23, 42)
+OVERLAY_COLORS = [(38, 38, 220), (74, 163, 22), (235, 99, 37)]
+COLOR_CHANNELS = ("b", "g", "r")
+LUMINANCE = "luminance"
+
+
+def _channel_histogram(plane: np.ndarray) -> np.ndarray:
+    if plane.size < _CALC_HIST_MAX_PIXELS:
+        return cv2.calcHist([plane], [0], None, [BINS], [0, BINS]).reshape(BINS).astype(np.int64)
+    return np.bincount(plane.ravel(), minlength=BINS).astype(np.int64)
+
+
+def compute(image: np.ndarray) -> np.ndarray:
+    """Histogram rows for every colour channel (alpha excluded) plus luminance."""
+    if image.dtype != np.uint8:
+        image = np.clip(image, 0, 255).astype(np.uint8)
+    if image.ndim == 2:
+        row = _channel_histogram(image)
+        return np.stack([row, row])
+    rgb = image[:, :, :3]
+    gray = cv2.cvtColor(rgb, cv2.COLOR_BGR2GRAY)
+    rows = [_channel_histogram(plane) for plane in cv2.split(rgb)]
+    rows.append(_channel_histogram(gray))
+    return np.stack(rows)
+
+
+def channel_names(counts: np.ndarray) -> Tuple[str, ...]:
+    colour = ("gray",) if counts.shape[0] == 2 else COLOR_CHANNELS
+    return colour + (LUMINANCE,)
+
+
+def _row_stats(row: np.ndarray) -> Dict[str, float]:
+    total = int(row.sum())
+    if total == 0:
+        return {"mean": 0.0, "std": 0.0, "min": 0.0, "max": 0.0, "median": 0.0}
+    values = np.arange(BINS, dtype=np.float64)
+    mean = float(np.dot(values, row) / total)
+    variance = float(np.dot((values - mean) ** 2, row) / total)
+    present = np.flatnonzero(row)
+    median = int(np.searchsorted(np.cumsum(row), (total + 1) // 2))
+    return {
+        "mean": mean,
+        "std": variance**0.5,
+        "min": float(present[0]),
+        "max": float(present[-1]),
+        "median": float(median),
+    }
+
+
+def stats(counts: np.ndarray) -> Dict[str, Dict[str, float]]:
+    """Mean/std/min/max/median per channel, derived from the counts without touching pixels."""
+    return {name: _row_stats(row) for name, row in zip(channel_names(counts), counts)}
+
+
+def to_payload(counts: np.ndarray) -> Dict[str, object]:
+    names = channel_names(counts)
+    bins: List[List[int]] = counts.tolist()
+    return {"channels": list(names), "bins": bins, "pixels": int(counts[-1].sum()), "stats": stats(counts)}
+
+
+def _scaled(row: np.ndarray, height: int) -> np.ndarray:
+    max_val = max(float(row.max()) if row.size else 1.0, 1e-6)
+    return ((row.astype(np.float64) / max_val) * (height - 10)).astype(np.int64)
+
+
+def render(counts: np.ndarray, mode: str = "rgb", width: int = 256, height: int = 120) -> np.ndarray:
+    """Render the histogram as a BGR image: luminance bars, or an RGB line overlay."""
+    canvas = np.full((height, width, 3), 255, dtype=np.uint8)
+    if counts.shape[0] == 2 or mode == "luminance":
+        bars = _scaled(counts[-1], height)[: min(width, BINS)]
+        # satu mask (tinggi x 256) menggantikan 256 panggilan cv2.line
+        mask = np.arange(height)[:, None] >= (height - bars)[None, :]
+        canvas[:, : bars.size][mask] = BAR_COLOR
+        return canvas
+    xs = np.arange(BINS, dtype=np.int32)
+    for row, color in zip(counts[:3], OVERLAY_COLORS):
+        points = np.stack([xs, height - _scaled(row, height).astype(np.int32)], axis=1)
+        cv2.polylines(canvas, [points], False, color, 1)
+    return canvas
+
+
+__all__ = ["BINS", "channel_names", "compute", "render", "stats", "to_payload"]
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+In-process cache of decoded uploads keyed by ``(image_id, pyramid level)``.
+
+Slider tweaks re-request previews of the same upload many times a second;
+without this every request re-reads the JSON sidecar and re-decodes the
+PNG/JPEG. Previews read the smallest pyramid level (built on the first
+preview, see ``storage.ensure_pyramid``) instead of the original. Cached
+arrays are marked read-only so a handler that tries to modify its input in
+place fails loudly instead of corrupting the cache.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+import numpy as np
+
+from . import img_ops, storage
+
+IMAGE_CACHE_BYTES = int(float(os.getenv("AINTRA_IMAGE_CACHE_MB", "256")) * 1024 * 1024)
+
+CachedUpload = Tuple[storage.StoredImage, np.ndarray]
+# level 0 = citra asli
+CacheKey = Tuple[str, int]
+ORIGINAL_LEVEL = 0
+
+
+class DecodedImageCache:
+    def __init__(self, max_bytes: int = IMAGE_CACHE_BYTES) -> None:
+        self.max_bytes = max(0, max_bytes)
+        self._entries: "OrderedDict[CacheKey, CachedUpload]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        # indeks image_id -> metadata dan level yang ter-cache, supaya get_upload tidak memindai semua entri
+        self._stored: Dict[str, storage.StoredImage] = {}
+        self._levels: Dict[str, Set[int]] = {}
+        # satu lock per image_id selama piramida dibangun (preview pertama yang bersamaan)
+        self._building: Dict[str, threading.Lock] = {}
+
+    def load(self, image_id: str) -> CachedUpload:
+        """Return ``(StoredImage, decoded original)``; raises like get_upload / load_image."""
+        return self._load(image_id, ORIGINAL_LEVEL)
+
+    def load_preview(self, image_id: str, width: int) -> CachedUpload:
+        """Return the smallest pyramid level at least ``width`` wide (the original if none is)."""
+        stored = self.get_upload(image_id)
+        if stored.pyramid is None:
+            stored = self._build_pyramid(image_id)
+        level = storage.select_pyramid_level(stored, width)
+        if level is None:
+            return self._load(image_id, ORIGINAL_LEVEL)
+        try:
+            return self._load(image_id, level)
+        except ValueError:
+            # file level hilang/rusak: kembali ke citra asli
+            return self._load(image_id, ORIGINAL_LEVEL)
+
+    def get_upload(self, image_id: str) -> storage.StoredImage:
+        """Metadata only: served from the cache when decoded, otherwise read from the sidecar."""
+        with self._lock:
+            stored = self._find_stored(image_id)
+        if stored is not None:
+            return stored
+        return storage.get_upload(image_id)
+
+    def invalidate(self, image_id: str) -> None:
+        with self._lock:
+            for level in list(self._levels.get(image_id, ())):
+                self._remove((image_id, level))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._stored.clear()
+            self._levels.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size, "max_bytes": self.max_bytes}
+
+    def _load(self, image_id: str, level: int) -> CachedUpload:
+        key = (image_id, level)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+            stored = self._find_stored(image_id)
+        if stored is None:
+            stored = storage.get_upload(image_id)
+        path = stored.path if level == ORIGINAL_LEVEL else storage.pyramid_path(image_id, level)
+        image = img_ops.load_image(path)
+        image.setflags(write=False)
+        entry = (stored, image)
+        with self._lock:
+            self._insert(key, entry)
+        return entry
+
+    def _build_pyramid(self, image_id: str) -> storage.StoredImage:
+        with self._lock:
+            guard = self._building.setdefault(image_id, threading.Lock())
+        with guard:
+            # permintaan yang menunggu melihat piramida yang sudah dibangun oleh yang pertama
+            stored = self.get_upload(image_id)
+            if stored.pyramid is None:
+                # preview pertama: decode asli sekali, lalu bangun piramida untuk permintaan berikutnya
+                stored, image = self._load(image_id, ORIGINAL_LEVEL)
+                if stored.pyramid is None:
+                    stored = storage.ensure_pyramid(stored, image)
+                    self._replace_stored(image_id, stored)
+                    # citra asli sudah ter-decode: histogram sekalian, endpoint histogram tidak perlu decode lagi
+                    storage.store_histogram(storage.UPLOAD_DIR, image_id, image)
+            with self._lock:
+                if self._building.get(image_id) is guard:
+                    del self._building[image_id]
+        return stored
+
+    def _replace_stored(self, image_id: str, stored: storage.StoredImage) -> None:
+        with self._lock:
+            levels = self._levels.get(image_id)
+            if not levels:
+                return
+            self._stored[image_id] = stored
+            for level in levels:
+                key = (image_id, level)
+                self._entries[key] = (stored, self._entries[key][1])
+
+    def _find_stored(self, image_id: str) -> Optional[storage.StoredImage]:
+        return self._stored.get(image_id)
+
+    def _insert(self, key: CacheKey, entry: CachedUpload) -> None:
+        size = entry[1].nbytes
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        image_id, level = key
+        self._entries[key] = entry
+        self._stored[image_id] = entry[0]
+        self._levels.setdefault(image_id, set()).add(level)
+        self._size += size
+        while self._size > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._size -= entry[1].nbytes
+        image_id, level = key
+        levels = self._levels[image_id]
+        levels.discard(level)
+        if not levels:
+            del self._levels[image_id]
+            del self._stored[image_id]
+
+
+image_cache = DecodedImageCache()
+storage.add_upload_expiry_listener(image_cache.invalidate)
@@ -1,49 +1,38 @@
-<<<<<<< HEAD
-from __future__ import annotations
-
-from app.services.image_ops import (
-    apply_operation,
-    canonical_operation_id,
-    compute_metrics,
-    decode_image,
-    encode_png,
-    encode_png_b64,
-    generate_preview,
-    get_operation_defaults,
-    list_operations,
-    load_image,
-    prepare_operation_params,
-)
-
-__all__ = [
-    "apply_operation",
-    "compute_metrics",
-    "decode_image",
-    "encode_png",
-    "encode_png_b64",
-    "generate_preview",
-    "get_operation_defaults",
-    "list_operations",
-    "load_image",
-    "canonical_operation_id",
-    "prepare_operation_params",
-]
-=======
 from __future__ import annotations
 
 import math
 import threading
+import time
+from itertools import groupby
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 import cv2
 import numpy as np
+from scipy.interpolate import RectBivariateSpline
 from skimage import exposure
-from skimage.segmentation import active_contour
+from skimage.filters import sobel
 from skimage.feature import graycomatrix, graycoprops, hog, local_binary_pattern
-from skimage.metrics import peak_signal_noise_ratio, structural_similarity
 
+from . import histograms, telemetry
 from .schemas import OperationEnum
+from .services import image_ops as registry_ops
+from .services import metrics as quality_metrics
+from .services import point_ops, progress, tiling
+from .services.image_ops import (
+    REGISTRY_ETAG,
+    REGISTRY_PAYLOAD,
+    canonical_operation_id,
+    decode_image,
+    encode_png,
+    encode_png_b64,
+    get_operation_defaults,
+    list_operations,
+    prepare_operation_params,
+)
+
+OperationKey = Union[OperationEnum, str]
+ResolvedStep = Tuple[OperationKey, Dict[str, Any]]
 
 
 _metrics_local = threading.local()
@@ -159,6 +148,9 @@ def log_operation(
     params: Dict,
     target: Optional[np.ndarray] = None,
 ) -> np.ndarray:
+    if image.dtype == np.uint8:
+        # tabel dari min/max histogram, tanpa salinan float32 seukuran citra
+        return point_ops.apply_point_ops(image, [(LEGACY_POINT_OPS[OperationEnum.LOG], params)])
     gain = float(params.get("gain", 1.0))
     base = str(params.get("base", "e"))
     rgb, alpha = split_alpha(image)
@@ -178,13 +170,8 @@ def gamma_operation(
     params: Dict,
     target: Optional[np.ndarray] = None,
 ) -> np.ndarray:
-    gamma = max(0.01, float(params.get("gamma", 1.0)))
-    gain = float(params.get("gain", 1.0))
-    rgb, alpha = split_alpha(image)
-    inv_gamma = 1.0 / gamma
-    table = np.array([(gain * ((i / 255.0) ** inv_gamma) * 255) for i in range(256)]).clip(0, 255).astype("uint8")
-    corrected = cv2.LUT(rgb, table)
-    return merge_alpha(corrected, alpha)
+    # tabel di-cache per parameter (services/point_ops.py), satu cv2.LUT per panggilan
+    return point_ops.apply_point_ops(image, [(LEGACY_POINT_OPS[OperationEnum.GAMMA], params)])
 
 
 def histogram_operation(
@@ -505,6 +492,60 @@ def _render_snake_output(img_bgr, mask, pts, mode: str = "overlay"):
     return np.where(mask[..., None] == 255, cv2.addWeighted(img_bgr, 0.6, color, 0.4, 0), img_bgr)
 
 
+def _active_contour(image, snake, alpha, beta, gamma, max_num_iter, max_px_move=1.0, convergence=0.1):
+    """
+    ``skimage.segmentation.active_contour`` for a grayscale float image with a
+    periodic boundary (edge energy only), with a progress report per iteration.
+
+    The steps mirror scikit-image 0.24 line by line so results are identical;
+    re-check them against ``skimage.segmentation.active_contour`` when the
+    ``scikit-image`` pin in requirements.txt moves.
+    """
+    convergence_order = 10
+    float_dtype = image.dtype
+    # energi tepi (w_line=0, w_edge=1) diinterpolasi spline kuadratik
+    intp = RectBivariateSpline(np.arange(image.shape[1]), np.arange(image.shape[0]), sobel(image).T, kx=2, ky=2, s=0)
+
+    snake_xy = snake[:, ::-1]
+    x = snake_xy[:, 0].astype(float_dtype)
+    y = snake_xy[:, 1].astype(float_dtype)
+    n = len(x)
+    xsave = np.empty((convergence_order, n), dtype=float_dtype)
+    ysave = np.empty((convergence_order, n), dtype=float_dtype)
+
+    eye_n = np.eye(n, dtype=float)
+    a = np.roll(eye_n, -1, axis=0) + np.roll(eye_n, -1, axis=1) - 2 * eye_n
+    b = (
+        np.roll(eye_n, -2, axis=0)
+        + np.roll(eye_n, -2, axis=1)
+        - 4 * np.roll(eye_n, -1, axis=0)
+        - 4 * np.roll(eye_n, -1, axis=1)
+        + 6 * eye_n
+    )
+    A = -alpha * a + beta * b
+    inv = np.linalg.inv(A + gamma * eye_n).astype(float_dtype, copy=False)
+
+    for i in range(max_num_iter):
+        fx = intp(x, y, dx=1, grid=False).astype(float_dtype, copy=False)
+        fy = intp(x, y, dy=1, grid=False).astype(float_dtype, copy=False)
+        xn = inv @ (gamma * x + fx)
+        yn = inv @ (gamma * y + fy)
+        x += max_px_move * np.tanh(xn - x)
+        y += max_px_move * np.tanh(yn - y)
+        progress.report(i + 1, max_num_iter)
+
+        j = i % (convergence_order + 1)
+        if j < convergence_order:
+            xsave[j, :] = x
+            ysave[j, :] = y
+        else:
+            dist = np.min(np.max(np.abs(xsave - x[None, :]) + np.abs(ysave - y[None, :]), 1))
+            if dist < convergence:
+                break
+
+    return np.stack([y, x], axis=1)
+
+
 # ---------- operasi utama ----------
 def active_contour_operation(img_bgr, params, target=None):
     import numpy as np
@@ -523,14 +564,7 @@ def active_contour_operation(img_bgr, params, target=None):
     gamma = float(params.get("gamma", 0.01))
     max_iter = int(params.get("max_iter", 250))
 
-    snake = active_contour(
-        image=I,
-        snake=snake0,
-        alpha=alpha,
-        beta=beta,
-        gamma=gamma,
-        max_num_iter=max_iter,
-    )
+    snake = _active_contour(I, snake0, alpha=alpha, beta=beta, gamma=gamma, max_num_iter=max_iter)
 
     mask, pts = _snake_to_mask((h, w), snake)
     mode = str(params.get("output", "overlay"))  # mask | overlay | contour
@@ -591,7 +625,14 @@ def kmeans_color_operation(image, params, target=None):
     output = str(params.get("output", "seg"))
     Z = image.reshape(-1, 3).astype(np.float32)
     criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, max_iter, 1.0)
-    _ret, labels, centers = cv2.kmeans(Z, K, None, criteria, attempts, cv2.KMEANS_PP_CENTERS)
+    # satu percobaan per panggilan (RNG OpenCV berlanjut, hasil sama dengan attempts=N) agar progres terlapor
+    best = None
+    for attempt in range(max(1, attempts)):
+        trial = cv2.kmeans(Z, K, None, criteria, 1, cv2.KMEANS_PP_CENTERS)
+        if best is None or trial[0] < best[0]:
+            best = trial
+        progress.report(attempt + 1, attempts)
+    _ret, labels, centers = best
     centers = centers.astype(np.uint8)
     seg = centers[labels.flatten()].reshape(image.shape)
 
@@ -814,16 +855,8 @@ def _features_color_hist(rgb: np.ndarray) -> np.ndarray:
         if hist.max() > 0:
             hist = hist / hist.max()
         scaled = (hist * (hist_height - 10)).astype(np.int32)
-        for x in range(1, 256):
-            x0 = int((x - 1) * w / 256)
-            x1 = int(x * w / 256)
-            cv2.line(
-                canvas,
-                (x0, hist_height - 2 - scaled[x - 1]),
-                (x1, hist_height - 2 - scaled[x]),
-                color,
-                1,
-            )
+        xs = (np.arange(256) * w / 256).astype(np.int32)
+        cv2.polylines(canvas, [np.stack([xs, hist_height - 2 - scaled], axis=1)], False, color, 1)
     push_operation_metrics(
         {
             "color_hist_sum_b": channel_sums[0],
@@ -925,10 +958,98 @@ OPERATION_MAP = {
     ),
 }
 
+# Handler legacy yang berat dan memegang GIL dikirim ke process pool (lihat app.executors).
+OPERATION_EXECUTORS: Dict[OperationEnum, str] = {
+    OperationEnum.ACTIVE_CONTOUR: "process",
+    OperationEnum.KMEANS_COLOR: "process",
+    OperationEnum.FEATURES: "process",
+}
+
+# Handler legacy yang berupa operasi titik -> id tabelnya di services/point_ops.py (parameternya mentah,
+# jadi gamma legacy memakai tabel tersendiri yang mengenal "gain").
+LEGACY_POINT_OPS: Dict[OperationEnum, str] = {
+    OperationEnum.LOG: "log",
+    OperationEnum.GAMMA: "legacy_gamma",
+}
+
+
+def operation_name(operation: OperationKey) -> str:
+    """Return the plain string id used for file names and API responses."""
+    if isinstance(operation, OperationEnum):
+        return operation.value
+    return str(operation)
+
+
+def resolve_operation(operation: OperationKey, params: Optional[Dict[str, Any]]) -> Tuple[OperationKey, Dict[str, Any]]:
+    """
+    Map a requested operation onto its executor.
+
+    Operations known to the registry are returned as their canonical id with
+    params validated against the schema; operations only implemented by the
+    legacy handlers (histogram-match, active_contour, ...) keep their enum and
+    raw params.
+    """
+    canonical = canonical_operation_id(operation)
+    if canonical in registry_ops.CANONICAL_OPERATIONS:
+        return canonical, prepare_operation_params(canonical, params)
+    try:
+        legacy = OperationEnum(canonical)
+    except ValueError as exc:
+        raise ValueError(f"Operasi {operation} tidak didukung") from exc
+    if legacy not in OPERATION_MAP:
+        raise ValueError(f"Operasi {operation} tidak didukung")
+    return legacy, dict(params or {})
+
+
+def resolve_pipeline(steps: Sequence[Tuple[OperationKey, Optional[Dict[str, Any]]]]) -> List[ResolvedStep]:
+    """Validate every step up front so a bad param fails the request before any pixel work."""
+    if not steps:
+        raise ValueError("Pipeline minimal berisi satu langkah")
+    resolved: List[ResolvedStep] = []
+    for index, (operation, params) in enumerate(steps, 1):
+        try:
+            resolved.append(resolve_operation(operation, params))
+        except ValueError as exc:
+            raise ValueError(f"Langkah {index}: {exc}") from exc
+    return resolved
+
+
+def pipeline_name(steps: Sequence[ResolvedStep]) -> str:
+    return "+".join(operation_name(operation) for operation, _ in steps)
+
+
+def _resolve_handler(operation: OperationKey):
+    if isinstance(operation, OperationEnum) and operation in OPERATION_MAP:
+        return OPERATION_MAP[operation]
+    canonical = canonical_operation_id(operation)
+    if canonical in registry_ops.CANONICAL_OPERATIONS:
+        # citra besar + operasi ketetanggaan: diproses per tile (lihat services/tiling.py)
+        return lambda image, params, target=None: tiling.apply_operation(image, canonical, params)
+    try:
+        handler = OPERATION_MAP.get(OperationEnum(canonical))
+    except ValueError:
+        handler = None
+    if handler is None:
+        raise ValueError(f"Operasi {operation} tidak didukung")
+    return handler
+
+
+def executor_for(operation: OperationKey) -> str:
+    """Return the execution backend (``"thread"`` or ``"process"``) configured for an operation."""
+    if isinstance(operation, OperationEnum) and operation in OPERATION_MAP:
+        return OPERATION_EXECUTORS.get(operation, "thread")
+    canonical = canonical_operation_id(operation)
+    if canonical in registry_ops.CANONICAL_OPERATIONS:
+        return registry_ops.get_operation_executor(canonical)
+    try:
+        return OPERATION_EXECUTORS.get(OperationEnum(canonical), "thread")
+    except ValueError:
+        return "thread"
+
 
 def apply_operation(
     image: np.ndarray,
-    operation: OperationEnum,
+    operation: OperationKey,
     params: Dict,
     target: Optional[np.ndarray] = None,
 ) -> np.ndarray:
@@ -938,92 +1059,123 @@ def apply_operation(
 
 def apply_operation_with_metrics(
     image: np.ndarray,
-    operation: OperationEnum,
+    operation: OperationKey,
     params: Dict,
     target: Optional[np.ndarray] = None,
 ) -> tuple[np.ndarray, Dict[str, float]]:
-    handler = OPERATION_MAP.get(operation)
-    if handler is None:
-        raise ValueError(f"Operasi {operation} tidak didukung")
+    handler = _resolve_handler(operation)
     _reset_operation_metrics()
+    start = time.perf_counter()
     try:
         result = handler(image, params, target)
     except TypeError:
         result = handler(image, params)
-    processed = to_uint8(result)
+    # keluaran uint8 (mis. memmap dari tiling) dikembalikan apa adanya: clip+astype akan menyalinnya ke RAM
+    processed = result if result.dtype == np.uint8 else to_uint8(result)
+    telemetry.OPERATION_SECONDS.observe(
+        time.perf_counter() - start, operation_name(operation), telemetry.size_class(image)
+    )
     metrics = consume_operation_metrics()
     return processed, metrics
 
 
+# label operasi di aintra_operation_seconds untuk titik-operasi yang difusikan menjadi satu LUT
+FUSED_POINT_OPS_LABEL = "point_ops_fused"
+
+
+def apply_pipeline_with_metrics(
+    image: np.ndarray,
+    steps: Sequence[ResolvedStep],
+    target: Optional[np.ndarray] = None,
+) -> tuple[np.ndarray, Dict[str, float]]:
+    """Run resolved steps in order on one in-memory array; later step metrics override earlier keys.
+
+    Consecutive point operations (negative, gamma, log, thresh_global,
+    contrast_stretch, and the legacy log/gamma handlers) are compiled into
+    one lookup table and applied in a single pass, see ``services/point_ops.py``.
+    """
+    current = image
+    merged: Dict[str, float] = {}
+    index = 0
+    for fusable, group in groupby(steps, key=is_point_step):
+        run = list(group)
+        if fusable and len(run) > 1 and current.dtype == np.uint8:
+            current = apply_point_run(current, run)
+            index += len(run)
+            progress.report(index, len(steps))
+            continue
+        for operation, params in run:
+            with progress.stage(index, len(steps)):
+                current, metrics = apply_operation_with_metrics(current, operation, params, target=target)
+            merged.update(metrics)
+            index += 1
+    return current, merged
+
+
+def _point_step(step: ResolvedStep) -> Optional[point_ops.PointStep]:
+    operation, params = step
+    if isinstance(operation, OperationEnum):
+        # OperationEnum adalah str: jangan sampai dicocokkan langsung ke tabel versi registry
+        name = LEGACY_POINT_OPS.get(operation)
+        return (name, params) if name is not None else None
+    return (operation, params) if point_ops.is_point_op(operation, params) else None
+
+
+def is_point_step(step: ResolvedStep) -> bool:
+    return _point_step(step) is not None
+
+
+def apply_point_run(image: np.ndarray, steps: Sequence[ResolvedStep]) -> np.ndarray:
+    """Apply consecutive point steps of a uint8 image as one composed LUT."""
+    start = time.perf_counter()
+    size_mp = telemetry.size_class(image)
+    result = point_ops.apply_point_ops(image, [_point_step(step) for step in steps])
+    # satu label tetap untuk seluruh run terfusi: kombinasi operasi tidak menambah seri
+    telemetry.OPERATION_SECONDS.observe(time.perf_counter() - start, FUSED_POINT_OPS_LABEL, size_mp)
+    return result
+
+
 def generate_preview(
     image: np.ndarray,
-    operation: OperationEnum,
+    operation: OperationKey,
     params: Dict,
     max_width: int = 640,
     target: Optional[np.ndarray] = None,
 ) -> tuple[np.ndarray, Dict[str, float]]:
+    image = _downscale_for_preview(image, max_width)
+    processed, metrics = apply_operation_with_metrics(image, operation, params, target=target)
+    return processed, metrics
+
+
+def generate_pipeline_preview(
+    image: np.ndarray,
+    steps: Sequence[ResolvedStep],
+    max_width: int = 640,
+    target: Optional[np.ndarray] = None,
+) -> tuple[np.ndarray, Dict[str, float]]:
+    image = _downscale_for_preview(image, max_width)
+    return apply_pipeline_with_metrics(image, steps, target=target)
+
+
+def _downscale_for_preview(image: np.ndarray, max_width: int) -> np.ndarray:
     h, w = image.shape[:2]
     if w > max_width:
         ratio = max_width / float(w)
         image = cv2.resize(image, (int(w * ratio), int(h * ratio)), interpolation=cv2.INTER_AREA)
-    processed, metrics = apply_operation_with_metrics(image, operation, params, target=target)
-    return processed, metrics
+    return image
 
 
-def compute_metrics(original: np.ndarray, processed: np.ndarray) -> Dict[str, float]:
-    try:
-        original_gray = as_gray(original)
-        processed_gray = as_gray(processed)
-        ssim = structural_similarity(original_gray, processed_gray, data_range=255)
-        psnr = peak_signal_noise_ratio(original_gray, processed_gray, data_range=255)
-        return {"ssim": float(ssim), "psnr": float(psnr)}
-    except Exception:
-        return {}
+def compute_metrics(
+    original: np.ndarray,
+    processed: np.ndarray,
+    selection: quality_metrics.MetricsPolicy = quality_metrics.DEFAULT_POLICY,
+) -> Dict[str, float]:
+    """Quality metrics chosen by ``selection`` (see :mod:`app.services.metrics`)."""
+    return quality_metrics.compute(original, processed, selection)
 
 
 def render_histogram_image(image: np.ndarray, mode: str = "rgb", width: int = 256, height: int = 120) -> np.ndarray:
     """Render histogram as a small PNG-ready BGR image (rgb or luminance)."""
-    import cv2  # local import ensures availability at runtime
-
-    canvas = np.full((height, width, 3), 255, dtype=np.uint8)
     if image is None or image.size == 0:
-        return canvas
-
-    rgb, _ = split_alpha(image)
-    if rgb.ndim == 2:
-        gray = rgb
-        hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).flatten()
-        max_val = float(hist.max()) if hist.size else 1.0
-        max_val = max(max_val, 1e-6)
-        for x in range(256):
-            v = int((hist[x] / max_val) * (height - 10))
-            cv2.line(canvas, (x, height), (x, height - v), (15, 23, 42), 1)
-        return canvas
-
-    if mode == "luminance":
-        gray = as_gray(rgb)
-        hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).flatten()
-        max_val = float(hist.max()) if hist.size else 1.0
-        max_val = max(max_val, 1e-6)
-        for x in range(256):
-            v = int((hist[x] / max_val) * (height - 10))
-            cv2.line(canvas, (x, height), (x, height - v), (15, 23, 42), 1)
-        return canvas
-
-    # RGB overlay
-    channels = cv2.split(rgb)
-    colors = [(38, 38, 220), (74, 163, 22), (235, 99, 37)]  # BGR for red, green, blue strokes
-    for ch, color in zip(channels, colors):
-        hist = cv2.calcHist([ch], [0], None, [256], [0, 256]).flatten()
-        max_val = float(hist.max()) if hist.size else 1.0
-        max_val = max(max_val, 1e-6)
-        prev = None
-        for x in range(256):
-            v = int((hist[x] / max_val) * (height - 10))
-            pt = (x, height - v)
-            if prev is not None:
-                cv2.line(canvas, prev, pt, color, 1)
-            prev = pt
-    return canvas
-
->>>>>>> ee3fa41 (chore: update README and UI)
+        return np.full((height, width, 3), 255, dtype=np.uint8)
+    return histograms.render(histograms.compute(image), mode, width, height)
@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+"""
+Durable SQLite (WAL) journal of job submissions and state transitions.
+
+Writes are queued and committed by one writer thread. Each commit takes
+every write that piled up while the previous fsync ran (group commit), so a
+single ``synchronous=FULL`` fsync covers many transitions under load.
+Submissions wait for their commit before the API acknowledges them; state
+updates do not. :class:`app.job_manager.JobManager` replays the journal on
+start: finished jobs get their status back and unfinished ones are queued
+again.
+
+With ``AINTRA_JOB_MODE=shared`` the same tables are the queue and status
+store shared by several API and worker processes: workers claim queued rows
+under a renewable lease (:meth:`JobJournal.claim`), and triggers append
+every status change to ``changes`` so each process can push updates to its
+own subscribers (:meth:`JobJournal.changes`).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("aintra.journal")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    batch_id TEXT,
+    spec TEXT NOT NULL,
+    status TEXT NOT NULL,
+    state TEXT NOT NULL,
+    submitted_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS batches (
+    batch_id TEXT PRIMARY KEY,
+    spec TEXT NOT NULL,
+    submitted_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL
+);
+"""
+
+# kolom antrian bersama; ditambahkan ke jurnal yang dibuat versi sebelumnya
+QUEUE_COLUMNS = (
+    ("priority", "priority INTEGER NOT NULL DEFAULT 0"),
+    ("claimed_by", "claimed_by TEXT"),
+    ("lease_until", "lease_until REAL"),
+)
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_jobs_batch_id ON jobs (batch_id);
+CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, priority, submitted_at);
+CREATE TRIGGER IF NOT EXISTS jobs_inserted AFTER INSERT ON jobs BEGIN
+    INSERT INTO changes (job_id) VALUES (NEW.job_id);
+END;
+CREATE TRIGGER IF NOT EXISTS jobs_changed AFTER UPDATE OF status, state ON jobs BEGIN
+    INSERT INTO changes (job_id) VALUES (NEW.job_id);
+END;
+"""
+# baris feed perubahan yang disimpan; follower membaca tiap ratusan milidetik
+CHANGES_KEPT = 10_000
+
+_JOB_COLUMNS = "job_id, batch_id, spec, status, state, submitted_at, finished_at, priority"
+
+_Statement = Tuple[str, Tuple[Any, ...]]
+
+
+@dataclass(slots=True)
+class JournalJob:
+    job_id: str
+    batch_id: Optional[str]
+    spec: Dict[str, Any]
+    status: str
+    state: Dict[str, Any]
+    submitted_at: float
+    finished_at: Optional[float]
+    # urutan antrian (PRIORITY_ORDER): kecil diambil lebih dulu
+    priority: int = 0
+
+
+@dataclass(slots=True)
+class JournalBatch:
+    batch_id: str
+    spec: Dict[str, Any]
+    submitted_at: float
+
+
+def _dumps(value: Dict[str, Any]) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _job_insert(job: JournalJob) -> _Statement:
+    return (
+        f"INSERT OR REPLACE INTO jobs ({_JOB_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            job.job_id,
+            job.batch_id,
+            _dumps(job.spec),
+            job.status,
+            _dumps(job.state),
+            job.submitted_at,
+            job.finished_at,
+            job.priority,
+        ),
+    )
+
+
+def _job_from_row(row: Sequence[Any]) -> JournalJob:
+    job_id, batch_id, spec, status, state, submitted_at, finished_at, priority = row
+    return JournalJob(job_id, batch_id, json.loads(spec), status, json.loads(state), submitted_at, finished_at, priority)
+
+
+class JobJournal:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._open()) as conn:
+            conn.executescript(SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for name, definition in QUEUE_COLUMNS:
+                if name not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {definition}")
+            conn.executescript(INDEXES)
+        self._local = threading.local()
+        # seluruh koneksi per thread yang pernah dibuka, supaya close() bisa menutup semuanya
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._pending: "queue.SimpleQueue[Optional[Tuple[List[_Statement], Future[None]]]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        # tiap koneksi tetap dipakai satu thread saja; check_same_thread=False hanya agar close() boleh menutupnya
+        conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # FULL: setiap commit di-fsync; biayanya dibagi oleh seluruh tulisan dalam satu grup
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+
+    def _connection(self) -> sqlite3.Connection:
+        # koneksi per thread untuk baca & klaim langsung (di luar writer thread)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._open()
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _write(self, statements: List[_Statement]) -> "Future[None]":
+        future: "Future[None]" = Future()
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._write_loop, name="aintra-journal", daemon=True)
+                self._thread.start()
+            self._pending.put((statements, future))
+        return future
+
+    def _write_loop(self) -> None:
+        conn = self._open()
+        try:
+            while True:
+                items = [self._pending.get()]
+                while True:
+                    try:
+                        items.append(self._pending.get_nowait())
+                    except queue.Empty:
+                        break
+                writes = [item for item in items if item is not None]
+                error: Optional[BaseException] = None
+                if writes:
+                    try:
+                        conn.execute("BEGIN")
+                        for statements, _ in writes:
+                            for sql, params in statements:
+                                conn.execute(sql, params)
+                        conn.execute("COMMIT")
+                    except sqlite3.Error as exc:
+                        error = exc
+                        logger.warning("gagal menulis jurnal job: %s", exc)
+                        if conn.in_transaction:
+                            conn.execute("ROLLBACK")
+                for _, future in writes:
+                    if error is None:
+                        future.set_result(None)
+                    else:
+                        future.set_exception(error)
+                if len(writes) != len(items):
+                    return
+        finally:
+            conn.close()
+
+    def submit(self, jobs: Sequence[JournalJob], batch: Optional[JournalBatch] = None) -> "Future[None]":
+        """Record new jobs (and their batch) in one transaction; the future resolves once it is durable."""
+        statements = [_job_insert(job) for job in jobs]
+        if batch is not None:
+            statements.append(
+                (
+                    "INSERT OR REPLACE INTO batches (batch_id, spec, submitted_at) VALUES (?, ?, ?)",
+                    (batch.batch_id, _dumps(batch.spec), batch.submitted_at),
+                )
+            )
+        return self._write(statements)
+
+    def update(
+        self,
+        job_id: str,
+        status: str,
+        state: Dict[str, Any],
+        finished_at: Optional[float],
+        claimed_by: Optional[str] = None,
+    ) -> "Future[None]":
+        """
+        Write a job's status and state; a cancelled job is never overwritten (e.g. by a late "completed").
+
+        With ``claimed_by`` (a shared-mode worker writing its own job) the
+        write is dropped once another worker has reclaimed the job.
+        """
+        sql = "UPDATE jobs SET status = ?, state = ?, finished_at = ? WHERE job_id = ? AND status != 'cancelled'"
+        params: Tuple[Any, ...] = (status, _dumps(state), finished_at, job_id)
+        if claimed_by is not None:
+            # lease kedaluwarsa dan job sudah diklaim proses lain: tulisan worker lama tidak menimpanya
+            sql += " AND (claimed_by IS NULL OR claimed_by = ?)"
+            params += (claimed_by,)
+        return self._write([(sql, params)])
+
+    def delete(self, keys: Iterable[str]) -> "Future[None]":
+        """Forget jobs or batches (with their members) by id."""
+        statements: List[_Statement] = []
+        for key in keys:
+            statements.append(("DELETE FROM jobs WHERE job_id = ? OR batch_id = ?", (key, key)))
+            statements.append(("DELETE FROM batches WHERE batch_id = ?", (key,)))
+        return self._write(statements)
+
+    def renew(self, job_ids: Iterable[str], worker_id: str, lease_until: float) -> "Future[None]":
+        return self._write(
+            [
+                ("UPDATE jobs SET lease_until = ? WHERE job_id = ? AND claimed_by = ?", (lease_until, job_id, worker_id))
+                for job_id in job_ids
+            ]
+        )
+
+    def requeue(self, job_ids: Iterable[str], worker_id: str) -> "Future[None]":
+        """Hand unfinished claimed jobs back to the shared queue (worker shutdown)."""
+        return self._write(
+            [
+                (
+                    "UPDATE jobs SET status = 'queued', claimed_by = NULL, lease_until = NULL "
+                    "WHERE job_id = ? AND claimed_by = ? AND finished_at IS NULL",
+                    (job_id, worker_id),
+                )
+                for job_id in job_ids
+            ]
+        )
+
+    def prune(self, finished_before: float) -> "Future[None]":
+        """Delete jobs and whole batches finished before ``finished_before`` and trim the change feed."""
+        return self._write(
+            [
+                (
+                    "DELETE FROM jobs WHERE batch_id IS NULL AND finished_at IS NOT NULL AND finished_at < ?",
+                    (finished_before,),
+                ),
+                (
+                    "DELETE FROM jobs WHERE batch_id IN (SELECT batch_id FROM batches WHERE NOT EXISTS ("
+                    "SELECT 1 FROM jobs AS member WHERE member.batch_id = batches.batch_id "
+                    "AND (member.finished_at IS NULL OR member.finished_at >= ?)))",
+                    (finished_before,),
+                ),
+                (
+                    "DELETE FROM batches WHERE NOT EXISTS (SELECT 1 FROM jobs WHERE jobs.batch_id = batches.batch_id)",
+                    (),
+                ),
+                ("DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?", (CHANGES_KEPT,)),
+            ]
+        )
+
+    def flush(self) -> "Future[None]":
+        """Resolves once every write queued before it has been committed."""
+        return self._write([])
+
+    def load(self) -> Tuple[List[JournalBatch], List[JournalJob]]:
+        """All journaled batches and jobs, jobs in submission order."""
+        with closing(self._open()) as conn:
+            batches = [
+                JournalBatch(batch_id, json.loads(spec), submitted_at)
+                for batch_id, spec, submitted_at in conn.execute(
+                    "SELECT batch_id, spec, submitted_at FROM batches ORDER BY submitted_at, rowid"
+                )
+            ]
+            jobs = [
+                _job_from_row(row)
+                for row in conn.execute(f"SELECT {_JOB_COLUMNS} FROM jobs ORDER BY submitted_at, rowid")
+            ]
+        return batches, jobs
+
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[JournalJob]:
+        """Atomically take the next queued job (or one whose lease expired) for ``worker_id``."""
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "UPDATE jobs SET status = 'processing', claimed_by = ?, lease_until = ? "
+                "WHERE job_id = (SELECT job_id FROM jobs WHERE status = 'queued' "
+                "OR (status = 'processing' AND finished_at IS NULL AND lease_until < ?) "
+                "ORDER BY priority, submitted_at, rowid LIMIT 1) "
+                f"RETURNING {_JOB_COLUMNS}",
+                (worker_id, now + lease_seconds, now),
+            ).fetchone()
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return _job_from_row(row) if row else None
+
+    def queued_count(self) -> int:
+        """Queued jobs outside batches (batch members never count against the queue limit)."""
+        row = self._connection().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND batch_id IS NULL"
+        ).fetchone()
+        return int(row[0])
+
+    def last_change(self) -> int:
+        row = self._connection().execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()
+        return int(row[0])
+
+    def changes(self, after: int) -> Tuple[int, List[str]]:
+        """``(last seq, distinct job ids)`` of every status change after ``after``."""
+        rows = self._connection().execute(
+            "SELECT seq, job_id FROM changes WHERE seq > ? ORDER BY seq", (after,)
+        ).fetchall()
+        if not rows:
+            return after, []
+        return rows[-1][0], list(dict.fromkeys(job_id for _, job_id in rows))
+
+    def get_jobs(self, job_ids: Sequence[str]) -> List[JournalJob]:
+        conn = self._connection()
+        jobs: List[JournalJob] = []
+        # batas variabel SQLite: ambil per potongan
+        for start in range(0, len(job_ids), 500):
+            chunk = job_ids[start : start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            jobs.extend(
+                _job_from_row(row)
+                for row in conn.execute(f"SELECT {_JOB_COLUMNS} FROM jobs WHERE job_id IN ({placeholders})", chunk)
+            )
+        return jobs
+
+    def lookup(self, key: str) -> Tuple[Optional[JournalBatch], List[JournalJob]]:
+        """A batch with its members, or a single job, by id."""
+        conn = self._connection()
+        row = conn.execute("SELECT batch_id, spec, submitted_at FROM batches WHERE batch_id = ?", (key,)).fetchone()
+        if row:
+            members = [
+                _job_from_row(member)
+                for member in conn.execute(
+                    f"SELECT {_JOB_COLUMNS} FROM jobs WHERE batch_id = ? ORDER BY submitted_at, rowid", (key,)
+                )
+            ]
+            return JournalBatch(row[0], json.loads(row[1]), row[2]), members
+        return None, self.get_jobs([key])
+
+    def close(self) -> None:
+        """Flush pending writes, stop the writer thread (restarted by the next write) and close every connection."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            # thread yang memakai jurnal lagi setelah close membuka koneksi baru
+            self._local = threading.local()
+        for conn in connections:
+            conn.close()
+        with self._thread_lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            self._pending.put(None)
+        thread.join()
+
+
+__all__ = ["JobJournal", "JournalBatch", "JournalJob"]
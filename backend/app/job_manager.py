@@ -2,56 +2,256 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
+import itertools
+import logging
+import os
+import socket
+import sqlite3
+import time
 import uuid
-from collections import defaultdict
-from dataclasses import dataclass, field
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from functools import partial
 from pathlib import Path
-from typing import Any, Dict, Optional, Set
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple, TypeVar
 
 import numpy as np
 
-from . import img_ops, storage
-from .schemas import JobStatus, JobStatusResponse
+from . import encoders, img_ops, storage, telemetry
+from .encoders import EncodePolicy
+from .executors import OperationRunner
+from .image_cache import image_cache
+from .img_ops import OperationKey, ResolvedStep
+from .job_journal import JobJournal, JournalBatch, JournalJob
+from .result_cache import ResultCache, result_cache
+from .schemas import BatchProgress, JobPriority, JobStatus, JobStatusResponse, OperationEnum
+from .services.progress import CancelToken, DeadlineExceeded, OperationCancelled, Reporter
+from .services.metrics import DEFAULT_POLICY, MetricsPolicy
+from .subscriptions import Subscription
 
+# Jumlah worker = jumlah job yang boleh memegang citra resolusi penuh di RAM bersamaan.
+JOB_WORKERS = max(1, int(os.getenv("AINTRA_JOB_WORKERS", str(min(4, os.cpu_count() or 1)))))
+# Batas antrian; submit ditolak (503) ketika penuh agar latensi & memori tetap terprediksi.
+JOB_QUEUE_SIZE = max(1, int(os.getenv("AINTRA_JOB_QUEUE_SIZE", "64")))
 
-@dataclass
+# Job/batch selesai tetap bisa ditanya statusnya selama umur ini, dibatasi jumlah record total.
+JOB_RETENTION_SECONDS = max(0.0, float(os.getenv("AINTRA_JOB_RETENTION_SECONDS", "3600")))
+JOB_RETENTION_MAX = max(1, int(os.getenv("AINTRA_JOB_RETENTION_MAX", "5000")))
+JOB_EVICT_INTERVAL = max(1.0, float(os.getenv("AINTRA_JOB_EVICT_INTERVAL", "60")))
+# Jurnal SQLite: job antri/selesai selamat dari restart; "off" untuk menonaktifkan.
+JOB_JOURNAL = os.getenv("AINTRA_JOB_JOURNAL", str(storage.STORAGE_ROOT / "jobs.sqlite3"))
+# local: antrian di memori proses ini. shared: antrian & status di jurnal, dipakai bersama oleh
+# beberapa proses API (AINTRA_JOB_WORKERS=0) dan worker (python -m app.worker).
+JOB_MODE = os.getenv("AINTRA_JOB_MODE", "local").strip().lower()
+JOB_POLL_SECONDS = max(0.01, float(os.getenv("AINTRA_JOB_POLL_MS", "200")) / 1000.0)
+JOB_LEASE_SECONDS = max(1.0, float(os.getenv("AINTRA_JOB_LEASE_SECONDS", "60")))
+# Batas waktu per operasi (per langkah pipeline) dalam detik; 0 menonaktifkan. Bisa diganti per request.
+OPERATION_TIMEOUT = max(0.0, float(os.getenv("AINTRA_OPERATION_TIMEOUT_SECONDS", "600")))
+
+# Status akhir: job tidak berubah lagi dan mulai dihitung untuk retensi.
+FINISHED_STATUSES = frozenset({"completed", "error", "cancelled"})
+
+# Rentang progres job: 20 saat mulai, operasi mengisi 20..90, sisanya encode & simpan.
+PROGRESS_STARTED = 20
+PROGRESS_OPERATIONS = 70
+
+# Angka lebih kecil diproses lebih dulu; batch hanya jalan ketika tidak ada job interaktif.
+PRIORITY_ORDER: Dict[str, int] = {"interactive": 0, "batch": 10}
+
+logger = logging.getLogger("aintra.jobs")
+
+T = TypeVar("T")
+# (path citra, kunci cache) per anggota batch
+BatchItem = Tuple[Path, Optional[str]]
+
+
+class QueueFullError(RuntimeError):
+    """Raised by :meth:`JobManager.submit` when the bounded queue has no free slot."""
+
+
+@dataclass(slots=True)
 class JobRecord:
     job_id: str
     image_path: Path
-<<<<<<< HEAD
-    operation: str
+    operation: OperationKey
     params: Dict[str, Any]
-=======
-    operation: OperationEnum
-    params: Dict
     target_image_id: Optional[str] = None
->>>>>>> ee3fa41 (chore: update README and UI)
+    priority: JobPriority = "interactive"
+    # pipeline: urutan langkah tervalidasi; kosong berarti satu operasi (operation, params)
+    steps: List[ResolvedStep] = field(default_factory=list)
+    # kunci result_cache (lihat result_cache.make_key); None berarti hasil tidak di-cache
+    cache_key: Optional[str] = None
+    encoding: EncodePolicy = encoders.RESULT_POLICY
+    metrics_policy: MetricsPolicy = DEFAULT_POLICY
+    # batas waktu per operasi (detik); None memakai AINTRA_OPERATION_TIMEOUT_SECONDS
+    timeout: Optional[float] = None
+    batch_id: Optional[str] = None
     status: JobStatus = "queued"
     progress: int = 0
     result_url: Optional[str] = None
     metrics: Optional[Dict[str, float]] = None
+    metrics_pending: bool = False
     error: Optional[str] = None
     started_at: float = field(default_factory=lambda: asyncio.get_event_loop().time())
     finished_at: Optional[float] = None
+    # terisi selama job berjalan; cancel() menghentikan operasi di checkpoint berikutnya
+    token: Optional[CancelToken] = None
+
+
+@dataclass(slots=True)
+class BatchRecord:
+    batch_id: str
+    job_ids: List[str]
+    operation: OperationKey
+    status: JobStatus = "queued"
+    progress: int = 0
+    completed: int = 0
+    failed: int = 0
+    cancelled: int = 0
+    error: Optional[str] = None
+    started_at: float = field(default_factory=lambda: asyncio.get_event_loop().time())
+    finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.completed + self.failed + self.cancelled >= len(self.job_ids)
 
 
 class JobManager:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        *,
+        workers: int = JOB_WORKERS,
+        queue_size: int = JOB_QUEUE_SIZE,
+        cache: Optional[ResultCache] = None,
+        retention_seconds: float = JOB_RETENTION_SECONDS,
+        retention_max: int = JOB_RETENTION_MAX,
+        evict_interval: float = JOB_EVICT_INTERVAL,
+        journal: Optional[JobJournal] = None,
+        journal_path: Optional[Path] = None,
+        shared: bool = False,
+        poll_interval: float = JOB_POLL_SECONDS,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+    ) -> None:
+        if shared and journal is None and journal_path is None:
+            raise ValueError("Mode shared membutuhkan jurnal job (AINTRA_JOB_JOURNAL)")
         self._jobs: Dict[str, JobRecord] = {}
-        self._subscribers: Dict[str, Set[asyncio.Queue[JobStatusResponse]]] = defaultdict(set)
+        self._batches: Dict[str, BatchRecord] = {}
+        # tugas latar (pengisi antrian batch, laporan progres) yang dibatalkan saat stop
+        self._tasks: Set[asyncio.Task[None]] = set()
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        # id job/batch selesai -> (finished_at, jumlah record), urut waktu selesai
+        self._finished: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+        self._finished_records = 0
+        self._retention_seconds = retention_seconds
+        self._retention_max = max(1, int(retention_max))
+        self._evict_interval = evict_interval
+        self._background: List[asyncio.Task[None]] = []
+        self._started = False
         self._lock = asyncio.Lock()
+        # shared: proses API murni boleh tanpa worker
+        self._worker_count = max(0 if shared else 1, int(workers))
+        # slot bersama seluruh batch: anggota batch (dari batch mana pun) yang boleh berada di antrian/berjalan
+        # bersamaan, sehingga beberapa batch sekaligus tidak memenuhi antrian dan submit interaktif tetap diterima
+        self._batch_slots = asyncio.Semaphore(max(1, self._worker_count))
+        # job batch yang sedang memegang slot
+        self._slotted: Set[str] = set()
+        self._queue: asyncio.PriorityQueue[Tuple[int, int, str]] = asyncio.PriorityQueue(maxsize=max(1, int(queue_size)))
+        self._sequence = itertools.count()
+        self._workers: List[asyncio.Task[None]] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._runner = OperationRunner()
+        self._cache = cache if cache is not None else result_cache
+        self._running = 0
+        self._journal = journal
+        # jurnal dari path dibuka di start() dan ditutup di stop(), bukan saat import modul
+        self._journal_path = journal_path
+        self._restored = False
+        self._shared = shared
+        self._poll_interval = poll_interval
+        self._lease_seconds = lease_seconds
+        self._worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        # shared: job yang sedang dikerjakan proses ini (lease diperpanjang, dikembalikan saat stop)
+        self._claimed: Set[str] = set()
+        self._wakeup = asyncio.Event()
+        self._last_change = 0
+
+    @property
+    def worker_count(self) -> int:
+        return self._worker_count
+
+    @property
+    def shared(self) -> bool:
+        return self._shared
+
+    @property
+    def worker_id(self) -> str:
+        return self._worker_id
+
+    async def start(self) -> None:
+        """Spawn the worker tasks on the running loop (idempotent)."""
+        if self._started:
+            return
+        self._started = True
+        if self._executor is None:
+            self._executor = telemetry.TrackedThreadPool(
+                max_workers=max(1, self._worker_count), thread_name_prefix="aintra-job", pool="job"
+            )
+        self._runner.threads = self._executor
+        if self._journal is None and self._journal_path is not None:
+            self._journal = await asyncio.to_thread(JobJournal, self._journal_path)
+        worker = self._claim_worker if self._shared else self._worker
+        self._workers = [asyncio.create_task(worker()) for _ in range(self._worker_count)]
+        self._background = [asyncio.create_task(self._evict_periodically())]
+        if self._shared:
+            self._last_change = await asyncio.to_thread(self._journal.last_change)
+            self._background.append(asyncio.create_task(self._follow_changes()))
+            self._background.append(asyncio.create_task(self._renew_leases()))
+        elif self._journal is not None and not self._restored:
+            self._restored = True
+            await self._restore()
+
+    async def stop(self) -> None:
+        pending, self._tasks = list(self._tasks), set()
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        workers, self._workers = self._workers + self._background, []
+        self._background = []
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        if self._claimed:
+            # job yang terpotong dikembalikan ke antrian bersama agar diambil worker lain
+            self._journal.requeue(list(self._claimed), self._worker_id)
+            self._claimed.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._runner.shutdown()
+        if self._journal is not None:
+            await asyncio.to_thread(self._journal.close)
+            if self._journal_path is not None:
+                self._journal = None
+        self._started = False
 
-<<<<<<< HEAD
-    async def submit(self, image_path: Path, operation: str, params: Dict[str, Any]) -> JobRecord:
-=======
     async def submit(
         self,
         image_path: Path,
-        operation: OperationEnum,
-        params: Dict,
+        operation: OperationKey,
+        params: Dict[str, Any],
         target_image_id: Optional[str] = None,
+        *,
+        priority: JobPriority = "interactive",
+        steps: Optional[List[ResolvedStep]] = None,
+        cache_key: Optional[str] = None,
+        encoding: Optional[EncodePolicy] = None,
+        metrics_policy: MetricsPolicy = DEFAULT_POLICY,
+        timeout: Optional[float] = None,
     ) -> JobRecord:
->>>>>>> ee3fa41 (chore: update README and UI)
+        await self.start()
         job_id = uuid.uuid4().hex
         record = JobRecord(
             job_id=job_id,
@@ -59,72 +259,477 @@ class JobManager:
             operation=operation,
             params=params,
             target_image_id=target_image_id,
+            priority=priority,
+            steps=list(steps or []),
+            cache_key=cache_key,
+            encoding=encoding or encoders.RESULT_POLICY,
+            metrics_policy=metrics_policy,
+            timeout=timeout,
         )
+        if self._shared and await asyncio.to_thread(self._journal.queued_count) >= self._queue.maxsize:
+            raise QueueFullError("Antrian job penuh, coba lagi nanti")
         async with self._lock:
+            if not self._shared:
+                try:
+                    self._queue.put_nowait((PRIORITY_ORDER.get(priority, 0), next(self._sequence), job_id))
+                except asyncio.QueueFull as exc:
+                    raise QueueFullError("Antrian job penuh, coba lagi nanti") from exc
             self._jobs[job_id] = record
-        asyncio.create_task(self._process_job(record))
+            durable = self._journal.submit([_journal_entry(record)]) if self._journal else None
+        if durable is not None:
+            # job baru dikonfirmasi ke klien setelah tercatat di jurnal
+            await _settle(durable)
+        self._wakeup.set()
         return record
 
-    async def subscribe(self, job_id: str) -> asyncio.Queue[JobStatusResponse]:
-        queue: asyncio.Queue[JobStatusResponse] = asyncio.Queue()
+    async def submit_batch(
+        self,
+        items: Sequence[BatchItem],
+        operation: OperationKey,
+        params: Dict[str, Any],
+        target_image_id: Optional[str] = None,
+        *,
+        priority: JobPriority = "batch",
+        encoding: Optional[EncodePolicy] = None,
+        metrics_policy: MetricsPolicy = DEFAULT_POLICY,
+        timeout: Optional[float] = None,
+    ) -> BatchRecord:
+        """
+        Register one job per image for an already validated operation.
+
+        Members of all batches together are fed into the queue at most
+        ``worker_count`` at a time, so even several batches of hundreds of
+        images never fill the bounded queue and interactive submits keep
+        getting a slot. In shared mode the members
+        wait in the shared queue behind interactive jobs instead.
+        """
+        await self.start()
+        batch_id = uuid.uuid4().hex
+        records = [
+            JobRecord(
+                job_id=uuid.uuid4().hex,
+                image_path=image_path,
+                operation=operation,
+                params=params,
+                target_image_id=target_image_id,
+                priority=priority,
+                cache_key=cache_key,
+                encoding=encoding or encoders.RESULT_POLICY,
+                metrics_policy=metrics_policy,
+                timeout=timeout,
+                batch_id=batch_id,
+            )
+            for image_path, cache_key in items
+        ]
+        batch = BatchRecord(batch_id=batch_id, job_ids=[record.job_id for record in records], operation=operation)
         async with self._lock:
+            for record in records:
+                self._jobs[record.job_id] = record
+            self._batches[batch_id] = batch
+            durable = None
+            if self._journal is not None:
+                durable = self._journal.submit(
+                    [_journal_entry(record) for record in records],
+                    JournalBatch(
+                        batch_id,
+                        {"job_ids": batch.job_ids, "operation": _operation_spec(operation), "priority": priority},
+                        time.time(),
+                    ),
+                )
+        if durable is not None:
+            await _settle(durable)
+        if self._shared:
+            self._wakeup.set()
+        else:
+            self._spawn_task(self._feed_batch(batch_id, PRIORITY_ORDER.get(priority, 0)))
+        return batch
+
+    def _spawn_task(self, coroutine: Any) -> None:
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _feed_jobs(self, job_ids: Sequence[str]) -> None:
+        for job_id in job_ids:
+            record = self._jobs.get(job_id)
+            if record is not None:
+                await self._queue.put((PRIORITY_ORDER.get(record.priority, 0), next(self._sequence), job_id))
+
+    async def _feed_batch(self, batch_id: str, order: int) -> None:
+        batch = self._batches[batch_id]
+        for job_id in batch.job_ids:
             record = self._jobs.get(job_id)
-            if not record:
-                raise KeyError(job_id)
-            await queue.put(self._to_response(record))
-            self._subscribers[job_id].add(queue)
-        return queue
+            # anggota yang sudah selesai (replay jurnal) atau dibatalkan dilewati
+            if record is None or record.status != "queued":
+                continue
+            await self._batch_slots.acquire()
+            self._slotted.add(job_id)
+            # put() menunggu bila antrian penuh alih-alih menolak anggota batch
+            await self._queue.put((order, next(self._sequence), job_id))
 
-    async def unsubscribe(self, job_id: str, queue: asyncio.Queue[JobStatusResponse]) -> None:
+    async def get_batch(self, batch_id: str) -> Tuple[BatchRecord, List[JobRecord]]:
+        await self._ensure_loaded(batch_id)
         async with self._lock:
+            batch = self._batches.get(batch_id)
+            if not batch:
+                raise KeyError(batch_id)
+            return batch, [self._jobs[job_id] for job_id in batch.job_ids if job_id in self._jobs]
+
+    async def subscribe(self, job_id: str, subscription: Optional[Subscription] = None) -> Subscription:
+        """
+        Watch a job or batch; its current status is published right away.
+
+        Pass an existing ``subscription`` to multiplex several keys onto one
+        consumer. Raises ``KeyError`` for unknown keys.
+        """
+        await self._ensure_loaded(job_id)
+        subscription = subscription if subscription is not None else Subscription()
+        async with self._lock:
+            subscription.publish(job_id, self._status_of(job_id))
+            self._subscribers.setdefault(job_id, set()).add(subscription)
+            subscription.keys.add(job_id)
+        return subscription
+
+    async def unsubscribe(self, job_id: str, subscription: Subscription) -> None:
+        async with self._lock:
+            subscription.keys.discard(job_id)
             subscribers = self._subscribers.get(job_id)
-            if subscribers and queue in subscribers:
-                subscribers.remove(queue)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[job_id]
 
     async def get_status(self, job_id: str) -> JobStatusResponse:
+        await self._ensure_loaded(job_id)
         async with self._lock:
-            record = self._jobs.get(job_id)
-            if not record:
-                raise KeyError(job_id)
+            return self._status_of(job_id)
+
+    def _status_of(self, job_id: str) -> JobStatusResponse:
+        """Status of a job or a batch; the caller holds ``self._lock``."""
+        record = self._jobs.get(job_id)
+        if record:
             return self._to_response(record)
+        batch = self._batches.get(job_id)
+        if batch:
+            return self._batch_response(batch)
+        raise KeyError(job_id)
+
+    def subscription_count(self) -> int:
+        """Progress subscriptions (one per listener per job/batch) currently held."""
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
 
     async def jobs_count(self) -> int:
         async with self._lock:
             return len(self._jobs)
 
+    async def job_counts(self) -> Tuple[int, int, int]:
+        """``(queued, running, retained)``: retained counts finished records still held for status queries."""
+        if self._shared:
+            queued = await asyncio.to_thread(self._journal.queued_count)
+        async with self._lock:
+            if not self._shared:
+                queued = sum(1 for record in self._jobs.values() if record.status == "queued")
+            return queued, self._running, self._finished_records
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def running_count(self) -> int:
+        return self._running
+
+    async def _run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, job_id = await self._queue.get()
+            try:
+                record = self._jobs.get(job_id)
+                if record is None:
+                    continue
+                if record.status != "queued":
+                    # dibatalkan selagi mengantri
+                    continue
+                self._running += 1
+                try:
+                    await self._process_job(record)
+                finally:
+                    self._running -= 1
+            finally:
+                self._release_batch_slot(job_id)
+                self._queue.task_done()
+
+    def _release_batch_slot(self, job_id: str) -> None:
+        if job_id in self._slotted:
+            self._slotted.discard(job_id)
+            self._batch_slots.release()
+
+    async def _claim_worker(self) -> None:
+        """Shared mode: claim the next job from the shared queue, or wait for a submit or poll tick."""
+        while True:
+            entry = await asyncio.to_thread(self._journal.claim, self._worker_id, self._lease_seconds)
+            if entry is None:
+                self._wakeup.clear()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), self._poll_interval)
+                continue
+            record = _record_from_journal(entry, time.time() - asyncio.get_running_loop().time())
+            async with self._lock:
+                self._jobs[record.job_id] = record
+            self._claimed.add(record.job_id)
+            self._running += 1
+            try:
+                await self._process_job(record)
+            finally:
+                self._running -= 1
+                self._claimed.discard(record.job_id)
+
+    async def _renew_leases(self) -> None:
+        while True:
+            await asyncio.sleep(self._lease_seconds / 3)
+            if self._claimed:
+                self._journal.renew(list(self._claimed), self._worker_id, time.time() + self._lease_seconds)
+
+    async def _follow_changes(self) -> None:
+        """Shared mode: apply status changes written by other processes and notify local subscribers."""
+        while True:
+            await asyncio.sleep(self._poll_interval)
+            self._last_change, changed = await asyncio.to_thread(self._journal.changes, self._last_change)
+            async with self._lock:
+                # hanya job yang sudah dikenal proses ini
+                watched = [job_id for job_id in changed if job_id in self._jobs]
+            if not watched:
+                continue
+            for entry in await asyncio.to_thread(self._journal.get_jobs, watched):
+                if entry.job_id in self._claimed:
+                    # perubahan job sendiri sudah diterapkan; yang dicari hanya pembatalan dari proses lain
+                    record = self._jobs.get(entry.job_id)
+                    if entry.status == "cancelled" and record is not None:
+                        # status lokal ikut "cancelled" agar tulisan berikutnya dari job ini diabaikan
+                        await self._update(entry.job_id, status="cancelled", error=entry.state["error"], journal=False)
+                        if record.token is not None:
+                            record.token.cancel()
+                    continue
+                state = entry.state
+                await self._update(
+                    entry.job_id,
+                    status=entry.status,  # type: ignore[arg-type]
+                    progress=state["progress"],
+                    result_url=state["result_url"],
+                    metrics=state["metrics"],
+                    metrics_pending=state.get("metrics_pending", False),
+                    error=state["error"],
+                    journal=False,
+                )
+
+    async def _ensure_loaded(self, key: str) -> None:
+        """Shared mode: pull a job or batch submitted through another process into the local view."""
+        if not self._shared:
+            return
+        async with self._lock:
+            if key in self._jobs or key in self._batches:
+                return
+        batch_entry, entries = await asyncio.to_thread(self._journal.lookup, key)
+        if not entries:
+            return
+        loop = asyncio.get_running_loop()
+        offset = time.time() - loop.time()
+        async with self._lock:
+            for entry in entries:
+                if entry.job_id in self._jobs:
+                    continue
+                record = _record_from_journal(entry, offset, live=True)
+                self._jobs[record.job_id] = record
+                if record.batch_id is None and record.finished_at is not None:
+                    self._mark_finished(record.job_id, record.finished_at, 1)
+            if batch_entry is not None and batch_entry.batch_id not in self._batches:
+                batch = _batch_from_journal(batch_entry, offset)
+                self._batches[batch.batch_id] = batch
+                self._refresh_batch(batch)
+
+    async def cancel(self, key: str) -> JobStatusResponse:
+        """
+        Cancel a job, or every unfinished member of a batch. Queued jobs are
+        dropped; running ones stop at their next checkpoint. Finished jobs
+        are left as they are.
+        """
+        await self._ensure_loaded(key)
+        async with self._lock:
+            batch = self._batches.get(key)
+            if batch is None and key not in self._jobs:
+                raise KeyError(key)
+            records = [self._jobs[job_id] for job_id in (batch.job_ids if batch else [key]) if job_id in self._jobs]
+        for record in records:
+            if record.status in FINISHED_STATUSES:
+                continue
+            if record.token is not None:
+                record.token.cancel()
+            await self._update(record.job_id, status="cancelled", error="Dibatalkan oleh pengguna")
+        return await self.get_status(key)
+
     async def _process_job(self, record: JobRecord) -> None:
+        token = record.token = CancelToken()
         try:
-            await self._update(record.job_id, status="processing", progress=20)
-            original = await asyncio.to_thread(img_ops.load_image, record.image_path)
+            await self._update(record.job_id, status="processing", progress=PROGRESS_STARTED)
+            if record.cache_key:
+                cached = await self._run(self._cache.get, record.cache_key)
+                if cached is not None:
+                    # hit: decode, operasi, dan encode dilewati seluruhnya
+                    with telemetry.STAGE_SECONDS.time("job", "write"):
+                        result_url = await self._run(
+                            storage.save_result_bytes, record.job_id, cached.data, record.encoding.extension
+                        )
+                    await self._update(
+                        record.job_id,
+                        status="completed",
+                        progress=100,
+                        result_url=result_url,
+                        metrics=cached.metrics,
+                    )
+                    return
+            steps = record.steps or [(record.operation, record.params)]
             target_image: Optional[np.ndarray] = None
-            if record.operation == OperationEnum.HISTOGRAM_MATCH:
-                if not record.target_image_id:
-                    raise ValueError("Target image tidak ditemukan untuk histogram-match")
-                target = storage.get_upload(record.target_image_id)
-                target_image = await asyncio.to_thread(img_ops.load_image, target.path)
-            processed, op_metrics = await asyncio.to_thread(
-                img_ops.apply_operation_with_metrics,
-                original,
-                record.operation,
-                record.params,
-                target_image,
-            )
-            result_url = await asyncio.to_thread(storage.save_result, record.job_id, processed)
-            metrics = await asyncio.to_thread(img_ops.compute_metrics, original, processed)
+            with telemetry.STAGE_SECONDS.time("job", "decode"):
+                # upload besar dibaca lewat memmap sehingga memori puncak mengikuti tile, bukan ukuran citra
+                original = await self._run(storage.load_upload_raster, record.image_path)
+                if any(operation == OperationEnum.HISTOGRAM_MATCH for operation, _ in steps):
+                    if not record.target_image_id:
+                        raise ValueError("Target image tidak ditemukan untuk histogram-match")
+                    _, target_image = await self._run(image_cache.load, record.target_image_id)
+            processed = original
+            op_metrics: Dict[str, float] = {}
+            with telemetry.STAGE_SECONDS.time("job", "compute"):
+                index = 0
+                for fusable, group in itertools.groupby(steps, key=img_ops.is_point_step):
+                    run = list(group)
+                    if fusable and len(run) > 1 and processed.dtype == np.uint8:
+                        # operasi titik berurutan: satu LUT gabungan, sama seperti apply_pipeline_with_metrics
+                        token.check()
+                        processed = await self._run(img_ops.apply_point_run, processed, run)
+                        index += len(run)
+                        await self._report_progress(
+                            record.job_id, PROGRESS_STARTED + PROGRESS_OPERATIONS * index // len(steps)
+                        )
+                        continue
+                    for operation, params in run:
+                        # langkah ke-i mengisi rentang progres 20..90 secara proporsional
+                        sink = self._progress_sink(
+                            record.job_id,
+                            PROGRESS_STARTED + PROGRESS_OPERATIONS * index // len(steps),
+                            PROGRESS_STARTED + PROGRESS_OPERATIONS * (index + 1) // len(steps),
+                        )
+                        # deadline berlaku per operasi, dihitung ulang setiap langkah
+                        token.set_timeout(record.timeout if record.timeout is not None else OPERATION_TIMEOUT)
+                        processed, step_metrics = await self._runner.run(
+                            processed, operation, params, target_image, progress_sink=sink, token=token
+                        )
+                        op_metrics.update(step_metrics)
+                        index += 1
+                token.set_timeout(None)
+                token.check()
+            with telemetry.STAGE_SECONDS.time("job", "encode"):
+                encoded, encode_ms = await self._run(encoders.encode, processed, record.encoding)
+            with telemetry.STAGE_SECONDS.time("job", "write"):
+                result_url = await self._run(
+                    storage.save_result_bytes, record.job_id, encoded, record.encoding.extension
+                )
+                # histogram dihitung dari array yang masih di memori, bukan dari file hasil
+                await self._run(storage.store_histogram, storage.RESULT_DIR, record.job_id, processed)
+            if record.metrics_policy.deferred and record.metrics_policy.names:
+                # hasil dikirim lebih dulu dan slot worker dilepas; metrik kualitas menyusul sebagai tugas terpisah
+                if record.cache_key:
+                    await self._run(
+                        self._cache.put, record.cache_key, encoded, dict(op_metrics) or None, record.encoding.media_type
+                    )
+                await self._update(
+                    record.job_id,
+                    status="completed",
+                    progress=100,
+                    result_url=result_url,
+                    metrics={**op_metrics, "encode_ms": encode_ms},
+                    metrics_pending=True,
+                )
+                self._spawn_task(self._deferred_metrics(record, original, processed, encoded, op_metrics, encode_ms))
+                return
+            with telemetry.STAGE_SECONDS.time("job", "metrics"):
+                metrics = await self._run(img_ops.compute_metrics, original, processed, record.metrics_policy)
             merged_metrics: Dict[str, float] = {}
             if metrics:
                 merged_metrics.update(metrics)
             if op_metrics:
                 merged_metrics.update(op_metrics)
+            if record.cache_key:
+                await self._run(
+                    self._cache.put,
+                    record.cache_key,
+                    encoded,
+                    dict(merged_metrics) or None,
+                    record.encoding.media_type,
+                )
+            merged_metrics["encode_ms"] = encode_ms
             await self._update(
                 record.job_id,
                 status="completed",
                 progress=100,
                 result_url=result_url,
                 metrics=merged_metrics or None,
+                metrics_pending=False,
             )
+        except DeadlineExceeded as exc:
+            await self._update(record.job_id, status="error", progress=100, error=str(exc), metrics_pending=False)
+        except OperationCancelled:
+            await self._update(record.job_id, status="cancelled", error="Dibatalkan oleh pengguna")
         except Exception as exc:  # noqa: BLE001
-            await self._update(record.job_id, status="error", progress=100, error=str(exc))
+            await self._update(record.job_id, status="error", progress=100, error=str(exc), metrics_pending=False)
+        finally:
+            record.token = None
+
+    async def _deferred_metrics(
+        self,
+        record: JobRecord,
+        original: np.ndarray,
+        processed: np.ndarray,
+        encoded: bytes,
+        op_metrics: Dict[str, float],
+        encode_ms: float,
+    ) -> None:
+        """Compute the quality metrics of a completed job and publish them (``metrics_pending`` -> False)."""
+        merged_metrics: Dict[str, float] = {}
+        try:
+            # executor default, bukan pool job: thread pool job seukuran jumlah worker dan dipakai job berikutnya
+            with telemetry.STAGE_SECONDS.time("job", "metrics"):
+                metrics = await asyncio.to_thread(img_ops.compute_metrics, original, processed, record.metrics_policy)
+            if metrics:
+                merged_metrics.update(metrics)
+            merged_metrics.update(op_metrics)
+            if record.cache_key and metrics:
+                # entri cache ditulis ulang dengan metrik lengkap agar hit berikutnya tidak kehilangan metrik
+                await asyncio.to_thread(
+                    self._cache.put, record.cache_key, encoded, dict(merged_metrics), record.encoding.media_type
+                )
+        except Exception:  # noqa: BLE001
+            # hasil sudah terkirim: kegagalan metrik tidak mengubah status job
+            logger.exception("gagal menghitung metrik job %s", record.job_id)
+            merged_metrics = dict(op_metrics)
+        merged_metrics["encode_ms"] = encode_ms
+        await self._update(record.job_id, metrics=merged_metrics, metrics_pending=False)
+
+    def _progress_sink(self, job_id: str, low: int, high: int) -> Reporter:
+        """Throttled sink mapping an operation's 0..1 progress onto ``low..high``; callable from any thread."""
+        loop = asyncio.get_running_loop()
+
+        def emit(fraction: float) -> None:
+            value = low + int((high - low) * fraction)
+            loop.call_soon_threadsafe(self._spawn_task, self._report_progress(job_id, value))
+
+        return Reporter(emit)
+
+    async def _report_progress(self, job_id: str, value: int) -> None:
+        # laporan bisa tiba terlambat: jangan mundurkan progres atau menimpa job yang sudah selesai
+        record = self._jobs.get(job_id)
+        if record is not None and record.status == "processing" and value > record.progress:
+            await self._update(job_id, progress=value)
 
     async def _update(
         self,
@@ -134,11 +739,14 @@ class JobManager:
         progress: Optional[int] = None,
         result_url: Optional[str] = None,
         metrics: Optional[Dict[str, float]] = None,
+        metrics_pending: Optional[bool] = None,
         error: Optional[str] = None,
+        journal: bool = True,
     ) -> None:
         async with self._lock:
             record = self._jobs.get(job_id)
-            if not record:
+            if not record or record.status == "cancelled":
+                # job yang dibatalkan tidak berubah lagi, termasuk oleh operasi yang masih berjalan
                 return
             if status:
                 record.status = status
@@ -148,14 +756,145 @@ class JobManager:
                 record.result_url = result_url
             if metrics is not None:
                 record.metrics = metrics
+            if metrics_pending is not None:
+                record.metrics_pending = metrics_pending
             if error is not None:
                 record.error = error
-            if status in {"completed", "error"}:
+            if status in FINISHED_STATUSES and record.finished_at is None:
                 record.finished_at = asyncio.get_event_loop().time()
-            response = self._to_response(record)
-            subscribers = list(self._subscribers.get(job_id, set()))
-        for queue in subscribers:
-            await queue.put(response)
+                if record.batch_id is None:
+                    # anggota batch disimpan/dibuang bersama batch-nya (arsip butuh seluruh anggota)
+                    self._mark_finished(job_id, record.finished_at, 1)
+            # publish hanya menimpa status terakhir per subscriber; respons dibangun bila ada yang menonton
+            subscribers = self._subscribers.get(job_id)
+            if subscribers:
+                response = self._to_response(record)
+                for subscription in subscribers:
+                    subscription.publish(job_id, response)
+            batch = self._batches.get(record.batch_id) if record.batch_id else None
+            if batch is not None:
+                self._refresh_batch(batch)
+                subscribers = self._subscribers.get(batch.batch_id)
+                if subscribers:
+                    response = self._batch_response(batch)
+                    for subscription in subscribers:
+                        subscription.publish(batch.batch_id, response)
+            if journal and self._journal is not None and (self._shared or status or result_url or metrics or error):
+                # local: progres saja tidak dijurnal (job yang belum selesai diulang dari awal saat replay);
+                # shared: progres ikut dijurnal agar sampai ke proses API lain
+                self._journal.update(
+                    job_id,
+                    record.status,
+                    _journal_state(record),
+                    _wall_time(record.finished_at),
+                    # shared: hanya tulisan atas job yang diklaim proses ini yang dijaga lease-nya
+                    claimed_by=self._worker_id if job_id in self._claimed else None,
+                )
+            if record.finished_at is not None:
+                self._evict_finished(asyncio.get_event_loop().time())
+
+    def _drop_subscribers(self, key: str) -> None:
+        for subscription in self._subscribers.pop(key, ()):
+            subscription.keys.discard(key)
+
+    def _refresh_batch(self, batch: BatchRecord) -> None:
+        """Recompute aggregate progress from the member jobs; the caller holds ``self._lock``."""
+        members = [self._jobs[job_id] for job_id in batch.job_ids if job_id in self._jobs]
+        total = len(batch.job_ids)
+        batch.completed = sum(1 for member in members if member.status == "completed")
+        batch.failed = sum(1 for member in members if member.status == "error")
+        batch.cancelled = sum(1 for member in members if member.status == "cancelled")
+        batch.progress = sum(member.progress for member in members) // max(1, total)
+        if batch.done:
+            if batch.failed == total:
+                batch.status = "error"
+            elif batch.completed == 0:
+                batch.status = "cancelled"
+            else:
+                batch.status = "completed"
+            problems = []
+            if batch.failed:
+                problems.append(f"{batch.failed} dari {total} citra gagal diproses")
+            if batch.cancelled:
+                problems.append(f"{batch.cancelled} dari {total} citra dibatalkan")
+            if problems:
+                batch.error = "; ".join(problems)
+            if batch.finished_at is None:
+                batch.finished_at = max(
+                    (member.finished_at for member in members if member.finished_at is not None),
+                    default=asyncio.get_event_loop().time(),
+                )
+                self._mark_finished(batch.batch_id, batch.finished_at, total)
+        elif any(member.status != "queued" for member in members):
+            batch.status = "processing"
+
+    def _mark_finished(self, key: str, finished_at: float, records: int) -> None:
+        """Register a finished job or batch for eviction; the caller holds ``self._lock``."""
+        self._finished[key] = (finished_at, records)
+        self._finished_records += records
+
+    def _evict_finished(self, now: float) -> int:
+        """Drop the oldest finished entries past the age or count limit; the caller holds ``self._lock``."""
+        cutoff = now - self._retention_seconds
+        evicted = 0
+        keys: List[str] = []
+        while self._finished:
+            key, (finished_at, records) = next(iter(self._finished.items()))
+            if finished_at > cutoff and self._finished_records <= self._retention_max:
+                break
+            self._finished.popitem(last=False)
+            self._finished_records -= records
+            batch = self._batches.pop(key, None)
+            for job_id in batch.job_ids if batch else (key,):
+                self._jobs.pop(job_id, None)
+                self._drop_subscribers(job_id)
+            self._drop_subscribers(key)
+            keys.append(key)
+            evicted += records
+        # shared: hanya tampilan lokal yang dibuang; jurnal bersama dipangkas oleh prune()
+        if keys and self._journal is not None and not self._shared:
+            self._journal.delete(keys)
+        return evicted
+
+    async def _restore(self) -> None:
+        """Rebuild state from the journal: finished jobs answer status queries, unfinished ones run again."""
+        assert self._journal is not None
+        batches, entries = await asyncio.to_thread(self._journal.load)
+        loop = asyncio.get_running_loop()
+        offset = time.time() - loop.time()
+        pending: List[str] = []
+        feeds: List[Tuple[str, int]] = []
+        async with self._lock:
+            for entry in entries:
+                record = _record_from_journal(entry, offset)
+                self._jobs[record.job_id] = record
+                if record.batch_id is not None:
+                    continue
+                if record.finished_at is None:
+                    pending.append(record.job_id)
+                else:
+                    self._mark_finished(record.job_id, record.finished_at, 1)
+            for entry in batches:
+                batch = _batch_from_journal(entry, offset)
+                self._batches[batch.batch_id] = batch
+                self._refresh_batch(batch)
+                if not batch.done:
+                    feeds.append((batch.batch_id, PRIORITY_ORDER.get(entry.spec["priority"], 0)))
+            # urutan waktu selesai dibutuhkan oleh _evict_finished
+            self._finished = OrderedDict(sorted(self._finished.items(), key=lambda item: item[1][0]))
+            self._evict_finished(loop.time())
+        if pending:
+            self._spawn_task(self._feed_jobs(pending))
+        for batch_id, order in feeds:
+            self._spawn_task(self._feed_batch(batch_id, order))
+
+    async def _evict_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self._evict_interval)
+            async with self._lock:
+                self._evict_finished(asyncio.get_running_loop().time())
+            if self._journal is not None:
+                self._journal.prune(time.time() - self._retention_seconds)
 
     @staticmethod
     def _to_response(record: JobRecord) -> JobStatusResponse:
@@ -165,13 +904,131 @@ class JobManager:
             progress=record.progress,
             result_url=record.result_url,
             metrics=record.metrics,
+            metrics_pending=record.metrics_pending,
             error=record.error,
         )
 
+    @staticmethod
+    def _batch_response(batch: BatchRecord) -> JobStatusResponse:
+        return JobStatusResponse(
+            job_id=batch.batch_id,
+            status=batch.status,
+            progress=batch.progress,
+            result_url=f"/api/batch/{batch.batch_id}/archive" if batch.done and batch.completed else None,
+            error=batch.error,
+            batch=BatchProgress(
+                total=len(batch.job_ids), completed=batch.completed, failed=batch.failed, cancelled=batch.cancelled
+            ),
+        )
 
-<<<<<<< HEAD
-job_manager = JobManager()
-=======
-job_manager = JobManager()
 
->>>>>>> ee3fa41 (chore: update README and UI)
+def _operation_spec(operation: OperationKey) -> List[Any]:
+    # operasi legacy (enum) dibedakan agar replay memakai handler yang sama
+    return [img_ops.operation_name(operation), isinstance(operation, OperationEnum)]
+
+
+def _operation_from_spec(spec: Sequence[Any]) -> OperationKey:
+    name, legacy = spec[0], spec[1]
+    return OperationEnum(name) if legacy else name
+
+
+def _wall_time(loop_time: Optional[float]) -> Optional[float]:
+    if loop_time is None:
+        return None
+    return loop_time + time.time() - asyncio.get_event_loop().time()
+
+
+def _journal_state(record: JobRecord) -> Dict[str, Any]:
+    return {
+        "progress": record.progress,
+        "result_url": record.result_url,
+        "metrics": record.metrics,
+        "metrics_pending": record.metrics_pending,
+        "error": record.error,
+    }
+
+
+def _journal_entry(record: JobRecord) -> JournalJob:
+    spec = {
+        "image_path": str(record.image_path),
+        "operation": _operation_spec(record.operation),
+        "params": record.params,
+        "target_image_id": record.target_image_id,
+        "priority": record.priority,
+        "steps": [_operation_spec(operation) + [params] for operation, params in record.steps],
+        "cache_key": record.cache_key,
+        "encoding": asdict(record.encoding),
+        "metrics_policy": asdict(record.metrics_policy),
+        "timeout": record.timeout,
+    }
+    return JournalJob(
+        record.job_id,
+        record.batch_id,
+        spec,
+        record.status,
+        _journal_state(record),
+        time.time(),
+        None,
+        PRIORITY_ORDER.get(record.priority, 0),
+    )
+
+
+def _batch_from_journal(entry: JournalBatch, offset: float) -> BatchRecord:
+    return BatchRecord(
+        batch_id=entry.batch_id,
+        job_ids=list(entry.spec["job_ids"]),
+        operation=_operation_from_spec(entry.spec["operation"]),
+        started_at=entry.submitted_at - offset,
+    )
+
+
+def _record_from_journal(entry: JournalJob, offset: float, *, live: bool = False) -> JobRecord:
+    """
+    Rebuild a record; ``offset`` maps wall-clock journal times onto the event-loop clock.
+
+    Replay (``live=False``) keeps the state of finished jobs only, since
+    unfinished ones run again; a shared-mode view takes the current state
+    as is.
+    """
+    spec = entry.spec
+    selection = spec["metrics_policy"]
+    record = JobRecord(
+        job_id=entry.job_id,
+        image_path=Path(spec["image_path"]),
+        operation=_operation_from_spec(spec["operation"]),
+        params=spec["params"],
+        target_image_id=spec["target_image_id"],
+        priority=spec["priority"],
+        steps=[(_operation_from_spec(step), step[2]) for step in spec["steps"]],
+        cache_key=spec["cache_key"],
+        encoding=EncodePolicy(**spec["encoding"]),
+        metrics_policy=MetricsPolicy(tuple(selection["names"]), selection["approximate"], selection["deferred"]),
+        timeout=spec.get("timeout"),
+        batch_id=entry.batch_id,
+        started_at=entry.submitted_at - offset,
+    )
+    if live or entry.finished_at is not None:
+        state = entry.state
+        record.status = entry.status  # type: ignore[assignment]
+        record.progress = state["progress"]
+        record.result_url = state["result_url"]
+        record.metrics = state["metrics"]
+        record.metrics_pending = live and state.get("metrics_pending", False)
+        record.error = state["error"]
+        if entry.finished_at is not None:
+            record.finished_at = entry.finished_at - offset
+    return record
+
+
+async def _settle(durable: "Future[None]") -> None:
+    try:
+        await asyncio.wrap_future(durable)
+    except sqlite3.Error:
+        # kegagalan sudah dicatat jurnal; job tetap berjalan, hanya tidak selamat dari restart
+        pass
+
+
+job_manager = JobManager(
+    journal_path=None if JOB_JOURNAL.strip().lower() in {"", "0", "off"} else Path(JOB_JOURNAL),
+    shared=JOB_MODE == "shared",
+)
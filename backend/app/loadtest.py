@@ -0,0 +1,465 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP load generator for the interactive flow: ``python -m app.loadtest``.
+
+Each virtual user repeatedly picks a scenario from the configured mix and
+walks the real API: ``/api/upload``, a sweep of ``/api/preview`` slider
+updates, then (for the process scenarios) ``/api/process``, waiting for the
+job through ``/api/jobs`` polling or ``WS /api/progress/{job_id}``, and
+``/api/download``. Latencies are recorded per step and per scenario and
+reported as p50/p95/p99, requests per second and a latency histogram.
+
+Without ``--url`` the ASGI app runs in-process (its lifespan included) on a
+temporary ``AINTRA_STORAGE``; client and server then share one CPU budget,
+so use in-process numbers to compare changes and ``--url`` against a real
+uvicorn for capacity planning.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import bisect
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Mapping, Optional, Sequence
+
+import cv2
+import httpx
+import numpy as np
+
+from .benchmark import synthetic_image
+from .services import image_ops as registry_ops
+
+logger = logging.getLogger("aintra.loadtest")
+
+SCENARIOS = ("preview", "process_poll", "process_ws")
+DEFAULT_MIX = {"preview": 2.0, "process_poll": 1.0, "process_ws": 1.0}
+# batas atas bucket histogram (ms); bucket terakhir menampung sisanya
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, math.inf)
+FINISHED_STATUSES = frozenset({"completed", "error", "cancelled"})
+
+
+class FlowError(Exception):
+    """A step answered with an error; the rest of the scenario iteration is skipped."""
+
+
+@dataclass
+class LoadConfig:
+    concurrency: int = 4
+    duration: Optional[float] = None
+    iterations: int = 3
+    mix: Mapping[str, float] = field(default_factory=lambda: dict(DEFAULT_MIX))
+    operation: str = "gaussian"
+    previews: int = 8
+    megapixels: float = 1.0
+    poll_interval: float = 0.1
+    job_timeout: float = 120.0
+    seed: int = 0
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """``"preview=2,process_ws=1"`` -> weights; unknown scenarios are rejected."""
+    mix: Dict[str, float] = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Skenario tidak dikenal: {name} (pilihan: {', '.join(SCENARIOS)})")
+        mix[name] = float(weight) if weight.strip() else 1.0
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("Campuran skenario kosong")
+    return mix
+
+
+def slider_values(operation: str, count: int) -> List[Dict[str, Any]]:
+    """Params for a slider drag over the first numeric param: up the range and back (the way back re-hits the cache)."""
+    validator = registry_ops.VALIDATORS.get(registry_ops.normalise_operation_name(operation))
+    if validator is None:
+        raise ValueError(f"Operasi {operation} tidak ada di registry")
+    for param in validator.params:
+        if param.enum is None and isinstance(param.minimum, (int, float)) and isinstance(param.maximum, (int, float)):
+            break
+    else:
+        return [{} for _ in range(count)]
+    half = count // 2 + 1
+    values = []
+    for index in range(half):
+        raw = param.minimum + (param.maximum - param.minimum) * index / max(1, half - 1)
+        if param.step is not None and param.base is not None:
+            raw = param.base + round((raw - param.base) / param.step) * param.step
+        values.append(param(min(max(raw, param.minimum), param.maximum)))
+    sweep = (values + values[-2::-1])[:count]
+    return [{param.name: value} for value in sweep]
+
+
+class Recorder:
+    """Latency samples (seconds) and error counts per step name."""
+
+    def __init__(self) -> None:
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Counter] = defaultdict(Counter)
+
+    def record(self, name: str, seconds: float) -> None:
+        self.samples[name].append(seconds)
+
+    def fail(self, name: str, reason: str) -> None:
+        self.errors[name][reason] += 1
+
+    async def request(self, name: str, send: Callable[[], Any]) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await send()
+        except httpx.HTTPError as exc:
+            self.fail(name, type(exc).__name__)
+            raise FlowError(f"{name}: {exc}") from exc
+        if response.status_code >= 400:
+            self.fail(name, str(response.status_code))
+            raise FlowError(f"{name}: HTTP {response.status_code}")
+        self.record(name, time.perf_counter() - start)
+        return response
+
+
+class _ASGIWebSocket:
+    """Minimal in-process WebSocket client driving the ASGI app directly (httpx has no WebSocket support)."""
+
+    def __init__(self, app: Any, path: str) -> None:
+        self._app = app
+        self._path = path
+        self._to_app: asyncio.Queue = asyncio.Queue()
+        self._from_app: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "_ASGIWebSocket":
+        scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "scheme": "ws",
+            "path": self._path,
+            "raw_path": self._path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(b"host", b"loadtest")],
+            "client": ("127.0.0.1", 0),
+            "server": ("loadtest", 80),
+            "subprotocols": [],
+        }
+        await self._to_app.put({"type": "websocket.connect"})
+        self._task = asyncio.create_task(self._app(scope, self._to_app.get, self._from_app.put))
+        message = await self._from_app.get()
+        if message["type"] != "websocket.accept":
+            await self.__aexit__(None, None, None)
+            raise ConnectionError("WebSocket ditolak server")
+        return self
+
+    async def recv(self) -> str:
+        message = await self._from_app.get()
+        if message["type"] == "websocket.close":
+            raise ConnectionError(f"WebSocket ditutup server ({message.get('code')})")
+        return message.get("text") or message.get("bytes", b"").decode("utf-8")
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self._to_app.put({"type": "websocket.disconnect", "code": 1000})
+        if self._task is not None:
+            # endpoint progres baru melihat disconnect pada send berikutnya: hentikan langsung
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+class Target:
+    """Where requests go: the in-process ASGI app or a running server."""
+
+    def __init__(self, client: httpx.AsyncClient, *, app: Any = None, ws_base: Optional[str] = None) -> None:
+        self.client = client
+        self._app = app
+        self._ws_base = ws_base
+
+    def websocket(self, path: str):
+        if self._app is not None:
+            return _ASGIWebSocket(self._app, path)
+        import websockets
+
+        return websockets.connect(self._ws_base + path)
+
+
+@asynccontextmanager
+async def open_target(url: Optional[str]) -> AsyncIterator[Target]:
+    timeout = httpx.Timeout(300.0)
+    if url:
+        base = url.rstrip("/")
+        ws_base = "ws" + base[len("http") :] if base.startswith("http") else base
+        async with httpx.AsyncClient(base_url=base, timeout=timeout) as client:
+            yield Target(client, ws_base=ws_base)
+        return
+    storage_dir = None
+    if "AINTRA_STORAGE" not in os.environ:
+        # direktori sementara: run in-process tidak mengotori data/ milik server sungguhan
+        storage_dir = tempfile.mkdtemp(prefix="aintra-loadtest-")
+        os.environ["AINTRA_STORAGE"] = storage_dir
+    try:
+        from .main import app
+
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=timeout) as client:
+                yield Target(client, app=app)
+    finally:
+        if storage_dir is not None:
+            os.environ.pop("AINTRA_STORAGE", None)
+            shutil.rmtree(storage_dir, ignore_errors=True)
+
+
+def _encode_upload(base: np.ndarray, serial: int) -> bytes:
+    image = base.copy()
+    # beberapa piksel unik per upload: tiap iterasi menguji komputasi, bukan cache hasil
+    image[0, :8] = np.frombuffer(serial.to_bytes(8, "little"), dtype=np.uint8)[:, None]
+    ok, encoded = cv2.imencode(".png", image)
+    if not ok:
+        raise RuntimeError("Gagal meng-encode citra uji")
+    return encoded.tobytes()
+
+
+class VirtualUser:
+    def __init__(self, index: int, target: Target, config: LoadConfig, recorder: Recorder, base: np.ndarray) -> None:
+        self.index = index
+        self.target = target
+        self.config = config
+        self.recorder = recorder
+        self.base = base
+        self.random = random.Random(config.seed + index)
+        self.headers = {"X-Client-Id": f"loadtest-{index}"}
+        self.sweep = slider_values(config.operation, config.previews)
+        self.serial = 0
+
+    async def upload(self) -> str:
+        self.serial += 1
+        data = await asyncio.to_thread(_encode_upload, self.base, self.index * 1_000_000 + self.serial)
+        files = {"file": (f"loadtest-{self.index}-{self.serial}.png", data, "image/png")}
+        response = await self.recorder.request("upload", lambda: self.target.client.post("/api/upload", files=files))
+        return response.json()["image_id"]
+
+    async def previews(self, image_id: str) -> None:
+        for params in self.sweep:
+            body = {"image_id": image_id, "operation": self.config.operation, "params": params}
+            await self.recorder.request(
+                "preview", lambda: self.target.client.post("/api/preview", json=body, headers=self.headers)
+            )
+
+    async def process(self, image_id: str) -> str:
+        body = {"image_id": image_id, "operation": self.config.operation, "params": self.sweep[-1] if self.sweep else {}}
+        response = await self.recorder.request("process", lambda: self.target.client.post("/api/process", json=body))
+        return response.json()["job_id"]
+
+    async def poll(self, job_id: str) -> Dict[str, Any]:
+        while True:
+            response = await self.recorder.request("jobs_poll", lambda: self.target.client.get(f"/api/jobs/{job_id}"))
+            status = response.json()
+            if status["status"] in FINISHED_STATUSES and not status.get("metrics_pending"):
+                return status
+            await asyncio.sleep(self.config.poll_interval)
+
+    async def watch(self, job_id: str) -> Dict[str, Any]:
+        async with self.target.websocket(f"/api/progress/{job_id}") as websocket:
+            while True:
+                status = json.loads(await websocket.recv())
+                if status["status"] in FINISHED_STATUSES and not status.get("metrics_pending"):
+                    return status
+
+    async def wait(self, job_id: str, via: str) -> None:
+        start = time.perf_counter()
+        try:
+            waiter = self.poll(job_id) if via == "poll" else self.watch(job_id)
+            status = await asyncio.wait_for(waiter, self.config.job_timeout)
+        except asyncio.TimeoutError as exc:
+            self.recorder.fail(f"job_{via}", "timeout")
+            raise FlowError(f"job {job_id} melewati batas tunggu") from exc
+        except (ConnectionError, OSError) as exc:
+            self.recorder.fail(f"job_{via}", type(exc).__name__)
+            raise FlowError(str(exc)) from exc
+        if status["status"] != "completed":
+            self.recorder.fail(f"job_{via}", status["status"])
+            raise FlowError(f"job {job_id}: {status.get('error') or status['status']}")
+        self.recorder.record(f"job_{via}", time.perf_counter() - start)
+
+    async def download(self, job_id: str) -> None:
+        await self.recorder.request("download", lambda: self.target.client.get(f"/api/download/{job_id}"))
+
+    async def scenario(self, name: str) -> None:
+        image_id = await self.upload()
+        await self.previews(image_id)
+        if name == "preview":
+            return
+        job_id = await self.process(image_id)
+        await self.wait(job_id, "poll" if name == "process_poll" else "ws")
+        await self.download(job_id)
+
+    async def run(self, deadline: Optional[float]) -> None:
+        names = list(self.config.mix)
+        weights = [self.config.mix[name] for name in names]
+        iteration = 0
+        while (deadline is None and iteration < self.config.iterations) or (
+            deadline is not None and time.perf_counter() < deadline
+        ):
+            iteration += 1
+            name = self.random.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                await self.scenario(name)
+            except FlowError as exc:
+                self.recorder.fail(f"scenario:{name}", "gagal")
+                logger.debug("User %d, %s: %s", self.index, name, exc)
+                continue
+            self.recorder.record(f"scenario:{name}", time.perf_counter() - start)
+
+
+def _percentile(ordered: Sequence[float], fraction: float) -> float:
+    # nearest-rank: selalu salah satu sampel yang benar-benar terukur
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(recorder: Recorder, elapsed: float) -> Dict[str, Dict[str, Any]]:
+    steps: Dict[str, Dict[str, Any]] = {}
+    for name in sorted(set(recorder.samples) | set(recorder.errors)):
+        ordered = sorted(recorder.samples.get(name, []))
+        errors = recorder.errors.get(name, Counter())
+        entry: Dict[str, Any] = {
+            "count": len(ordered),
+            "errors": sum(errors.values()),
+            "error_reasons": dict(errors),
+            "rps": len(ordered) / elapsed if elapsed > 0 else 0.0,
+        }
+        if ordered:
+            entry.update(
+                {
+                    "mean_ms": sum(ordered) / len(ordered) * 1000,
+                    "p50_ms": _percentile(ordered, 0.50) * 1000,
+                    "p95_ms": _percentile(ordered, 0.95) * 1000,
+                    "p99_ms": _percentile(ordered, 0.99) * 1000,
+                    "max_ms": ordered[-1] * 1000,
+                }
+            )
+        counts = [0] * len(HISTOGRAM_BUCKETS_MS)
+        for value in ordered:
+            counts[bisect.bisect_left(HISTOGRAM_BUCKETS_MS, value * 1000)] += 1
+        entry["histogram_ms"] = {
+            ("+Inf" if math.isinf(upper) else f"{upper:g}"): count for upper, count in zip(HISTOGRAM_BUCKETS_MS, counts)
+        }
+        steps[name] = entry
+    return steps
+
+
+async def run_load(config: LoadConfig, url: Optional[str] = None) -> Dict[str, Any]:
+    """Drive ``config.concurrency`` virtual users against the target and summarise the latencies."""
+    for name in config.mix:
+        if name not in SCENARIOS:
+            raise ValueError(f"Skenario tidak dikenal: {name}")
+    slider_values(config.operation, 1)
+    base = await asyncio.to_thread(synthetic_image, config.megapixels, "bgr", config.seed)
+    recorder = Recorder()
+    async with open_target(url) as target:
+        users = [VirtualUser(index, target, config, recorder, base) for index in range(config.concurrency)]
+        start = time.perf_counter()
+        deadline = start + config.duration if config.duration else None
+        await asyncio.gather(*(user.run(deadline) for user in users))
+        elapsed = time.perf_counter() - start
+    requests = sum(len(samples) for name, samples in recorder.samples.items() if not name.startswith(("scenario:", "job_")))
+    return {
+        "target": url or "in-process",
+        "config": {
+            "concurrency": config.concurrency,
+            "duration": config.duration,
+            "iterations": None if config.duration else config.iterations,
+            "mix": dict(config.mix),
+            "operation": config.operation,
+            "previews": config.previews,
+            "megapixels": config.megapixels,
+        },
+        "elapsed_s": elapsed,
+        "requests": requests,
+        "rps": requests / elapsed if elapsed > 0 else 0.0,
+        "steps": summarize(recorder, elapsed),
+    }
+
+
+def format_report(report: Mapping[str, Any], *, bar_width: int = 40) -> str:
+    lines = [
+        f"target {report['target']}: {report['requests']} request dalam {report['elapsed_s']:.1f} s "
+        f"({report['rps']:.1f} req/s, {report['config']['concurrency']} user)",
+        "",
+        f"{'langkah':<22}{'n':>7}{'err':>6}{'req/s':>9}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}",
+    ]
+    for name, step in report["steps"].items():
+        if step["count"]:
+            timings = "".join(f"{step[key]:>10.1f}" for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms"))
+        else:
+            timings = f"{'-':>10}" * 4
+        lines.append(f"{name:<22}{step['count']:>7}{step['errors']:>6}{step['rps']:>9.2f}{timings}")
+    for name, step in report["steps"].items():
+        if not step["count"]:
+            continue
+        lines.extend(["", f"{name} (ms)"])
+        peak = max(step["histogram_ms"].values())
+        for label, count in step["histogram_ms"].items():
+            if count:
+                bar = "#" * max(1, round(bar_width * count / peak))
+                lines.append(f"  <= {label:>6} {count:>7} {bar}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.loadtest", description="Load test alur upload/preview/process")
+    parser.add_argument("--url", default=None, help="server yang berjalan, mis. http://localhost:8000 (default: in-process)")
+    parser.add_argument("-c", "--concurrency", type=int, default=LoadConfig.concurrency)
+    parser.add_argument("--duration", type=float, default=None, help="detik; tanpa ini tiap user menjalankan --iterations")
+    parser.add_argument("--iterations", type=int, default=LoadConfig.iterations)
+    parser.add_argument("--mix", default=",".join(f"{name}={weight:g}" for name, weight in DEFAULT_MIX.items()))
+    parser.add_argument("--operation", default=LoadConfig.operation)
+    parser.add_argument("--previews", type=int, default=LoadConfig.previews, help="update slider per iterasi")
+    parser.add_argument("--megapixels", type=float, default=LoadConfig.megapixels)
+    parser.add_argument("--poll-ms", type=float, default=LoadConfig.poll_interval * 1000)
+    parser.add_argument("--job-timeout", type=float, default=LoadConfig.job_timeout)
+    parser.add_argument("--seed", type=int, default=LoadConfig.seed)
+    parser.add_argument("-o", "--output", type=Path, default=None, help="tulis laporan JSON")
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error("--concurrency minimal 1")
+    try:
+        config = LoadConfig(
+            concurrency=args.concurrency,
+            duration=args.duration,
+            iterations=args.iterations,
+            mix=parse_mix(args.mix),
+            operation=args.operation,
+            previews=args.previews,
+            megapixels=args.megapixels,
+            poll_interval=args.poll_ms / 1000,
+            job_timeout=args.job_timeout,
+            seed=args.seed,
+        )
+        report = asyncio.run(run_load(config, args.url))
+    except ValueError as exc:
+        parser.error(str(exc))
+    print(format_report(report))
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    # satu baris log per request httpx menenggelamkan laporan
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    sys.exit(main())
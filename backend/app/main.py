@@ -2,29 +2,36 @@
 from __future__ import annotations
 
 import asyncio
-<<<<<<< HEAD
 import base64
-=======
-import cv2
->>>>>>> ee3fa41 (chore: update README and UI)
+import json
 import os
 import time
 from contextlib import asynccontextmanager
-from typing import Dict, List, Optional
+from pathlib import Path
+from typing import Any, Dict, List, Literal, Optional, Tuple
 
-from fastapi import FastAPI, File, HTTPException, UploadFile, WebSocket, WebSocketDisconnect
-<<<<<<< HEAD
-=======
-from fastapi.responses import FileResponse, Response
->>>>>>> ee3fa41 (chore: update README and UI)
+import cv2
+import numpy as np
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 
-from . import img_ops, storage
-from .job_manager import job_manager
+from . import archive, encoders, histograms, img_ops, storage, telemetry
+from .encoders import EncodePolicy
+from .image_cache import image_cache
+from .cancellation import LatestWins
+from .executors import wait_cancellable
+from .job_manager import FINISHED_STATUSES, QueueFullError, job_manager
+from .result_cache import CachedResult, make_key, result_cache
 from .schemas import (
+    MAX_BATCH_IMAGES,
+    BatchRequest,
+    BatchResponse,
     HealthResponse,
+    HistogramResponse,
     JobStatusResponse,
     OperationEnum,
+    PipelineRequest,
     PreviewRequest,
     PreviewResponse,
     ProcessRequest,
@@ -33,6 +40,10 @@ from .schemas import (
     UploadResponse,
 )
 from .security import setup_security
+from .services import metrics as quality_metrics
+from .services import progress
+from .services.progress import DeadlineExceeded, OperationCancelled
+from .subscriptions import Subscription
 
 # CORS yang diizinkan (pisahkan dengan koma), contoh: "http://localhost:3000,http://127.0.0.1:3000"
 ALLOWED_ORIGINS: List[str] = os.getenv(
@@ -41,13 +52,25 @@ ALLOWED_ORIGINS: List[str] = os.getenv(
 ).split(",")
 
 START_TIME = time.monotonic()
+# lebar maksimum preview; ikut menjadi bagian kunci cache preview
+PREVIEW_MAX_WIDTH = 640
+# batas waktu komputasi satu preview (detik); 0 menonaktifkan
+PREVIEW_TIMEOUT = max(0.0, float(os.getenv("AINTRA_PREVIEW_TIMEOUT_SECONDS", "30")))
+# preview per (klien, citra): request baru membatalkan yang lama
+preview_gate = LatestWins()
+# batas job/batch yang boleh dipantau satu koneksi /api/progress
+WS_MAX_SUBSCRIPTIONS = max(1, int(os.getenv("AINTRA_WS_MAX_SUBSCRIPTIONS", "1000")))
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # pool default (to_thread: preview, I/O) dilacak agar saturasinya terlihat di /metrics
+    asyncio.get_running_loop().set_default_executor(telemetry.TrackedThreadPool(pool="default"))
     # bersihkan file kedaluwarsa saat start
     await asyncio.to_thread(storage.cleanup_expired)
+    await job_manager.start()
     yield
+    await job_manager.stop()
 
 
 app = FastAPI(
@@ -66,21 +89,36 @@ app.mount("/media", StaticFiles(directory=storage.STORAGE_ROOT, check_dir=False)
 
 
 # ------ util ops schema untuk FE ------
+# registry tetap selama proses hidup: klien selalu revalidasi (ETag) dan menerima 304
+REGISTRY_CACHE_CONTROL = "public, no-cache"
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison as required for ``If-None-Match`` (RFC 9110 13.1.2)."""
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
 @app.get("/api/ops/registry")
-async def ops_registry():
+async def ops_registry(request: Request) -> Response:
     """
     Provide the full registry of image operations for the frontend.
 
     Returning an object with the `ops` key keeps the response extensible
-    (e.g. we can append metadata later without breaking clients).
+    (e.g. we can append metadata later without breaking clients). The body
+    is serialized once at import; see ``REGISTRY_PAYLOAD``.
     """
-    return {"ops": img_ops.list_operations()}
+    headers = {"ETag": img_ops.REGISTRY_ETAG, "Cache-Control": REGISTRY_CACHE_CONTROL}
+    if _etag_matches(request.headers.get("if-none-match", ""), img_ops.REGISTRY_ETAG):
+        return Response(status_code=304, headers=headers)
+    return Response(content=img_ops.REGISTRY_PAYLOAD, media_type="application/json", headers=headers)
 
 
 # Back-compat alias
 @app.get("/api/operations")
-async def list_operations():
-    return await ops_registry()
+async def list_operations(request: Request) -> Response:
+    return await ops_registry(request)
 
 
 # ------ upload ------
@@ -90,6 +128,29 @@ async def upload_image(file: UploadFile = File(...)) -> UploadResponse:
         stored = await storage.save_upload(file)
     except storage.StorageError as exc:
         raise HTTPException(status_code=exc.status_code, detail=exc.detail) from exc
+    telemetry.UPLOADS.inc()
+    telemetry.UPLOAD_BYTES.inc(stored.size)
+    return _upload_response(stored)
+
+
+@app.post("/api/upload/batch", response_model=List[UploadResponse])
+async def upload_images(files: List[UploadFile] = File(...)) -> List[UploadResponse]:
+    """Upload a folder's worth of images in one request (e.g. ``<input webkitdirectory>``)."""
+    if len(files) > MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=413, detail=f"Maksimal {MAX_BATCH_IMAGES} file per batch")
+    uploaded: List[UploadResponse] = []
+    for file in files:
+        try:
+            stored = await storage.save_upload(file)
+        except storage.StorageError as exc:
+            raise HTTPException(status_code=exc.status_code, detail=f"{file.filename}: {exc.detail}") from exc
+        telemetry.UPLOADS.inc()
+        telemetry.UPLOAD_BYTES.inc(stored.size)
+        uploaded.append(_upload_response(stored))
+    return uploaded
+
+
+def _upload_response(stored: storage.StoredImage) -> UploadResponse:
     return UploadResponse(
         image_id=stored.image_id,
         filename=stored.filename,
@@ -98,105 +159,434 @@ async def upload_image(file: UploadFile = File(...)) -> UploadResponse:
     )
 
 
-# ------ preview cepat (resolusi kecil) ------
-@app.post("/api/preview", response_model=PreviewResponse)
-async def preview_image(payload: PreviewRequest):
+# ------ util target histogram-match & pipeline ------
+def _needs_target(operations) -> bool:
+    return any(operation == OperationEnum.HISTOGRAM_MATCH for operation in operations)
+
+
+def _get_upload(image_id: str) -> storage.StoredImage:
+    # lookup SQLite + stat file: panggil lewat asyncio.to_thread, bukan langsung di event loop
     try:
-        stored = storage.get_upload(payload.image_id)
-        original = await asyncio.to_thread(img_ops.load_image, stored.path)
+        return image_cache.get_upload(image_id)
+    except storage.StorageError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=exc.detail) from exc
+
+
+async def _load_upload(image_id: str) -> storage.StoredImage:
+    return await asyncio.to_thread(_get_upload, image_id)
+
+
+async def _require_target(operations, target_image_id: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Validate the histogram-match target; returns (target_image_id, target sha256) or (None, None)."""
+    if not _needs_target(operations):
+        return None, None
+    if not target_image_id:
+        raise HTTPException(status_code=400, detail="target_image_id wajib diisi untuk histogram-match")
+    target = await _load_upload(target_image_id)
+    return target_image_id, target.sha256
+
+
+async def _load_target_image(operations, target_image_id: Optional[str]):
+    if not _needs_target(operations):
+        return None
+    if not target_image_id:
+        raise HTTPException(status_code=400, detail="target_image_id wajib diisi untuk histogram-match")
+    try:
+        _, target = await asyncio.to_thread(image_cache.load, target_image_id)
+        return target
     except storage.StorageError as exc:
         raise HTTPException(status_code=exc.status_code, detail=exc.detail) from exc
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
-<<<<<<< HEAD
+
+def _resolve_pipeline(payload: PipelineRequest):
     try:
-        params_validated = img_ops.prepare_operation_params(payload.operation, payload.params)
-        canonical_op = img_ops.canonical_operation_id(payload.operation)
+        return img_ops.resolve_pipeline([(step.operation, step.params) for step in payload.steps])
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
-    preview = await asyncio.to_thread(
-        img_ops.generate_preview,
-        original,
-        canonical_op,
-        params_validated,
-    )
-    metrics = await asyncio.to_thread(img_ops.compute_metrics, original, preview)
-    preview_b64 = await asyncio.to_thread(img_ops.encode_png_b64, preview)
-    operation_id = canonical_op
+
+def _cache_key(
+    stored: storage.StoredImage,
+    operation_id: str,
+    params: Dict[str, Any],
+    target_hash: Optional[str],
+    variant: str,
+) -> Optional[str]:
+    if not stored.sha256:
+        return None
+    return make_key(stored.sha256, operation_id, params, variant=variant, target_hash=target_hash)
+
+
+def _pipeline_cache_params(steps) -> Dict[str, Any]:
+    return {"steps": [[img_ops.operation_name(operation), params] for operation, params in steps]}
+
+
+def _wants_binary(request: Request) -> bool:
+    """Binary mode when the client asks for image/* and does not list JSON in ``Accept``."""
+    accept = request.headers.get("accept", "").lower()
+    return "image/" in accept and "application/json" not in accept
+
+
+async def _cached_preview(key: Optional[str]) -> Optional[CachedResult]:
+    if key is None:
+        return None
+    return await asyncio.to_thread(result_cache.get, key)
+
+
+def _metrics_policy(payload, *, deferred: bool = False) -> quality_metrics.MetricsPolicy:
+    return quality_metrics.policy(payload.metrics, approximate=payload.approx_metrics, deferred=deferred)
+
+
+def _preview_policy(request: Request, requested: Optional[str]) -> EncodePolicy:
+    return encoders.negotiate(encoders.PREVIEW_POLICY, requested, request.headers.get("accept", ""))
+
+
+def _result_policy(request: Request, requested: Optional[str]) -> EncodePolicy:
+    return encoders.negotiate(encoders.RESULT_POLICY, requested, request.headers.get("accept", ""))
+
+
+async def _encode_preview(
+    key: Optional[str],
+    preview,
+    metrics: Dict[str, float],
+    policy: EncodePolicy,
+) -> bytes:
+    # encode sekali: byte yang sama dipakai untuk file preview, respons, dan cache
+    with telemetry.STAGE_SECONDS.time("preview", "encode"):
+        encoded, encode_ms = await asyncio.to_thread(encoders.encode, preview, policy)
+    if key is not None:
+        await asyncio.to_thread(result_cache.put, key, encoded, dict(metrics) or None, policy.media_type)
+    metrics["encode_ms"] = encode_ms
+    return encoded
+
+
+def _preview_scope(request: Request, image_id: str) -> Tuple[str, str]:
+    # X-Client-Id membedakan tab/pengguna di balik alamat yang sama
+    client = request.headers.get("x-client-id") or (request.client.host if request.client else "")
+    return client, image_id
+
+
+@asynccontextmanager
+async def _latest_preview(request: Request, image_id: str):
+    """Scope preview work: a newer request for the same image, a disconnect or the deadline abandons it."""
+    scope = _preview_scope(request, image_id)
+    token = preview_gate.enter(scope, PREVIEW_TIMEOUT)
+    try:
+        yield token
+    except DeadlineExceeded as exc:
+        raise HTTPException(status_code=504, detail=str(exc)) from exc
+    except OperationCancelled as exc:
+        # digantikan request baru (klien yang terputus tidak menerima respons apa pun)
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+    finally:
+        preview_gate.leave(scope, token)
+
+
+async def _guarded(request: Request, token: progress.CancelToken, func, *args, **kwargs):
+    future = asyncio.ensure_future(asyncio.to_thread(progress.guarded, token, func, *args, **kwargs))
+    return await wait_cancellable(future, token, probe=request.is_disconnected)
+
+
+async def _preview_response(
+    request: Request,
+    image_id: str,
+    suffix: str,
+    operation_id: str,
+    data: bytes,
+    metrics: Optional[Dict[str, float]],
+    policy: EncodePolicy,
+):
+    media_type = policy.media_type
+    with telemetry.STAGE_SECONDS.time("preview", "write"):
+        preview_url = await asyncio.to_thread(storage.save_preview_bytes, image_id, data, suffix, policy.extension)
+    if _wants_binary(request):
+        # byte mentah + metrik di header: tanpa overhead base64 (~33%) dan serialisasi JSON
+        return Response(
+            content=data,
+            media_type=media_type,
+            headers={
+                "X-Image-Id": image_id,
+                "X-Operation": operation_id,
+                "X-Preview-Url": preview_url,
+                "X-Metrics": json.dumps(metrics or {}, separators=(",", ":")),
+            },
+        )
     return PreviewResponse(
-        image_id=payload.image_id,
+        image_id=image_id,
         operation=operation_id,
-        result_b64=preview_b64,
-        metrics=metrics or None,
+        result_b64=base64.b64encode(data).decode("ascii"),
+        media_type=media_type,
+        preview_url=preview_url,
+        metrics=metrics,
     )
-=======
-    target_image = None
-    if payload.operation == OperationEnum.HISTOGRAM_MATCH:
-        if not payload.target_image_id:
-            raise HTTPException(status_code=400, detail="target_image_id wajib diisi untuk histogram-match")
+
+
+# ------ preview cepat (resolusi kecil) ------
+@app.post("/api/preview", response_model=PreviewResponse)
+async def preview_image(payload: PreviewRequest, request: Request):
+    stored = await _load_upload(payload.image_id)
+
+    try:
+        operation, params = img_ops.resolve_operation(payload.operation, payload.params)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+    operation_id = img_ops.operation_name(operation)
+    _, target_hash = await _require_target([operation], payload.target_image_id)
+    policy = _preview_policy(request, payload.format)
+    selection = _metrics_policy(payload)
+    key = _cache_key(
+        stored, operation_id, params, target_hash, f"preview:{PREVIEW_MAX_WIDTH}:{policy.tag}:{selection.tag}"
+    )
+    async with _latest_preview(request, payload.image_id) as token:
+        cached = await _cached_preview(key)
+        if cached is not None:
+            return await _preview_response(
+                request, payload.image_id, operation_id, operation_id, cached.data, cached.metrics, policy
+            )
+
         try:
-            target_stored = storage.get_upload(payload.target_image_id)
-            target_image = await asyncio.to_thread(img_ops.load_image, target_stored.path)
+            # level piramida terkecil yang >= lebar preview, bukan citra asli
+            with telemetry.STAGE_SECONDS.time("preview", "decode"):
+                _, base = await asyncio.to_thread(image_cache.load_preview, payload.image_id, PREVIEW_MAX_WIDTH)
         except storage.StorageError as exc:
             raise HTTPException(status_code=exc.status_code, detail=exc.detail) from exc
         except ValueError as exc:
             raise HTTPException(status_code=400, detail=str(exc)) from exc
+        target_image = await _load_target_image([operation], payload.target_image_id)
 
-    preview, op_metrics = await asyncio.to_thread(
-        img_ops.generate_preview,
-        original,
-        payload.operation,
-        payload.params,
-        target=target_image,
-    )
-    preview_url = await asyncio.to_thread(
-        storage.save_preview,
-        payload.image_id,
-        preview,
-        payload.operation.value if hasattr(payload.operation, "value") else str(payload.operation),
-    )
-    metrics = await asyncio.to_thread(img_ops.compute_metrics, original, preview)
-    merged_metrics: Dict[str, float] = {}
-    if metrics:
-        merged_metrics.update(metrics)
-    if op_metrics:
-        merged_metrics.update(op_metrics)
-    return PreviewResponse(preview_url=preview_url, metrics=merged_metrics or None)
->>>>>>> ee3fa41 (chore: update README and UI)
+        try:
+            with telemetry.STAGE_SECONDS.time("preview", "compute"):
+                preview, op_metrics = await _guarded(
+                    request,
+                    token,
+                    img_ops.generate_preview,
+                    base,
+                    operation,
+                    params,
+                    max_width=PREVIEW_MAX_WIDTH,
+                    target=target_image,
+                )
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        with telemetry.STAGE_SECONDS.time("preview", "metrics"):
+            metrics = await _guarded(request, token, img_ops.compute_metrics, base, preview, selection)
+        merged_metrics: Dict[str, float] = {}
+        if metrics:
+            merged_metrics.update(metrics)
+        if op_metrics:
+            merged_metrics.update(op_metrics)
+        encoded = await _encode_preview(key, preview, merged_metrics, policy)
+        return await _preview_response(
+            request, payload.image_id, operation_id, operation_id, encoded, merged_metrics, policy
+        )
 
 
 # ------ submit proses penuh (background melalui job_manager) ------
 @app.post("/api/process", response_model=ProcessResponse)
-async def process_image(payload: ProcessRequest) -> ProcessResponse:
+async def process_image(payload: ProcessRequest, request: Request) -> ProcessResponse:
+    stored = await _load_upload(payload.image_id)
+    target_image_id, target_hash = await _require_target([payload.operation], payload.target_image_id)
+
     try:
-        stored = storage.get_upload(payload.image_id)
-    except storage.StorageError as exc:
-        raise HTTPException(status_code=exc.status_code, detail=exc.detail) from exc
-    target_image_id: Optional[str] = None
-    if payload.operation == OperationEnum.HISTOGRAM_MATCH:
-        if not payload.target_image_id:
-            raise HTTPException(status_code=400, detail="target_image_id wajib diisi untuk histogram-match")
+        operation, params = img_ops.resolve_operation(payload.operation, payload.params)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+    policy = _result_policy(request, payload.format)
+    selection = _metrics_policy(payload, deferred=payload.defer_metrics)
+    try:
+        record = await job_manager.submit(
+            stored.path,
+            operation,
+            params,
+            target_image_id,
+            priority=payload.priority,
+            cache_key=_cache_key(
+                stored,
+                img_ops.operation_name(operation),
+                params,
+                target_hash,
+                f"result:{policy.tag}:{selection.tag}",
+            ),
+            encoding=policy,
+            metrics_policy=selection,
+            timeout=payload.timeout_seconds,
+        )
+    except QueueFullError as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "2"}) from exc
+    # nilai ETA hanya indikatif; FE tetap gunakan polling / WS
+    return ProcessResponse(job_id=record.job_id, status=record.status, eta_ms=1200)
+
+
+# ------ pipeline: beberapa operasi berurutan pada satu array ------
+@app.post("/api/pipeline/preview", response_model=PreviewResponse)
+async def preview_pipeline(payload: PipelineRequest, request: Request):
+    steps = _resolve_pipeline(payload)
+    stored = await _load_upload(payload.image_id)
+    operation_id = img_ops.pipeline_name(steps)
+    _, target_hash = await _require_target([operation for operation, _ in steps], payload.target_image_id)
+    policy = _preview_policy(request, payload.format)
+    selection = _metrics_policy(payload)
+    key = _cache_key(
+        stored,
+        "pipeline",
+        _pipeline_cache_params(steps),
+        target_hash,
+        f"preview:{PREVIEW_MAX_WIDTH}:{policy.tag}:{selection.tag}",
+    )
+    async with _latest_preview(request, payload.image_id) as token:
+        cached = await _cached_preview(key)
+        if cached is not None:
+            return await _preview_response(
+                request, payload.image_id, "pipeline", operation_id, cached.data, cached.metrics, policy
+            )
+
         try:
-            storage.get_upload(payload.target_image_id)
-            target_image_id = payload.target_image_id
+            # level piramida terkecil yang >= lebar preview, bukan citra asli
+            with telemetry.STAGE_SECONDS.time("preview", "decode"):
+                _, base = await asyncio.to_thread(image_cache.load_preview, payload.image_id, PREVIEW_MAX_WIDTH)
         except storage.StorageError as exc:
             raise HTTPException(status_code=exc.status_code, detail=exc.detail) from exc
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        target_image = await _load_target_image([operation for operation, _ in steps], payload.target_image_id)
 
-<<<<<<< HEAD
+        try:
+            with telemetry.STAGE_SECONDS.time("preview", "compute"):
+                preview, op_metrics = await _guarded(
+                    request,
+                    token,
+                    img_ops.generate_pipeline_preview,
+                    base,
+                    steps,
+                    max_width=PREVIEW_MAX_WIDTH,
+                    target=target_image,
+                )
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        with telemetry.STAGE_SECONDS.time("preview", "metrics"):
+            metrics = await _guarded(request, token, img_ops.compute_metrics, base, preview, selection)
+        merged_metrics: Dict[str, float] = {}
+        if metrics:
+            merged_metrics.update(metrics)
+        if op_metrics:
+            merged_metrics.update(op_metrics)
+        encoded = await _encode_preview(key, preview, merged_metrics, policy)
+        return await _preview_response(
+            request, payload.image_id, "pipeline", operation_id, encoded, merged_metrics, policy
+        )
+
+
+@app.post("/api/pipeline/process", response_model=ProcessResponse)
+async def process_pipeline(payload: PipelineRequest, request: Request) -> ProcessResponse:
+    steps = _resolve_pipeline(payload)
+    stored = await _load_upload(payload.image_id)
+    target_image_id, target_hash = await _require_target([operation for operation, _ in steps], payload.target_image_id)
+
+    policy = _result_policy(request, payload.format)
+    selection = _metrics_policy(payload, deferred=payload.defer_metrics)
     try:
-        params_validated = img_ops.prepare_operation_params(payload.operation, payload.params)
-        canonical_op = img_ops.canonical_operation_id(payload.operation)
+        record = await job_manager.submit(
+            stored.path,
+            img_ops.pipeline_name(steps),
+            {},
+            target_image_id,
+            priority=payload.priority,
+            steps=steps,
+            cache_key=_cache_key(
+                stored,
+                "pipeline",
+                _pipeline_cache_params(steps),
+                target_hash,
+                f"result:{policy.tag}:{selection.tag}",
+            ),
+            encoding=policy,
+            metrics_policy=selection,
+            timeout=payload.timeout_seconds,
+        )
+    except QueueFullError as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "2"}) from exc
+    return ProcessResponse(job_id=record.job_id, status=record.status, eta_ms=1200 * len(steps))
+
+
+# ------ batch: satu operasi untuk banyak citra ------
+@app.post("/api/batch", response_model=BatchResponse)
+async def process_batch(payload: BatchRequest, request: Request) -> BatchResponse:
+    # parameter divalidasi sekali untuk seluruh batch
+    try:
+        operation, params = img_ops.resolve_operation(payload.operation, payload.params)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
+    target_image_id, target_hash = await _require_target([payload.operation], payload.target_image_id)
+    policy = _result_policy(request, payload.format)
+    selection = _metrics_policy(payload, deferred=payload.defer_metrics)
+    variant = f"result:{policy.tag}:{selection.tag}"
+    operation_id = img_ops.operation_name(operation)
+
+    def batch_items():
+        # sampai MAX_BATCH_IMAGES lookup: dijalankan sekali di thread, bukan di event loop
+        items = []
+        for image_id in payload.image_ids:
+            try:
+                stored = image_cache.get_upload(image_id)
+            except storage.StorageError as exc:
+                raise HTTPException(status_code=exc.status_code, detail=f"{image_id}: {exc.detail}") from exc
+            items.append((stored.path, _cache_key(stored, operation_id, params, target_hash, variant)))
+        return items
+
+    items = await asyncio.to_thread(batch_items)
+    batch = await job_manager.submit_batch(
+        items,
+        operation,
+        params,
+        target_image_id,
+        priority=payload.priority,
+        encoding=policy,
+        metrics_policy=selection,
+        timeout=payload.timeout_seconds,
+    )
+    return BatchResponse(batch_id=batch.batch_id, status=batch.status, total=len(batch.job_ids), job_ids=batch.job_ids)
 
-    record = await job_manager.submit(stored.path, canonical_op, params_validated)
-=======
-    record = await job_manager.submit(stored.path, payload.operation, payload.params, target_image_id)
->>>>>>> ee3fa41 (chore: update README and UI)
-    # nilai ETA hanya indikatif; FE tetap gunakan polling / WS
-    return ProcessResponse(job_id=record.job_id, status=record.status, eta_ms=1200)
+
+def _archive_entries(records) -> List[archive.ArchiveEntry]:
+    entries: List[archive.ArchiveEntry] = []
+    for index, record in enumerate(records, 1):
+        if record.status != "completed":
+            continue
+        try:
+            path = storage.get_result_path(record.job_id)
+        except storage.StorageError:
+            continue
+        image_id = record.image_path.stem
+        try:
+            name = Path(storage.get_upload(image_id).filename).stem or image_id
+        except storage.StorageError:
+            name = image_id
+        # nomor urut mencegah nama bentrok antar file asal yang sama
+        entries.append((f"{index:04d}_{name}{path.suffix}", path))
+    return entries
+
+
+@app.get("/api/batch/{batch_id}/archive")
+async def download_batch(batch_id: str, format: Literal["zip", "tar"] = "zip"):
+    try:
+        batch, records = await job_manager.get_batch(batch_id)
+    except KeyError as exc:
+        raise HTTPException(status_code=404, detail="Batch tidak ditemukan") from exc
+    if not batch.done:
+        raise HTTPException(status_code=409, detail="Batch belum selesai diproses")
+    entries = await asyncio.to_thread(_archive_entries, records)
+    if not entries:
+        raise HTTPException(status_code=404, detail="Tidak ada hasil batch yang bisa diunduh")
+    # generator sinkron: Starlette menjalankannya di threadpool, arsip tidak pernah utuh di memori
+    return StreamingResponse(
+        archive.iter_archive(format, entries),
+        media_type=archive.ARCHIVE_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="batch-{batch_id}.{format}"'},
+    )
 
 
 # ------ polling status job ------
@@ -208,44 +598,109 @@ async def get_job_status(job_id: str) -> JobStatusResponse:
         raise HTTPException(status_code=404, detail="Job tidak ditemukan") from exc
 
 
+@app.post("/api/jobs/{job_id}/cancel", response_model=JobStatusResponse)
+async def cancel_job(job_id: str) -> JobStatusResponse:
+    """Cancel a job or every unfinished member of a batch; finished jobs are returned unchanged."""
+    try:
+        return await job_manager.cancel(job_id)
+    except KeyError as exc:
+        raise HTTPException(status_code=404, detail="Job tidak ditemukan") from exc
+
+
 # ------ unduh hasil final ------
-@app.get("/api/download/{job_id}", response_model=DownloadResponse)
-async def download_result(job_id: str):
+@app.get(
+    "/api/download/{job_id}",
+    responses={
+        200: {
+            "content": {
+                "image/png": {},
+                "image/webp": {},
+                "image/jpeg": {},
+                "application/json": {"schema": DownloadResponse.model_json_schema()},
+            }
+        }
+    },
+)
+async def download_result(job_id: str, request: Request):
     try:
-        path = storage.get_result_path(job_id)
+        path = await asyncio.to_thread(storage.get_result_path, job_id)
     except storage.StorageError as exc:
         raise HTTPException(status_code=exc.status_code, detail=exc.detail) from exc
-    data = await asyncio.to_thread(path.read_bytes)
-    return DownloadResponse(job_id=job_id, b64=base64.b64encode(data).decode("ascii"))
-
-
-# ------ export histogram images ------
-@app.get("/api/histogram/upload/{image_id}")
-async def histogram_upload(image_id: str, mode: str = "rgb") -> Response:
+    accept = request.headers.get("accept", "").lower()
+    if "application/json" in accept and "image/" not in accept:
+        # mode lama (base64 dalam JSON) hanya bila klien meminta JSON secara eksplisit
+        data = await asyncio.to_thread(path.read_bytes)
+        return DownloadResponse(job_id=job_id, b64=base64.b64encode(data).decode("ascii"))
+    # FileResponse men-stream file dan mendukung header Range (unduhan bisa dilanjutkan)
+    return FileResponse(path, media_type=encoders.media_type_for(path), filename=path.name)
+
+
+# ------ histogram: data tersimpan saat ingest, render tanpa decode ulang ------
+def _upload_histogram(image_id: str) -> np.ndarray:
+    image_cache.get_upload(image_id)
+    counts = storage.load_histogram(storage.UPLOAD_DIR, image_id)
+    if counts is None:
+        # upload yang belum pernah di-decode (belum ada preview): decode sekali lalu simpan
+        _, image = image_cache.load(image_id)
+        counts = storage.store_histogram(storage.UPLOAD_DIR, image_id, image)
+    return counts
+
+
+def _result_histogram(job_id: str) -> np.ndarray:
+    path = storage.get_result_path(job_id)
+    counts = storage.load_histogram(storage.RESULT_DIR, job_id)
+    if counts is None:
+        # hasil dari cache hit: histogram belum pernah dihitung
+        counts = storage.store_histogram(storage.RESULT_DIR, job_id, img_ops.load_image(path))
+    return counts
+
+
+async def _histogram_counts(loader, key: str) -> np.ndarray:
     try:
-        stored = storage.get_upload(image_id)
-        image = await asyncio.to_thread(img_ops.load_image, stored.path)
-        hist_img = await asyncio.to_thread(img_ops.render_histogram_image, image, mode)
+        return await asyncio.to_thread(loader, key)
     except storage.StorageError as exc:
         raise HTTPException(status_code=exc.status_code, detail=exc.detail) from exc
-    ok, buf = cv2.imencode(".png", hist_img)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+def _histogram_png(counts: np.ndarray, mode: str) -> Response:
+    ok, buf = cv2.imencode(".png", histograms.render(counts, mode))
     if not ok:
         raise HTTPException(status_code=500, detail="Gagal membuat histogram")
     return Response(content=buf.tobytes(), media_type="image/png")
 
 
+def _histogram_data(counts: np.ndarray, request: Request):
+    accept = request.headers.get("accept", "").lower()
+    if "application/octet-stream" in accept and "application/json" not in accept:
+        # biner: uint32 little-endian, baris sesuai X-Histogram-Channels, 256 bin per baris
+        return Response(
+            content=counts.astype("<u4").tobytes(),
+            media_type="application/octet-stream",
+            headers={"X-Histogram-Channels": ",".join(histograms.channel_names(counts))},
+        )
+    return HistogramResponse(**histograms.to_payload(counts))
+
+
+@app.get("/api/histogram/upload/{image_id}")
+async def histogram_upload(image_id: str, mode: str = "rgb") -> Response:
+    return _histogram_png(await _histogram_counts(_upload_histogram, image_id), mode)
+
+
 @app.get("/api/histogram/result/{job_id}")
 async def histogram_result(job_id: str, mode: str = "rgb") -> Response:
-    try:
-        path = storage.get_result_path(job_id)
-        image = await asyncio.to_thread(img_ops.load_image, path)
-        hist_img = await asyncio.to_thread(img_ops.render_histogram_image, image, mode)
-    except storage.StorageError as exc:
-        raise HTTPException(status_code=exc.status_code, detail=exc.detail) from exc
-    ok, buf = cv2.imencode(".png", hist_img)
-    if not ok:
-        raise HTTPException(status_code=500, detail="Gagal membuat histogram")
-    return Response(content=buf.tobytes(), media_type="image/png")
+    return _histogram_png(await _histogram_counts(_result_histogram, job_id), mode)
+
+
+@app.get("/api/histogram/upload/{image_id}/data", response_model=HistogramResponse)
+async def histogram_upload_data(image_id: str, request: Request):
+    return _histogram_data(await _histogram_counts(_upload_histogram, image_id), request)
+
+
+@app.get("/api/histogram/result/{job_id}/data", response_model=HistogramResponse)
+async def histogram_result_data(job_id: str, request: Request):
+    return _histogram_data(await _histogram_counts(_result_histogram, job_id), request)
 
 
 # ------ progres realtime via WebSocket ------
@@ -253,25 +708,108 @@ async def histogram_result(job_id: str, mode: str = "rgb") -> Response:
 async def websocket_progress(websocket: WebSocket, job_id: str) -> None:
     await websocket.accept()
     try:
-        queue = await job_manager.subscribe(job_id)
+        subscription = await job_manager.subscribe(job_id)
     except KeyError:
         await websocket.send_json({"status": "error", "error": "Job tidak ditemukan"})
         await websocket.close(code=4404)
         return
 
+    telemetry.WEBSOCKET_CONNECTIONS.inc()
     try:
         while True:
-            update = await queue.get()
+            # selama send lambat, update berikutnya saling menimpa: yang dikirim selalu status terbaru
+            update = await subscription.get()
             await websocket.send_json(update.model_dump())
     except WebSocketDisconnect:
         pass
     finally:
-        await job_manager.unsubscribe(job_id, queue)
+        telemetry.WEBSOCKET_CONNECTIONS.dec()
+        await job_manager.unsubscribe(job_id, subscription)
+
+
+def _finished(update: JobStatusResponse) -> bool:
+    return update.status in FINISHED_STATUSES and not update.metrics_pending
+
+
+async def _progress_commands(websocket: WebSocket, subscription: Subscription) -> None:
+    """Apply ``{"subscribe": [...]}`` / ``{"unsubscribe": [...]}`` messages from the client."""
+    while True:
+        try:
+            message = json.loads(await websocket.receive_text())
+        except ValueError:
+            message = None
+        if not isinstance(message, dict):
+            await websocket.send_json({"errors": {"": "Pesan harus berupa objek JSON"}})
+            continue
+        errors: Dict[str, str] = {}
+        for job_id in message.get("unsubscribe") or []:
+            await job_manager.unsubscribe(str(job_id), subscription)
+        for job_id in message.get("subscribe") or []:
+            job_id = str(job_id)
+            if job_id in subscription.keys:
+                continue
+            if len(subscription.keys) >= WS_MAX_SUBSCRIPTIONS:
+                errors[job_id] = f"Maksimal {WS_MAX_SUBSCRIPTIONS} job per koneksi"
+                continue
+            try:
+                await job_manager.subscribe(job_id, subscription)
+            except KeyError:
+                errors[job_id] = "Job tidak ditemukan"
+        if errors:
+            await websocket.send_json({"errors": errors})
+
+
+async def _progress_updates(websocket: WebSocket, subscription: Subscription) -> None:
+    while True:
+        # satu frame berisi status terbaru setiap job yang berubah sejak frame sebelumnya
+        updates = await subscription.drain()
+        await websocket.send_json({"updates": [update.model_dump() for update in updates]})
+        for update in updates:
+            if _finished(update):
+                await job_manager.unsubscribe(update.job_id, subscription)
+
+
+@app.websocket("/api/progress")
+async def websocket_progress_multiplexed(websocket: WebSocket) -> None:
+    """One socket for many jobs/batches; updates are coalesced per job and sent in batches."""
+    await websocket.accept()
+    telemetry.WEBSOCKET_CONNECTIONS.inc()
+    subscription = Subscription()
+    tasks = [
+        asyncio.create_task(_progress_commands(websocket, subscription)),
+        asyncio.create_task(_progress_updates(websocket, subscription)),
+    ]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            error = task.exception()
+            if error is not None and not isinstance(error, WebSocketDisconnect):
+                raise error
+    finally:
+        telemetry.WEBSOCKET_CONNECTIONS.dec()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for job_id in list(subscription.keys):
+            await job_manager.unsubscribe(job_id, subscription)
 
 
 # ------ health ------
 @app.get("/api/health", response_model=HealthResponse)
 async def health_check() -> HealthResponse:
     uptime = time.monotonic() - START_TIME
-    jobs = await job_manager.jobs_count()
-    return HealthResponse(uptime_seconds=uptime, jobs_in_queue=jobs)
+    queued, running, retained = await job_manager.job_counts()
+    return HealthResponse(uptime_seconds=uptime, jobs_in_queue=queued, jobs_running=running, jobs_retained=retained)
+
+
+# ------ metrik Prometheus ------
+@app.get("/metrics", include_in_schema=False)
+async def metrics_exposition() -> Response:
+    """Prometheus text exposition; gauges derived from job state are refreshed at scrape time."""
+    queued, running, retained = await job_manager.job_counts()
+    telemetry.JOBS_QUEUED.set(queued)
+    telemetry.JOBS_RUNNING.set(running)
+    telemetry.JOBS_RETAINED.set(retained)
+    telemetry.PROGRESS_SUBSCRIPTIONS.set(job_manager.subscription_count())
+    telemetry.UPTIME.set(time.monotonic() - START_TIME)
+    return Response(content=telemetry.render(), media_type=telemetry.CONTENT_TYPE)
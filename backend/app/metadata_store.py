@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite (WAL) index of stored artifacts: uploads, previews and results.
+
+Replaces the per-file ``*.json`` sidecars. Lookups hit the primary key,
+expiry is a single range query on ``created_at``, and sidecars left by
+older versions are imported (then removed) by :meth:`MetadataStore.import_sidecars`.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("aintra.metadata")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    image_id TEXT,
+    job_id TEXT,
+    filename TEXT,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (kind, key)
+);
+CREATE INDEX IF NOT EXISTS idx_artifacts_image_id ON artifacts (image_id);
+CREATE INDEX IF NOT EXISTS idx_artifacts_job_id ON artifacts (job_id);
+CREATE INDEX IF NOT EXISTS idx_artifacts_created_at ON artifacts (created_at);
+"""
+
+
+def _normalise_timestamp(value: Optional[str]) -> str:
+    """ISO-8601 in UTC so that string comparison in SQL matches time order."""
+    if not value:
+        return datetime.now(timezone.utc).isoformat()
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat()
+
+
+class MetadataStore:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # satu koneksi per thread; WAL membuat pembaca tidak memblokir penulis
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def put(self, kind: str, key: str, metadata: Dict[str, Any]) -> None:
+        created_at = _normalise_timestamp(metadata.get("created_at"))
+        self._connect().execute(
+            "INSERT OR REPLACE INTO artifacts (kind, key, image_id, job_id, filename, created_at, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                kind,
+                key,
+                metadata.get("image_id"),
+                metadata.get("job_id"),
+                metadata.get("saved_filename") or metadata.get("filename"),
+                created_at,
+                json.dumps(metadata, ensure_ascii=False, separators=(",", ":")),
+            ),
+        )
+
+    def get(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT data FROM artifacts WHERE kind = ? AND key = ?",
+            (kind, key),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def expired(self, threshold: datetime) -> List[Tuple[str, str, Optional[str]]]:
+        """(kind, key, filename) of every artifact created before ``threshold``."""
+        return self._connect().execute(
+            "SELECT kind, key, filename FROM artifacts WHERE created_at < ? ORDER BY created_at",
+            (_normalise_timestamp(threshold.isoformat()),),
+        ).fetchall()
+
+    def delete(self, kind: str, key: str) -> None:
+        self._connect().execute("DELETE FROM artifacts WHERE kind = ? AND key = ?", (kind, key))
+
+    def import_sidecars(self, sources: Iterable[Tuple[str, Path]], suffix: str = ".json") -> int:
+        """Import legacy ``<key>.json`` sidecars from each (kind, directory) and delete them."""
+        imported = 0
+        conn = self._connect()
+        for kind, directory in sources:
+            for sidecar in directory.glob(f"*{suffix}"):
+                try:
+                    metadata = json.loads(sidecar.read_text(encoding="utf-8"))
+                    conn.execute("BEGIN")
+                    try:
+                        exists = conn.execute(
+                            "SELECT 1 FROM artifacts WHERE kind = ? AND key = ?", (kind, sidecar.stem)
+                        ).fetchone()
+                        if not exists:
+                            self.put(kind, sidecar.stem, metadata)
+                        conn.execute("COMMIT")
+                    except Exception:
+                        conn.execute("ROLLBACK")
+                        raise
+                except (OSError, ValueError, sqlite3.Error) as exc:
+                    logger.warning("gagal migrasi metadata %s: %s", sidecar, exc)
+                    continue
+                sidecar.unlink(missing_ok=True)
+                imported += 1
+        if imported:
+            logger.info("migrasi %d sidecar JSON ke %s", imported, self.path)
+        return imported
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of encoded operation results.
+
+Keys hash the upload bytes (sha256 stored at upload time), the canonical
+operation id and the *validated* params, so toggling a slider back to a
+value that was already tried is served without decode, compute or encode.
+Two tiers: an in-memory LRU bounded in bytes, and a directory under
+``STORAGE_ROOT`` bounded in bytes with oldest-first eviction.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from . import storage
+
+CACHE_MEMORY_BYTES = int(float(os.getenv("AINTRA_CACHE_MEMORY_MB", "128")) * 1024 * 1024)
+CACHE_DISK_BYTES = int(float(os.getenv("AINTRA_CACHE_DISK_MB", "1024")) * 1024 * 1024)
+# Naikkan saat implementasi operasi berubah agar entri lama tidak terpakai.
+CACHE_VERSION = 1
+DATA_SUFFIX = ".bin"
+
+logger = logging.getLogger("aintra.cache")
+
+
+@dataclass(frozen=True)
+class CachedResult:
+    data: bytes
+    metrics: Optional[Dict[str, float]] = None
+    media_type: str = "image/png"
+
+
+def make_key(
+    image_hash: str,
+    operation: str,
+    params: Dict[str, Any],
+    *,
+    variant: str,
+    target_hash: Optional[str] = None,
+) -> str:
+    payload = {
+        "v": CACHE_VERSION,
+        "image": image_hash,
+        "op": operation,
+        "params": params,
+        "variant": variant,
+        "target": target_hash,
+    }
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, directory: Path, *, memory_bytes: int = CACHE_MEMORY_BYTES, disk_bytes: int = CACHE_DISK_BYTES) -> None:
+        self.directory = directory
+        self.memory_bytes = max(0, memory_bytes)
+        self.disk_bytes = max(0, disk_bytes)
+        self._memory: "OrderedDict[str, CachedResult]" = OrderedDict()
+        self._memory_size = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        # direktori dipindai saat pertama dipakai, bukan saat import modul
+        self._scanned = False
+
+    def _ensure_scanned(self) -> None:
+        if self._scanned:
+            return
+        with self._lock:
+            if not self._scanned:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                self._scan_disk()
+                self._scanned = True
+
+    def _scan_disk(self) -> None:
+        entries = []
+        for path in self.directory.glob(f"*{DATA_SUFFIX}"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_size += size
+
+    def _data_path(self, key: str) -> Path:
+        return self.directory / f"{key}{DATA_SUFFIX}"
+
+    def _meta_path(self, key: str) -> Path:
+        return self.directory / f"{key}{storage.METADATA_SUFFIX}"
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        self._ensure_scanned()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry
+            on_disk = key in self._disk
+        if not on_disk:
+            return None
+        try:
+            data = self._data_path(key).read_bytes()
+            meta = json.loads(self._meta_path(key).read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            self._drop_disk(key)
+            return None
+        entry = CachedResult(data=data, metrics=meta.get("metrics"), media_type=meta.get("media_type", "image/png"))
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            self._remember(key, entry)
+        try:
+            os.utime(self._data_path(key))
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key: str, data: bytes, metrics: Optional[Dict[str, float]] = None, media_type: str = "image/png") -> None:
+        self._ensure_scanned()
+        entry = CachedResult(data=data, metrics=metrics, media_type=media_type)
+        with self._lock:
+            self._remember(key, entry)
+        if not self.disk_bytes or len(data) > self.disk_bytes:
+            # entri lama untuk key ini tidak boleh tetap tersaji
+            self._drop_disk(key)
+            return
+        meta = json.dumps({"metrics": metrics, "media_type": media_type}, ensure_ascii=False).encode("utf-8")
+        try:
+            # metadata lebih dulu: file data yang terlihat selalu sudah punya metadata lengkap
+            self._write_atomic(self._meta_path(key), meta)
+            self._write_atomic(self._data_path(key), data)
+        except OSError as exc:
+            logger.warning("gagal menulis cache key=%s: %s", key, exc)
+            self._drop_disk(key)
+            return
+        with self._lock:
+            self._disk_size += len(data) - self._disk.pop(key, 0)
+            self._disk[key] = len(data)
+            evicted = self._evict_disk()
+        for old_key in evicted:
+            self._unlink(old_key)
+
+    def _write_atomic(self, path: Path, data: bytes) -> None:
+        # rename atomik: get() tidak pernah membaca file setengah tertulis
+        temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.part")
+        try:
+            temp_path.write_bytes(data)
+            os.replace(temp_path, path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        self._ensure_scanned()
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+            keys = list(self._disk)
+            self._disk.clear()
+            self._disk_size = 0
+        for key in keys:
+            self._unlink(key)
+
+    def stats(self) -> Dict[str, int]:
+        self._ensure_scanned()
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_size,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_size,
+            }
+
+    def _remember(self, key: str, entry: CachedResult) -> None:
+        size = len(entry.data)
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_size -= len(previous.data)
+        if size > self.memory_bytes:
+            # entri baru terlalu besar: yang lama sudah dibuang agar tidak tersaji basi
+            return
+        self._memory[key] = entry
+        self._memory_size += size
+        while self._memory_size > self.memory_bytes and self._memory:
+            _, old = self._memory.popitem(last=False)
+            self._memory_size -= len(old.data)
+
+    def _evict_disk(self) -> list[str]:
+        evicted = []
+        while self._disk_size > self.disk_bytes and self._disk:
+            old_key, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+            evicted.append(old_key)
+        return evicted
+
+    def _drop_disk(self, key: str) -> None:
+        with self._lock:
+            self._disk_size -= self._disk.pop(key, 0)
+        self._unlink(key)
+
+    def _unlink(self, key: str) -> None:
+        self._data_path(key).unlink(missing_ok=True)
+        self._meta_path(key).unlink(missing_ok=True)
+
+
+result_cache = ResultCache(storage.CACHE_DIR)
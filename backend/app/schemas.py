@@ -1,10 +1,14 @@
 from enum import Enum
-from typing import Any, Dict, Literal, Optional
+from typing import Any, Dict, List, Literal, Optional
 
 from pydantic import BaseModel, ConfigDict, Field, computed_field
 
 OperationParamMap = Dict[str, Any]
 
+MAX_PIPELINE_STEPS = 16
+MAX_BATCH_IMAGES = 500
+MAX_OPERATION_TIMEOUT = 3600
+
 
 class OperationEnum(str, Enum):
     NEGATIVE = "negative"
@@ -23,14 +27,11 @@ class OperationEnum(str, Enum):
     MORPHOLOGY = "morphology"
     GEO = "geo"
     GEOMETRY = "geometry"
-<<<<<<< HEAD
     THRESH_GLOBAL = "thresh_global"
-=======
     ACTIVE_CONTOUR = "active_contour"
     FEATURES = "features"
     HSV_THRESHOLD = "hsv-threshold"
     KMEANS_COLOR = "kmeans-color"
->>>>>>> ee3fa41 (chore: update README and UI)
     THRESHOLD_GLOBAL = "threshold-global"
     THRESH_ADAPT_OTSU = "thresh_adapt_otsu"
     THRESHOLD_ADAPTIVE = "threshold-adaptive"
@@ -41,7 +42,12 @@ class OperationEnum(str, Enum):
     CARTOONIZE = "cartoonize"
 
 
-JobStatus = Literal["idle", "queued", "processing", "completed", "error"]
+JobStatus = Literal["idle", "queued", "processing", "completed", "error", "cancelled"]
+JobPriority = Literal["interactive", "batch"]
+# format keluaran yang bisa diminta klien (lihat app/encoders.py)
+ImageFormat = Literal["png", "webp", "jpeg"]
+# metrik kualitas yang bisa diminta (lihat app/services/metrics.py)
+MetricName = Literal["ssim", "psnr", "mse"]
 
 
 class UploadResponse(BaseModel):
@@ -56,6 +62,10 @@ class PreviewRequest(BaseModel):
     operation: OperationEnum
     params: OperationParamMap = Field(default_factory=dict)
     target_image_id: Optional[str] = None
+    format: Optional[ImageFormat] = None
+    # None = default server (AINTRA_METRICS); [] = tanpa metrik kualitas
+    metrics: Optional[List[MetricName]] = None
+    approx_metrics: bool = False
 
 
 class PreviewResponse(BaseModel):
@@ -64,6 +74,8 @@ class PreviewResponse(BaseModel):
     image_id: str = Field(alias="imageId")
     operation: str
     result_b64: str = Field(alias="resultB64")
+    media_type: str = Field(default="image/png", alias="mediaType")
+    preview_url: Optional[str] = None
     metrics: Optional[Dict[str, float]] = None
 
 
@@ -72,6 +84,30 @@ class ProcessRequest(BaseModel):
     operation: OperationEnum
     params: OperationParamMap = Field(default_factory=dict)
     target_image_id: Optional[str] = None
+    priority: JobPriority = "interactive"
+    format: Optional[ImageFormat] = None
+    metrics: Optional[List[MetricName]] = None
+    approx_metrics: bool = False
+    defer_metrics: bool = False
+    # batas waktu per operasi (detik); default AINTRA_OPERATION_TIMEOUT_SECONDS
+    timeout_seconds: Optional[float] = Field(default=None, gt=0, le=MAX_OPERATION_TIMEOUT)
+
+
+class PipelineStep(BaseModel):
+    operation: OperationEnum
+    params: OperationParamMap = Field(default_factory=dict)
+
+
+class PipelineRequest(BaseModel):
+    image_id: str
+    steps: List[PipelineStep] = Field(min_length=1, max_length=MAX_PIPELINE_STEPS)
+    target_image_id: Optional[str] = None
+    priority: JobPriority = "interactive"
+    format: Optional[ImageFormat] = None
+    metrics: Optional[List[MetricName]] = None
+    approx_metrics: bool = False
+    defer_metrics: bool = False
+    timeout_seconds: Optional[float] = Field(default=None, gt=0, le=MAX_OPERATION_TIMEOUT)
 
 
 class ProcessResponse(BaseModel):
@@ -79,6 +115,33 @@ class ProcessResponse(BaseModel):
     status: JobStatus
     eta_ms: Optional[int] = None
 
+
+class BatchRequest(BaseModel):
+    image_ids: List[str] = Field(min_length=1, max_length=MAX_BATCH_IMAGES)
+    operation: OperationEnum
+    params: OperationParamMap = Field(default_factory=dict)
+    target_image_id: Optional[str] = None
+    priority: JobPriority = "batch"
+    format: Optional[ImageFormat] = None
+    metrics: Optional[List[MetricName]] = None
+    approx_metrics: bool = False
+    defer_metrics: bool = False
+    timeout_seconds: Optional[float] = Field(default=None, gt=0, le=MAX_OPERATION_TIMEOUT)
+
+
+class BatchResponse(BaseModel):
+    batch_id: str
+    status: JobStatus
+    total: int
+    job_ids: List[str]
+
+
+class BatchProgress(BaseModel):
+    total: int
+    completed: int = 0
+    failed: int = 0
+    cancelled: int = 0
+
 class DownloadResponse(BaseModel):
     model_config = ConfigDict(populate_by_name=True)
 
@@ -96,10 +159,25 @@ class JobStatusResponse(BaseModel):
     progress: int = 0
     result_url: Optional[str] = None
     metrics: Optional[Dict[str, float]] = None
+    # defer_metrics: status sudah completed, metrik kualitas dikirim pada update berikutnya
+    metrics_pending: bool = False
     error: Optional[str] = None
+    # hanya terisi untuk batch (lihat /api/batch)
+    batch: Optional[BatchProgress] = None
+
+
+class HistogramResponse(BaseModel):
+    # nama baris `bins`: kanal warna (urutan OpenCV: b, g, r atau gray) lalu luminance
+    channels: List[str]
+    bins: List[List[int]]
+    pixels: int
+    stats: Dict[str, Dict[str, float]]
 
 
 class HealthResponse(BaseModel):
     status: Literal["ok"] = "ok"
     uptime_seconds: float
     jobs_in_queue: int
+    jobs_running: int = 0
+    # job/batch selesai yang statusnya masih disimpan (lihat AINTRA_JOB_RETENTION_*)
+    jobs_retained: int = 0
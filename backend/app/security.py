@@ -27,6 +27,6 @@ def setup_security(app: FastAPI, *, origins: Iterable[str]) -> None:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
-        expose_headers=["Content-Disposition"],
+        expose_headers=["Content-Disposition", "ETag", "X-Histogram-Channels", "X-Image-Id", "X-Operation", "X-Preview-Url", "X-Metrics"],
     )
     app.add_middleware(SecurityHeadersMiddleware)
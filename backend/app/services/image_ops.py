@@ -2,15 +2,20 @@
 from __future__ import annotations
 
 import base64
+import hashlib
+import json
 import math
 from copy import deepcopy
 from enum import Enum
+from functools import partial
 from pathlib import Path
+from types import MappingProxyType
 from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple, Union
 
 import cv2
 import numpy as np
-from skimage.metrics import peak_signal_noise_ratio, structural_similarity
+
+from . import metrics, point_ops, progress
 
 OperationParams = Dict[str, Any]
 OperationName = Union[str, Enum]
@@ -89,6 +94,8 @@ def _clip01(value: float) -> float:
 
 def op_negative(image: np.ndarray, params: OperationParams) -> np.ndarray:
     mode = params.get("mode", "rgb")
+    if mode != "luma" and image.dtype == np.uint8:
+        return point_ops.apply_point_ops(image, [("negative", params)])
     blend = _clip01(float(params.get("blend", 1.0)))
     rgb, alpha = split_alpha(image)
     if mode == "luma":
@@ -103,6 +110,9 @@ def op_negative(image: np.ndarray, params: OperationParams) -> np.ndarray:
 
 
 def op_log(image: np.ndarray, params: OperationParams) -> np.ndarray:
+    if image.dtype == np.uint8:
+        # tabel dari min/max histogram, tanpa salinan float32 seukuran citra
+        return point_ops.apply_point_ops(image, [("log", params)])
     gain = float(params.get("gain", 1.0))
     rgb, alpha = split_alpha(image)
     normalized = rgb.astype(np.float32) / 255.0
@@ -112,13 +122,7 @@ def op_log(image: np.ndarray, params: OperationParams) -> np.ndarray:
 
 
 def op_gamma(image: np.ndarray, params: OperationParams) -> np.ndarray:
-    gamma = max(0.01, float(params.get("gamma", 1.0)))
-    rgb, alpha = split_alpha(image)
-    inv_gamma = 1.0 / gamma
-    table = np.array([((i / 255.0) ** inv_gamma) * 255 for i in range(256)], dtype=np.float32)
-    table = np.clip(table, 0, 255).astype(np.uint8)
-    corrected = cv2.LUT(rgb, table)
-    return merge_alpha(corrected, alpha)
+    return point_ops.apply_point_ops(ensure_uint8(image), [("gamma", params)])
 
 
 def op_hist_eq_clahe(image: np.ndarray, params: OperationParams) -> np.ndarray:
@@ -217,7 +221,7 @@ def op_morph(image: np.ndarray, params: OperationParams) -> np.ndarray:
     elif op == "close":
         transformed = cv2.morphologyEx(gray, cv2.MORPH_CLOSE, kernel, iterations=iterations)
     else:
-        transformed = cv2.morphologyEx(gray, cv2.MORPH_OPEN, kernel, iteration=iterations)
+        transformed = cv2.morphologyEx(gray, cv2.MORPH_OPEN, kernel, iterations=iterations)
 
     transformed_bgr = cv2.cvtColor(transformed, cv2.COLOR_GRAY2BGR)
     return merge_alpha(transformed_bgr, alpha)
@@ -246,17 +250,10 @@ def op_geo(image: np.ndarray, params: OperationParams) -> np.ndarray:
 
 
 def op_thresh_global(image: np.ndarray, params: OperationParams) -> np.ndarray:
+    if image.dtype == np.uint8:
+        return point_ops.apply_point_ops(image, [("thresh_global", params)])
     threshold = float(params.get("thresh", 128))
-    ttype = str(params.get("type", "binary"))
-
-    type_map = {
-        "binary": cv2.THRESH_BINARY,
-        "binary_inv": cv2.THRESH_BINARY_INV,
-        "truncate": cv2.THRESH_TRUNC,
-        "tozero": cv2.THRESH_TOZERO,
-        "tozero_inv": cv2.THRESH_TOZERO_INV,
-    }
-    cv_type = type_map.get(ttype, cv2.THRESH_BINARY)
+    cv_type = point_ops.THRESH_TYPES.get(str(params.get("type", "binary")), cv2.THRESH_BINARY)
 
     rgb, alpha = split_alpha(image)
     gray = to_gray(rgb)
@@ -299,6 +296,8 @@ def op_nlmeans(image: np.ndarray, params: OperationParams) -> np.ndarray:
     template = _ensure_odd(int(params.get("template", 7)))
     search = _ensure_odd(int(params.get("search", 21)))
     rgb, alpha = split_alpha(image)
+    # satu panggilan OpenCV tanpa titik henti: batalkan sebelum mulai bila sudah tidak dibutuhkan
+    progress.checkpoint()
     denoised = cv2.fastNlMeansDenoisingColored(
         ensure_uint8(rgb), None, h_luma, h_color, template, search
     )
@@ -333,6 +332,9 @@ def op_hsv_adjust(image: np.ndarray, params: OperationParams) -> np.ndarray:
 
 
 def op_contrast_stretch(image: np.ndarray, params: OperationParams) -> np.ndarray:
+    if image.dtype == np.uint8:
+        # persentil dari histogram 256-bin, bukan np.percentile atas salinan float32
+        return point_ops.apply_point_ops(image, [("contrast_stretch", params)])
     p_low = float(params.get("p_low", 2.0))
     p_high = float(params.get("p_high", 98.0))
     rgb, alpha = split_alpha(image)
@@ -400,6 +402,7 @@ def spec(
     recommended: Optional[str] = None,
     schema: Optional[Dict[str, Any]] = None,
     required: Optional[Sequence[str]] = None,
+    executor: Optional[str] = None,
 ) -> Dict[str, Any]:
     data = {
         "label": label,
@@ -408,6 +411,8 @@ def spec(
     }
     if recommended:
         data["recommended"] = recommended
+    if executor:
+        data["executor"] = executor
     properties = schema or {}
     payload: Dict[str, Any] = {"type": "object", "properties": properties}
     if required:
@@ -777,6 +782,7 @@ REGISTRY_CORE: Dict[str, Dict[str, Any]] = {
         label="Non-Local Means",
         category="Filtering",
         description="Denoise canggih yang mempertahankan detail tekstur.",
+        executor="process",
         recommended="Gunakan pada foto ISO tinggi atau citra medis ber-noise.",
         schema={
             "h_luma": schema(
@@ -949,14 +955,10 @@ def _operation_properties(spec: Dict[str, Any]) -> Dict[str, Any]:
 
 
 def get_operation_defaults(operation: OperationName) -> Dict[str, Any]:
-    canonical = normalise_operation_name(operation)
-    spec = REGISTRY_CORE.get(canonical)
-    if spec is None:
+    validator = VALIDATORS.get(normalise_operation_name(operation))
+    if validator is None:
         raise ValueError(f"Unknown operation: {operation}")
-    defaults: Dict[str, Any] = {}
-    for param_id, param_schema in _operation_properties(spec).items():
-        defaults[param_id] = param_schema.get("default")
-    return defaults
+    return dict(validator.defaults)
 
 
 def _coerce_bool(value: Any) -> bool:
@@ -996,103 +998,127 @@ def _validate_step(value: float, *, base: Optional[float], step: Optional[float]
         raise ValueError(f"Value {value} does not align with step {step}")
 
 
-def prepare_operation_params(operation: OperationName, params: Optional[OperationParams]) -> OperationParams:
-    canonical = normalise_operation_name(operation)
-    spec = REGISTRY_CORE.get(canonical)
-    if spec is None:
-        raise ValueError(f"Unknown operation: {operation}")
-
-    schema_def = _operation_properties(spec)
-    params = params or {}
+class ParamValidator:
+    """One schema property compiled once into its coercion and bound checks."""
 
-    unknown = set(params.keys()) - set(schema_def.keys())
-    if unknown:
-        raise ValueError(
-            f"Unknown parameter(s) for {operation}: {', '.join(sorted(unknown))}"
-        )
-
-    validated: OperationParams = {}
-    for param_id, prop in schema_def.items():
-        raw = params[param_id] if param_id in params else prop.get("default")
-        if raw is None:
-            continue
+    __slots__ = ("name", "default", "coerce", "enum", "minimum", "maximum", "step", "base")
 
+    def __init__(self, name: str, prop: Mapping[str, Any]) -> None:
+        self.name = name
+        self.default = prop.get("default")
         p_type = prop.get("type", "number")
         if p_type == "boolean":
-            coerced = _coerce_bool(raw)
+            self.coerce: Callable[[Any], Any] = _coerce_bool
         elif p_type == "integer":
-            coerced = _coerce_number(raw, integer=True)
+            self.coerce = partial(_coerce_number, integer=True)
         elif p_type == "number":
-            coerced = _coerce_number(raw, integer=False)
+            self.coerce = partial(_coerce_number, integer=False)
         elif p_type == "string":
-            coerced = str(raw)
+            self.coerce = str
         else:
             raise ValueError(f"Unsupported schema type: {p_type}")
+        self.enum = list(prop["enum"]) if "enum" in prop else None
+        self.minimum = prop.get("minimum")
+        self.maximum = prop.get("maximum")
+        step = prop.get("step")
+        self.step = None if step in (None, 0) else step
+        base = self.minimum if isinstance(self.minimum, (int, float)) else self.default
+        self.base = base if isinstance(base, (int, float)) else None
+
+    def __call__(self, raw: Any) -> Any:
+        coerced = self.coerce(raw)
+        if self.enum is not None and coerced not in self.enum:
+            raise ValueError(f"Parameter {self.name} must be one of {self.enum}")
+        if self.minimum is not None and coerced < self.minimum:
+            raise ValueError(f"Parameter {self.name} must be >= {self.minimum}")
+        if self.maximum is not None and coerced > self.maximum:
+            raise ValueError(f"Parameter {self.name} must be <= {self.maximum}")
+        if self.step is not None and isinstance(coerced, (int, float)):
+            _validate_step(float(coerced), base=self.base, step=self.step)
+        return coerced
+
+
+class OperationValidator:
+    """Validator for the params of one registry operation, compiled from its schema."""
+
+    __slots__ = ("operation", "params", "names", "defaults")
+
+    def __init__(self, operation: str, spec: Mapping[str, Any]) -> None:
+        properties = _operation_properties(dict(spec))
+        self.operation = operation
+        self.params = tuple(ParamValidator(name, prop) for name, prop in properties.items())
+        self.names = frozenset(properties)
+        self.defaults: Mapping[str, Any] = MappingProxyType({param.name: param.default for param in self.params})
+
+    def validate(self, params: Optional[OperationParams], label: OperationName) -> OperationParams:
+        params = params or {}
+        if not self.names.issuperset(params):
+            unknown = set(params) - self.names
+            raise ValueError(f"Unknown parameter(s) for {label}: {', '.join(sorted(unknown))}")
+        validated: OperationParams = {}
+        for param in self.params:
+            raw = params[param.name] if param.name in params else param.default
+            if raw is None:
+                continue
+            validated[param.name] = param(raw)
+        return validated
+
+
+# dikompilasi sekali saat import; registry tidak berubah selama proses berjalan
+VALIDATORS: Mapping[str, OperationValidator] = MappingProxyType(
+    {op_id: OperationValidator(op_id, spec) for op_id, spec in REGISTRY_CORE.items()}
+)
 
-        if "enum" in prop and coerced not in prop["enum"]:
-            raise ValueError(f"Parameter {param_id} must be one of {prop['enum']}")
-
-        minimum = prop.get("minimum")
-        if minimum is not None and coerced < minimum:
-            raise ValueError(f"Parameter {param_id} must be >= {minimum}")
 
-        maximum = prop.get("maximum")
-        if maximum is not None and coerced > maximum:
-            raise ValueError(f"Parameter {param_id} must be <= {maximum}")
-
-        if isinstance(coerced, (int, float)):
-            base = minimum if isinstance(minimum, (int, float)) else prop.get("default")
-            _validate_step(
-                float(coerced),
-                base=base if isinstance(base, (int, float)) else None,
-                step=prop.get("step"),
-            )
+def prepare_operation_params(operation: OperationName, params: Optional[OperationParams]) -> OperationParams:
+    validator = VALIDATORS.get(normalise_operation_name(operation))
+    if validator is None:
+        raise ValueError(f"Unknown operation: {operation}")
+    return validator.validate(params, operation)
+
+
+def _registry_entry(op_id: str, canonical: str) -> Dict[str, Any]:
+    spec = REGISTRY_CORE[canonical]
+    return {
+        "id": op_id,
+        "label": spec["label"],
+        "category": spec["category"],
+        "description": spec.get("description"),
+        "recommended": spec.get("recommended"),
+        "defaults": dict(VALIDATORS[canonical].defaults),
+        "schema": deepcopy(spec.get("schema", {})),
+        "canonical": canonical,
+    }
 
-        validated[param_id] = coerced
 
-    return validated
+_REGISTRY_LISTING: Tuple[Dict[str, Any], ...] = tuple(
+    [_registry_entry(op_id, op_id) for op_id in REGISTRY_CORE]
+    + [_registry_entry(alias, canonical) for alias, canonical in ALIASES.items() if canonical in REGISTRY_CORE]
+)
+# body /api/ops/registry yang sudah diserialisasi + ETag kuat (hash isi)
+REGISTRY_PAYLOAD: bytes = json.dumps(
+    {"ops": list(_REGISTRY_LISTING)}, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+).encode("utf-8")
+REGISTRY_ETAG = '"' + hashlib.sha256(REGISTRY_PAYLOAD).hexdigest()[:32] + '"'
 
 
 def list_operations() -> List[Dict[str, Any]]:
-    items: List[Dict[str, Any]] = []
-    for op_id, spec in REGISTRY_CORE.items():
-        items.append(
-            {
-                "id": op_id,
-                "label": spec["label"],
-                "category": spec["category"],
-                "description": spec.get("description"),
-                "recommended": spec.get("recommended"),
-                "defaults": get_operation_defaults(op_id),
-                "schema": deepcopy(spec.get("schema", {})),
-                "canonical": op_id,
-            }
-        )
-
-    for alias, canonical in ALIASES.items():
-        if canonical not in REGISTRY_CORE:
-            continue
-        spec = REGISTRY_CORE[canonical]
-        items.append(
-            {
-                "id": alias,
-                "label": spec["label"],
-                "category": spec["category"],
-                "description": spec.get("description"),
-                "recommended": spec.get("recommended"),
-                "defaults": get_operation_defaults(canonical),
-                "schema": deepcopy(spec.get("schema", {})),
-                "canonical": canonical,
-            }
-        )
-
-    return items
+    # salinan: listing beku dipakai bersama oleh semua pemanggil
+    return deepcopy(list(_REGISTRY_LISTING))
 
 
 def canonical_operation_id(operation: OperationName) -> str:
     return normalise_operation_name(operation)
 
 
+def get_operation_executor(operation: OperationName) -> str:
+    """Return ``"thread"`` or ``"process"`` as declared by the registry entry."""
+    spec = REGISTRY_CORE.get(normalise_operation_name(operation))
+    if spec is None:
+        return "thread"
+    return str(spec.get("executor", "thread"))
+
+
 def apply_operation(image: np.ndarray, operation: OperationName, params: Optional[OperationParams]) -> np.ndarray:
     canonical = normalise_operation_name(operation)
     func = CANONICAL_OPERATIONS.get(canonical)
@@ -1118,15 +1144,10 @@ def generate_preview(
     return apply_operation(resized, operation, params or {})
 
 
-def compute_metrics(original: np.ndarray, processed: np.ndarray) -> Dict[str, float]:
-    try:
-        original_gray = to_gray(ensure_uint8(original))
-        processed_gray = to_gray(ensure_uint8(processed))
-        ssim = structural_similarity(original_gray, processed_gray, data_range=255)
-        psnr = peak_signal_noise_ratio(original_gray, processed_gray, data_range=255)
-        return {"ssim": float(ssim), "psnr": float(psnr)}
-    except Exception:
-        return {}
+def compute_metrics(
+    original: np.ndarray, processed: np.ndarray, selection: metrics.MetricsPolicy = metrics.DEFAULT_POLICY
+) -> Dict[str, float]:
+    return metrics.compute(original, processed, selection)
 
 
 __all__ = [
@@ -1137,6 +1158,7 @@ __all__ = [
     "encode_png_b64",
     "generate_preview",
     "get_operation_defaults",
+    "get_operation_executor",
     "list_operations",
     "load_image",
     "prepare_operation_params",
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Image quality metrics (SSIM, PSNR, MSE) between an input and its result.
+
+SSIM follows Wang et al. (2004) with an 11x11 Gaussian window (sigma 1.5),
+computed with OpenCV's separable ``GaussianBlur`` instead of scikit-image's
+generic filters; it equals ``structural_similarity(..., gaussian_weights=True,
+use_sample_covariance=False)``. Callers choose which metrics to compute.
+
+For large images the metrics can be *sampled*: stratified full-resolution
+tiles (with a halo so every sampled SSIM value is exact) are averaged instead
+of the whole map. The estimate is unbiased and is returned with the half-width
+of its 95% confidence interval (``<name>_err``). Downscaling the pair was
+rejected because its error depends on image noise and has no usable bound.
+"""
+from __future__ import annotations
+
+import math
+import os
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+METRIC_NAMES: Tuple[str, ...] = ("ssim", "psnr", "mse")
+DEFAULT_METRICS: Tuple[str, ...] = tuple(
+    name
+    for name in (item.strip().lower() for item in os.getenv("AINTRA_METRICS", "ssim,psnr").split(","))
+    if name in METRIC_NAMES
+)
+# anggaran piksel (termasuk halo) untuk metrik sampel
+METRICS_SAMPLE_PIXELS = int(float(os.getenv("AINTRA_METRICS_SAMPLE_MEGAPIXELS", "1")) * 1_000_000)
+METRICS_TILE = 64
+_Z95 = 1.96
+# PSNR tak hingga (citra identik) tidak valid di JSON; dibatasi ke nilai ini
+PSNR_MAX = 100.0
+
+_SSIM_WINDOW = (11, 11)
+_SSIM_SIGMA = 1.5
+_C1 = (0.01 * 255) ** 2
+_C2 = (0.03 * 255) ** 2
+_PAD = (_SSIM_WINDOW[0] - 1) // 2
+
+
+@dataclass(frozen=True)
+class MetricsPolicy:
+    """Which metrics a request wants and how they are computed."""
+
+    names: Tuple[str, ...] = DEFAULT_METRICS
+    approximate: bool = False
+    # job: hasil dikirim dulu, metrik menyusul lewat update status berikutnya
+    deferred: bool = False
+
+    @property
+    def tag(self) -> str:
+        """Short id used in cache keys; ``deferred`` does not change the cached metrics."""
+        return ",".join(sorted(self.names)) + (":approx" if self.approximate else "")
+
+
+def policy(
+    requested: Optional[Iterable[str]] = None, *, approximate: bool = False, deferred: bool = False
+) -> MetricsPolicy:
+    """Normalise a request's selection; ``None`` means ``AINTRA_METRICS``."""
+    if requested is None:
+        return MetricsPolicy(DEFAULT_METRICS, approximate, deferred)
+    names: List[str] = []
+    for name in requested:
+        if name not in METRIC_NAMES:
+            raise ValueError(f"Metrik {name} tidak dikenal")
+        if name not in names:
+            names.append(name)
+    return MetricsPolicy(tuple(names), approximate, deferred)
+
+
+DEFAULT_POLICY = MetricsPolicy()
+
+
+def _gray(image: np.ndarray) -> np.ndarray:
+    if image.dtype != np.uint8:
+        image = np.clip(np.nan_to_num(image, nan=0.0), 0, 255).astype(np.uint8)
+    if image.ndim == 2:
+        return image
+    if image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def prepare_pair(original: np.ndarray, processed: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Grayscale pair of equal size; the original is resized to the result (e.g. a preview)."""
+    reference, result = _gray(original), _gray(processed)
+    if reference.shape != result.shape:
+        height, width = result.shape
+        reference = cv2.resize(reference, (width, height), interpolation=cv2.INTER_AREA)
+    return reference, result
+
+
+def _squared_error(reference: np.ndarray, result: np.ndarray) -> float:
+    return float(cv2.norm(reference, result, cv2.NORM_L2SQR)) / float(reference.size)
+
+
+def _psnr_from_mse(error: float) -> float:
+    if error == 0:
+        return PSNR_MAX
+    return min(PSNR_MAX, 10.0 * math.log10((255.0**2) / error))
+
+
+def _blur(image: np.ndarray) -> np.ndarray:
+    # BORDER_REFLECT = mode "reflect" scipy/scikit-image
+    return cv2.GaussianBlur(image, _SSIM_WINDOW, _SSIM_SIGMA, borderType=cv2.BORDER_REFLECT)
+
+
+def _ssim_map(reference: np.ndarray, result: np.ndarray) -> np.ndarray:
+    x = reference.astype(np.float64)
+    y = result.astype(np.float64)
+    mu_x, mu_y = _blur(x), _blur(y)
+    mu_xx, mu_yy, mu_xy = mu_x * mu_x, mu_y * mu_y, mu_x * mu_y
+    sigma_xx = _blur(x * x) - mu_xx
+    sigma_yy = _blur(y * y) - mu_yy
+    sigma_xy = _blur(x * y) - mu_xy
+    numerator = (2 * mu_xy + _C1) * (2 * sigma_xy + _C2)
+    denominator = (mu_xx + mu_yy + _C1) * (sigma_xx + sigma_yy + _C2)
+    return numerator / denominator
+
+
+def _crop(ssim_map: np.ndarray) -> np.ndarray:
+    # seperti scikit-image: tepi selebar setengah jendela tidak dirata-rata
+    if min(ssim_map.shape) <= 2 * _PAD:
+        return ssim_map
+    return ssim_map[_PAD:-_PAD, _PAD:-_PAD]
+
+
+def mse(reference: np.ndarray, result: np.ndarray) -> float:
+    return _squared_error(reference, result)
+
+
+def psnr(reference: np.ndarray, result: np.ndarray) -> float:
+    return _psnr_from_mse(_squared_error(reference, result))
+
+
+def ssim(reference: np.ndarray, result: np.ndarray) -> float:
+    return float(_crop(_ssim_map(reference, result)).mean())
+
+
+def tile_origins(height: int, width: int, budget: int, tile: int = METRICS_TILE, seed: int = 0) -> List[Tuple[int, int]]:
+    """One tile per cell of a regular grid over the map interior (stratified sample)."""
+    span = tile + 2 * _PAD
+    count = max(1, budget // (span * span))
+    inner_h, inner_w = height - 2 * _PAD, width - 2 * _PAD
+    rows = max(1, min(inner_h // tile, int(round(math.sqrt(count * inner_h / float(inner_w))))))
+    cols = max(1, min(inner_w // tile, count // rows))
+    cell_h, cell_w = inner_h // rows, inner_w // cols
+    rng = np.random.default_rng(seed)
+    dy = rng.integers(0, cell_h - tile + 1, rows * cols)
+    dx = rng.integers(0, cell_w - tile + 1, rows * cols)
+    return [
+        (_PAD + r * cell_h + int(dy[r * cols + c]), _PAD + c * cell_w + int(dx[r * cols + c]))
+        for r in range(rows)
+        for c in range(cols)
+    ]
+
+
+def _interval(samples: np.ndarray) -> Tuple[float, float]:
+    mean = float(samples.mean())
+    if samples.size < 2:
+        return mean, 0.0
+    return mean, _Z95 * float(samples.std(ddof=1)) / math.sqrt(samples.size)
+
+
+def sampled(
+    reference: np.ndarray, result: np.ndarray, names: Sequence[str], budget: int = METRICS_SAMPLE_PIXELS
+) -> Dict[str, float]:
+    """Tile-sampled estimates of ``names`` plus the 95% interval half-width as ``<name>_err``."""
+    origins = tile_origins(*result.shape, budget)
+    ssim_tiles, error_tiles = [], []
+    for y, x in origins:
+        ref_tile = reference[y - _PAD : y + METRICS_TILE + _PAD, x - _PAD : x + METRICS_TILE + _PAD]
+        res_tile = result[y - _PAD : y + METRICS_TILE + _PAD, x - _PAD : x + METRICS_TILE + _PAD]
+        if "ssim" in names:
+            # halo = setengah jendela: nilai di bagian dalam tile sama persis dengan peta penuh
+            ssim_tiles.append(float(_ssim_map(ref_tile, res_tile)[_PAD:-_PAD, _PAD:-_PAD].mean()))
+        error_tiles.append(_squared_error(ref_tile[_PAD:-_PAD, _PAD:-_PAD], res_tile[_PAD:-_PAD, _PAD:-_PAD]))
+    out: Dict[str, float] = {}
+    error, error_err = _interval(np.asarray(error_tiles))
+    for name in names:
+        if name == "ssim":
+            out["ssim"], out["ssim_err"] = _interval(np.asarray(ssim_tiles))
+        elif name == "mse":
+            out["mse"], out["mse_err"] = error, error_err
+        else:
+            out["psnr"] = _psnr_from_mse(error)
+            # metode delta: d(psnr)/d(mse) = -10 / (ln 10 * mse)
+            out["psnr_err"] = 10.0 / math.log(10.0) * error_err / error if error > 0 else 0.0
+    return out
+
+
+METRICS: Dict[str, Callable[[np.ndarray, np.ndarray], float]] = {
+    "ssim": ssim,
+    "psnr": psnr,
+    "mse": mse,
+}
+
+
+def compute(
+    original: np.ndarray, processed: np.ndarray, selection: MetricsPolicy = DEFAULT_POLICY
+) -> Dict[str, float]:
+    """Selected metrics; approximate policies sample images larger than ``METRICS_SAMPLE_PIXELS``."""
+    names = selection.names
+    if not names:
+        return {}
+    try:
+        reference, result = prepare_pair(original, processed)
+        if selection.approximate and result.size > METRICS_SAMPLE_PIXELS and min(result.shape) > METRICS_TILE + 2 * _PAD:
+            return sampled(reference, result, names)
+        return {name: METRICS[name](reference, result) for name in names}
+    except Exception:
+        return {}
+
+
+__all__ = [
+    "DEFAULT_METRICS",
+    "DEFAULT_POLICY",
+    "METRIC_NAMES",
+    "MetricsPolicy",
+    "compute",
+    "policy",
+    "prepare_pair",
+    "psnr",
+    "sampled",
+    "ssim",
+]
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+LUT compiler for point operations.
+
+negative, gamma, log, thresh_global and contrast_stretch map each uint8
+value independently, so each one is a 256-entry table. Static tables are
+cached by validated params. Data-dependent tables (log needs the frame
+min/max, contrast_stretch per-channel percentiles) are derived from a
+256-bin histogram instead of float copies of the frame. Consecutive point
+ops are composed into one table and applied with a single ``cv2.LUT``. The
+legacy ``img_ops`` log/gamma handlers compile through the same tables
+(``legacy_gamma`` keeps their ``gain`` param and rounding).
+
+Tables are produced by running the reference formula on a 256-value ramp,
+so the fused result is bit-identical to applying the ops one by one.
+"""
+from __future__ import annotations
+
+import json
+import math
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+PointStep = Tuple[str, Dict[str, Any]]
+
+_RAMP = np.arange(256, dtype=np.uint8)
+
+THRESH_TYPES = {
+    "binary": cv2.THRESH_BINARY,
+    "binary_inv": cv2.THRESH_BINARY_INV,
+    "truncate": cv2.THRESH_TRUNC,
+    "tozero": cv2.THRESH_TOZERO,
+    "tozero_inv": cv2.THRESH_TOZERO_INV,
+}
+
+
+def _freeze(params: Dict[str, Any]) -> str:
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+def _clip01(value: float) -> float:
+    return float(max(0.0, min(1.0, value)))
+
+
+def _readonly(table: np.ndarray) -> np.ndarray:
+    # tabel di-cache dan dibagi antar pemanggil
+    table.setflags(write=False)
+    return table
+
+
+# ------ tabel statis (di-cache per parameter tervalidasi) ------
+@lru_cache(maxsize=512)
+def _negative_table(frozen: str) -> np.ndarray:
+    params = json.loads(frozen)
+    blend = _clip01(float(params.get("blend", 1.0)))
+    ramp = _RAMP.reshape(1, 256)
+    table = cv2.addWeighted(cv2.bitwise_not(ramp), blend, ramp, 1.0 - blend, 0.0)
+    return _readonly(table.reshape(256))
+
+
+@lru_cache(maxsize=512)
+def _gamma_table(frozen: str) -> np.ndarray:
+    params = json.loads(frozen)
+    gamma = max(0.01, float(params.get("gamma", 1.0)))
+    inv_gamma = 1.0 / gamma
+    # float64 -> float32 -> uint8, sama persis dengan tabel op_gamma sebelumnya
+    table = (((np.arange(256, dtype=np.float64) / 255.0) ** inv_gamma) * 255).astype(np.float32)
+    return _readonly(np.clip(table, 0, 255).astype(np.uint8))
+
+
+@lru_cache(maxsize=512)
+def _legacy_gamma_table(frozen: str) -> np.ndarray:
+    """Table of the legacy ``img_ops.gamma_operation`` (has ``gain``, float64 truncation)."""
+    params = json.loads(frozen)
+    inv_gamma = 1.0 / max(0.01, float(params.get("gamma", 1.0)))
+    gain = float(params.get("gain", 1.0))
+    # rumus skalar Python asli, sekali per parameter: pembulatannya tidak selalu sama dengan versi vektor
+    table = np.array([(gain * ((i / 255.0) ** inv_gamma) * 255) for i in range(256)]).clip(0, 255)
+    return _readonly(table.astype(np.uint8))
+
+
+@lru_cache(maxsize=512)
+def _thresh_table(frozen: str) -> np.ndarray:
+    params = json.loads(frozen)
+    threshold = float(params.get("thresh", 128))
+    cv_type = THRESH_TYPES.get(str(params.get("type", "binary")), cv2.THRESH_BINARY)
+    _, table = cv2.threshold(_RAMP.reshape(1, 256), threshold, 255, cv_type)
+    return _readonly(table.reshape(256))
+
+
+# ------ tabel dinamis (bergantung statistik frame) ------
+def _log_table(params: Dict[str, Any], histograms: np.ndarray) -> np.ndarray:
+    """Same as ``cv2.normalize(gain * log(1 + v/255), 0, 255, NORM_MINMAX)`` over the frame."""
+    present = np.flatnonzero(histograms.sum(axis=0))
+    if present.size == 0:
+        return _RAMP.copy()
+    vmin, vmax = int(present[0]), int(present[-1])
+    gain = float(params.get("gain", 1.0))
+    base = str(params.get("base", "e"))
+    # log monoton: min/max nilai log frame = nilai log di vmin/vmax
+    normalized = np.arange(vmin, vmax + 1, dtype=np.uint8).reshape(1, -1).astype(np.float32) / 255.0
+    if base == "10":
+        logged = gain * np.log10(1 + normalized)
+    elif base == "2":
+        logged = gain * np.log2(1 + normalized)
+    else:
+        logged = gain * np.log1p(normalized)
+    logged = cv2.normalize(logged, None, 0, 255, cv2.NORM_MINMAX)
+    table = np.zeros(256, dtype=np.uint8)
+    table[vmin : vmax + 1] = np.clip(np.nan_to_num(logged.reshape(-1), nan=0.0), 0.0, 255.0).astype(np.uint8)
+    table[:vmin] = table[vmin]
+    table[vmax + 1 :] = table[vmax]
+    return table
+
+
+def histogram_percentile(histogram: np.ndarray, percent: float) -> float:
+    """``np.percentile(values, percent)`` (linear method) computed from a 256-bin histogram."""
+    counts = np.asarray(histogram, dtype=np.int64)
+    n = int(counts.sum())
+    if n == 0:
+        return 0.0
+    # indeks virtual & interpolasi sama persis dengan numpy (metode "linear")
+    virtual = (n - 1) * np.true_divide(percent, 100)
+    previous_index = int(np.floor(virtual))
+    gamma = float(virtual - previous_index)
+    if virtual >= n - 1:
+        previous_index = n - 1
+    previous_index = max(0, previous_index)
+    next_index = min(previous_index + 1, n - 1)
+    cumulative = np.cumsum(counts)
+    a = float(np.searchsorted(cumulative, previous_index, side="right"))
+    b = float(np.searchsorted(cumulative, next_index, side="right"))
+    diff = b - a
+    if gamma >= 0.5:
+        return b - diff * (1 - gamma)
+    return a + diff * gamma
+
+
+def _contrast_stretch_table(params: Dict[str, Any], histograms: np.ndarray) -> np.ndarray:
+    p_low = float(params.get("p_low", 2.0))
+    p_high = float(params.get("p_high", 98.0))
+    channels = histograms.shape[0]
+    table = np.empty((256, channels), dtype=np.uint8)
+    values = np.arange(256, dtype=np.float32)
+    for idx in range(channels):
+        lo = np.float64(histogram_percentile(histograms[idx], p_low))
+        hi = np.float64(histogram_percentile(histograms[idx], p_high))
+        if math.isclose(hi, lo, abs_tol=1e-3):
+            table[:, idx] = _RAMP
+        else:
+            scaled = (values - lo) * (255.0 / (hi - lo))
+            table[:, idx] = np.clip(scaled, 0, 255)
+    return table
+
+
+StaticBuilder = Callable[[str], np.ndarray]
+DynamicBuilder = Callable[[Dict[str, Any], np.ndarray], np.ndarray]
+
+STATIC_TABLES: Dict[str, StaticBuilder] = {
+    "negative": _negative_table,
+    "gamma": _gamma_table,
+    "thresh_global": _thresh_table,
+    "legacy_gamma": _legacy_gamma_table,
+}
+DYNAMIC_TABLES: Dict[str, DynamicBuilder] = {
+    "log": _log_table,
+    "contrast_stretch": _contrast_stretch_table,
+}
+# operasi yang lebih dulu mengubah citra ke grayscale sebelum tabelnya diterapkan
+GRAY_INPUT = {"thresh_global"}
+
+
+def is_point_op(operation: str, params: Optional[Dict[str, Any]] = None) -> bool:
+    if operation == "negative":
+        # mode luma membalik kanal V di HSV: bukan fungsi per kanal
+        return (params or {}).get("mode", "rgb") != "luma"
+    return operation in STATIC_TABLES or operation in DYNAMIC_TABLES
+
+
+def _histograms(image: np.ndarray) -> np.ndarray:
+    # bincount (int64), bukan calcHist: hitungan float32 tidak eksak di atas 2^24 piksel per bin
+    planes = [image] if image.ndim == 2 else cv2.split(image)
+    return np.stack([np.bincount(plane.ravel(), minlength=256) for plane in planes])
+
+
+def _to_gray(image: np.ndarray) -> np.ndarray:
+    if image.ndim == 2:
+        return image
+    if image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def _apply_table(image: np.ndarray, table: np.ndarray) -> np.ndarray:
+    if image.ndim == 2:
+        return cv2.LUT(image, np.ascontiguousarray(table[:, 0]))
+    if np.all(table == table[:, :1]):
+        return cv2.LUT(image, np.ascontiguousarray(table[:, 0]))
+    return cv2.LUT(image, np.ascontiguousarray(table).reshape(1, 256, table.shape[1]))
+
+
+class _Compiler:
+    """Accumulates a per-channel (256, C) table; materialises only at a grayscale boundary."""
+
+    def __init__(self, image: np.ndarray) -> None:
+        self.image = image
+        self.channels = 1 if image.ndim == 2 else image.shape[2]
+        self.table = np.repeat(_RAMP[:, None], self.channels, axis=1)
+        self.identity = True
+        self._source_hist: Optional[np.ndarray] = None
+        self.grayscaled = False
+
+    def histograms(self) -> np.ndarray:
+        """Histogram of the *current* intermediate: source histogram pushed through the table."""
+        if self._source_hist is None:
+            self._source_hist = _histograms(self.image)
+        return np.stack(
+            [
+                np.bincount(self.table[:, c], weights=self._source_hist[c], minlength=256)
+                for c in range(self.channels)
+            ]
+        ).astype(np.int64)
+
+    def to_gray(self) -> None:
+        if not self.identity:
+            self.image = _apply_table(self.image, self.table)
+        self.image = _to_gray(self.image)
+        self.channels = 1
+        self.table = _RAMP[:, None].copy()
+        self.identity = True
+        self._source_hist = None
+        self.grayscaled = True
+
+    def push(self, operation: str, params: Dict[str, Any]) -> None:
+        if operation in GRAY_INPUT and self.channels != 1:
+            self.to_gray()
+        elif operation in GRAY_INPUT:
+            self.grayscaled = True
+        if operation in STATIC_TABLES:
+            step = STATIC_TABLES[operation](_freeze(params))[:, None]
+        else:
+            step = DYNAMIC_TABLES[operation](params, self.histograms())
+            if step.ndim == 1:
+                step = step[:, None]
+        if step.shape[1] == 1 and self.channels > 1:
+            step = np.repeat(step, self.channels, axis=1)
+        # komposisi: tabel_baru[v, c] = step[tabel[v, c], c]
+        self.table = np.take_along_axis(step, self.table.astype(np.intp), axis=0)
+        self.identity = False
+
+    def result(self) -> np.ndarray:
+        image = self.image if self.identity else _apply_table(self.image, self.table)
+        if self.grayscaled and image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        return image
+
+
+def apply_point_ops(image: np.ndarray, steps: Sequence[PointStep]) -> np.ndarray:
+    """Apply consecutive point ops (canonical ids, validated params) in a single LUT pass."""
+    if image.dtype != np.uint8:
+        raise ValueError("Operasi titik berbasis LUT membutuhkan citra uint8")
+    if image.ndim == 3 and image.shape[2] == 4:
+        rgb, alpha = image[:, :, :3], image[:, :, 3]
+    else:
+        rgb, alpha = image, None
+    compiler = _Compiler(rgb)
+    for operation, params in steps:
+        compiler.push(operation, params)
+    result = compiler.result()
+    if alpha is None:
+        return result
+    if result.ndim == 2:
+        result = cv2.cvtColor(result, cv2.COLOR_GRAY2BGR)
+    return np.dstack([result, alpha])
+
+
+__all__ = [
+    "THRESH_TYPES",
+    "apply_point_ops",
+    "histogram_percentile",
+    "is_point_op",
+]
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Progress reporting and cooperative cancellation inside operation handlers.
+
+Handlers call :func:`report` from their loops (snake iterations, k-means
+attempts, tiles, pipeline steps). The call is a no-op unless the caller
+installed a sink with :func:`reporting` on the same thread, so handlers
+stay usable from previews and tests. :func:`stage` maps nested reports onto
+a slice of the enclosing range, which lets a pipeline step or a tiling pass
+report 0..1 without knowing where it sits in the whole job.
+
+:class:`Reporter` rate-limits what reaches the sink, so a handler may
+report on every iteration without flooding job subscribers.
+
+Every :func:`report` (and :func:`checkpoint`) is also a cancellation
+point: when the :class:`CancelToken` installed with the sink was cancelled
+or ran past its deadline, the call raises :class:`OperationCancelled` and
+the handler unwinds. Python cannot interrupt a running thread, so work
+between two checkpoints (a single OpenCV call) always runs to completion.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, Tuple, TypeVar
+
+# Jeda minimum antar laporan progres yang diteruskan ke job (default 4x per detik).
+PROGRESS_INTERVAL = max(0.0, float(os.getenv("AINTRA_PROGRESS_INTERVAL_MS", "250")) / 1000.0)
+
+Sink = Callable[[float], None]
+# (sink, awal rentang, lebar rentang, token pembatalan) untuk thread saat ini
+_Span = Tuple[Optional[Sink], float, float, Optional["CancelToken"]]
+
+T = TypeVar("T")
+
+_local = threading.local()
+
+
+class OperationCancelled(Exception):
+    """Raised at a checkpoint once the running operation was cancelled."""
+
+
+class DeadlineExceeded(OperationCancelled):
+    """Raised at a checkpoint once the operation ran past its wall-clock deadline."""
+
+
+class CancelToken:
+    """
+    Cancellation flag with an optional wall-clock deadline, shared between
+    the code that owns the work and the thread running it.
+    """
+
+    __slots__ = ("reason", "timeout", "deadline")
+
+    def __init__(self, timeout: Optional[float] = None) -> None:
+        self.reason: Optional[str] = None
+        self.timeout: Optional[float] = None
+        self.deadline: Optional[float] = None
+        self.set_timeout(timeout)
+
+    def set_timeout(self, timeout: Optional[float]) -> None:
+        """(Re)start the deadline ``timeout`` seconds from now; ``None`` or 0 disables it."""
+        self.timeout = timeout or None
+        self.deadline = time.monotonic() + timeout if timeout else None
+
+    def cancel(self, reason: str = "Dibatalkan") -> None:
+        if self.reason is None:
+            self.reason = reason
+
+    def remaining(self) -> Optional[float]:
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None or (self.deadline is not None and time.monotonic() >= self.deadline)
+
+    def check(self) -> None:
+        if self.reason is not None:
+            raise OperationCancelled(self.reason)
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise DeadlineExceeded(f"Operasi melewati batas waktu {self.timeout:g} detik")
+
+
+class Reporter:
+    """Throttled, monotonic sink for fractions in ``[0, 1]``; completion (1.0) always passes."""
+
+    __slots__ = ("_callback", "_interval", "_last", "_last_at")
+
+    def __init__(self, callback: Sink, interval: float = PROGRESS_INTERVAL) -> None:
+        self._callback = callback
+        self._interval = interval
+        self._last = 0.0
+        self._last_at = float("-inf")
+
+    def __call__(self, fraction: float) -> None:
+        fraction = min(1.0, max(0.0, float(fraction)))
+        if fraction <= self._last:
+            return
+        now = time.monotonic()
+        if fraction < 1.0 and now - self._last_at < self._interval:
+            return
+        self._last = fraction
+        self._last_at = now
+        self._callback(fraction)
+
+
+def _current() -> Optional[_Span]:
+    return getattr(_local, "span", None)
+
+
+@contextmanager
+def reporting(sink: Optional[Sink], token: Optional[CancelToken] = None) -> Iterator[None]:
+    """
+    Route :func:`report` calls made on this thread to ``sink`` (usually a
+    :class:`Reporter`) and check ``token`` at each of them.
+    """
+    previous = _current()
+    _local.span = (sink, 0.0, 1.0, token)
+    try:
+        yield
+    finally:
+        _local.span = previous
+
+
+def guarded(token: Optional[CancelToken], func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Call ``func`` on this thread with ``token`` checked at every checkpoint inside it."""
+    with reporting(None, token):
+        return func(*args, **kwargs)
+
+
+def checkpoint() -> None:
+    """Raise :class:`OperationCancelled` if the current work was cancelled; otherwise a no-op."""
+    span = _current()
+    if span is not None and span[3] is not None:
+        span[3].check()
+
+
+def report(done: float, total: float = 1.0) -> None:
+    """Report ``done`` out of ``total`` units of the current range; also a cancellation checkpoint."""
+    span = _current()
+    if span is None:
+        return
+    sink, start, width, token = span
+    if token is not None:
+        token.check()
+    if sink is not None and total > 0:
+        sink(start + width * min(1.0, done / total))
+
+
+@contextmanager
+def stage(index: int, count: int) -> Iterator[None]:
+    """Narrow the current range to the ``index``-th of ``count`` equal slices; reports its end on exit."""
+    span = _current()
+    if span is None or count <= 0:
+        yield
+        return
+    sink, start, width, token = span
+    _local.span = (sink, start + width * index / count, width / count, token)
+    try:
+        yield
+    finally:
+        _local.span = span
+    if sink is not None:
+        sink(start + width * (index + 1) / count)
+
+
+__all__ = [
+    "PROGRESS_INTERVAL",
+    "CancelToken",
+    "DeadlineExceeded",
+    "OperationCancelled",
+    "Reporter",
+    "checkpoint",
+    "guarded",
+    "report",
+    "reporting",
+    "stage",
+]
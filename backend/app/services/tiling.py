@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Tiled execution of neighbourhood operations for very large images.
+
+An operation whose output pixel depends only on input pixels within a fixed
+radius can be computed tile by tile: each tile is processed together with a
+halo of that radius and only its interior is copied to the output. Tiles
+touching the image edge keep the real edge, so OpenCV's border handling is
+identical to the whole-image call and the result is seam-free (bit-exact).
+
+Tiles run in parallel on a thread pool (OpenCV releases the GIL) and the
+output of large images is a disk-backed ``np.memmap``, so the working set is
+bounded by ``workers * (tile + 2 * halo)^2`` rather than by the image size.
+Inputs may themselves be memory-mapped (``np.load(..., mmap_mode="r")``, see
+``storage.load_upload_raster``). Process-pool children cap their tile threads
+with ``limit_workers`` so a pool of N children does not run N * cpu threads.
+"""
+from __future__ import annotations
+
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from . import progress
+from .image_ops import (
+    CANONICAL_OPERATIONS,
+    OperationParams,
+    _ensure_odd,
+    normalise_operation_name,
+    prepare_operation_params,
+    split_alpha,
+    to_gray,
+)
+
+TILE_SIZE = max(64, int(os.getenv("AINTRA_TILE_SIZE", "1024")))
+# Citra di bawah ambang ini diproses utuh: overhead tiling tidak sebanding.
+TILE_MIN_PIXELS = int(float(os.getenv("AINTRA_TILE_MIN_MEGAPIXELS", "16")) * 1_000_000)
+TILE_WORKERS = max(1, int(os.getenv("AINTRA_TILE_WORKERS", str(os.cpu_count() or 1))))
+# Keluaran lebih besar dari ini ditulis ke memmap (file sementara) alih-alih RAM.
+TILE_MEMMAP_BYTES = int(float(os.getenv("AINTRA_TILE_MEMMAP_MB", "256")) * 1024 * 1024)
+TILE_DIR = os.getenv("AINTRA_TILE_DIR") or None
+
+Bounds = Tuple[int, int, int, int]
+
+
+def _halo_gaussian(params: OperationParams) -> int:
+    return _ensure_odd(int(params.get("ksize", 5))) // 2
+
+
+def _halo_median(params: OperationParams) -> int:
+    return _ensure_odd(int(params.get("ksize", 5))) // 2
+
+
+def _halo_bilateral(params: OperationParams) -> int:
+    diameter = int(params.get("d", 9))
+    if diameter > 0:
+        return diameter // 2
+    # d <= 0: OpenCV menurunkan radius dari sigmaSpace
+    return int(round(float(params.get("sigmaSpace", 75)) * 1.5))
+
+
+def _halo_morph(params: OperationParams) -> int:
+    radius = max(1, int(params.get("kernel", 3))) // 2
+    iterations = max(1, int(params.get("iter", 1)))
+    passes = 2 if params.get("op", "open") in {"open", "close"} else 1
+    return radius * iterations * passes
+
+
+def _halo_nlmeans(params: OperationParams) -> int:
+    template = _ensure_odd(int(params.get("template", 7)))
+    search = _ensure_odd(int(params.get("search", 21)))
+    return search // 2 + template // 2
+
+
+# radius ketergantungan per operasi (piksel); operasi lain tidak di-tile
+TILE_HALOS: Dict[str, Callable[[OperationParams], int]] = {
+    "gaussian": _halo_gaussian,
+    "median": _halo_median,
+    "bilateral": _halo_bilateral,
+    "morph": _halo_morph,
+    "nlmeans": _halo_nlmeans,
+}
+# operasi dengan langkah global yang ditangani khusus (lihat _tiled_clahe)
+GLOBAL_TILED = {"hist_eq_clahe"}
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=TILE_WORKERS, thread_name_prefix="aintra-tile")
+        return _pool
+
+
+def limit_workers(limit: int) -> None:
+    """Cap the tile threads of this process; must run before the first tiled call creates the pool."""
+    global TILE_WORKERS
+    TILE_WORKERS = max(1, min(TILE_WORKERS, int(limit)))
+
+
+def is_tileable(operation: str) -> bool:
+    canonical = normalise_operation_name(operation)
+    return canonical in TILE_HALOS or canonical in GLOBAL_TILED
+
+
+def should_tile(image: np.ndarray, operation: str) -> bool:
+    return is_tileable(operation) and image.shape[0] * image.shape[1] >= TILE_MIN_PIXELS
+
+
+def iter_tiles(height: int, width: int, tile_size: int) -> Iterator[Bounds]:
+    for y0 in range(0, height, tile_size):
+        for x0 in range(0, width, tile_size):
+            yield y0, min(y0 + tile_size, height), x0, min(x0 + tile_size, width)
+
+
+def allocate_output(shape: Tuple[int, ...], dtype: Any = np.uint8, memmap_bytes: Optional[int] = None) -> np.ndarray:
+    """Plain array for small outputs, anonymous disk-backed memmap for large ones."""
+    memmap_bytes = TILE_MEMMAP_BYTES if memmap_bytes is None else memmap_bytes
+    nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    if nbytes <= memmap_bytes:
+        return np.empty(shape, dtype=dtype)
+    # file langsung terhapus saat ditutup; mapping tetap valid selama array hidup
+    handle = tempfile.TemporaryFile(dir=TILE_DIR)
+    return np.memmap(handle, dtype=dtype, mode="w+", shape=shape)
+
+
+def _run_tiles(tiles: List[Bounds], work: Callable[[Bounds], None], workers: int, done: int = 0) -> None:
+    """Run ``work`` over ``tiles``; ``done`` tiles were already processed by the caller (for progress)."""
+    total = done + len(tiles)
+    if workers <= 1 or len(tiles) <= 1:
+        for index, bounds in enumerate(tiles, done + 1):
+            work(bounds)
+            progress.report(index, total)
+        return
+    # map() menghasilkan urut & mempropagasikan exception dari tile mana pun; progres dilaporkan dari thread pemanggil
+    for index, _ in enumerate(_executor().map(work, tiles), done + 1):
+        progress.report(index, total)
+
+
+def apply_tiled(
+    image: np.ndarray,
+    operation: str,
+    params: Optional[OperationParams] = None,
+    *,
+    tile_size: int = TILE_SIZE,
+    workers: Optional[int] = None,
+    memmap_bytes: Optional[int] = None,
+) -> np.ndarray:
+    # dibaca saat dipanggil, bukan saat definisi: limit_workers di proses anak harus berlaku
+    workers = TILE_WORKERS if workers is None else workers
+    memmap_bytes = TILE_MEMMAP_BYTES if memmap_bytes is None else memmap_bytes
+    canonical = normalise_operation_name(operation)
+    validated = prepare_operation_params(canonical, params or {})
+    if canonical in GLOBAL_TILED:
+        return _tiled_clahe(image, validated, tile_size, workers, memmap_bytes)
+    halo_fn = TILE_HALOS.get(canonical)
+    if halo_fn is None:
+        raise ValueError(f"Operation {operation} tidak mendukung tiling")
+    func = CANONICAL_OPERATIONS[canonical]
+    halo = halo_fn(validated)
+    height, width = image.shape[:2]
+
+    def process(bounds: Bounds) -> np.ndarray:
+        y0, y1, x0, x1 = bounds
+        top, left = max(0, y0 - halo), max(0, x0 - halo)
+        crop = np.ascontiguousarray(image[top : min(height, y1 + halo), left : min(width, x1 + halo)])
+        result = func(crop, validated)
+        return result[y0 - top : y0 - top + (y1 - y0), x0 - left : x0 - left + (x1 - x0)]
+
+    tiles = list(iter_tiles(height, width, tile_size))
+    # tile pertama dijalankan dulu untuk mengetahui jumlah kanal/dtype keluaran
+    first = process(tiles[0])
+    out = allocate_output((height, width) + first.shape[2:], first.dtype, memmap_bytes)
+    y0, y1, x0, x1 = tiles[0]
+    out[y0:y1, x0:x1] = first
+
+    def work(bounds: Bounds) -> None:
+        b_y0, b_y1, b_x0, b_x1 = bounds
+        out[b_y0:b_y1, b_x0:b_x1] = process(bounds)
+
+    _run_tiles(tiles[1:], work, workers, done=1)
+    return out
+
+
+def _tiled_clahe(
+    image: np.ndarray,
+    params: OperationParams,
+    tile_size: int,
+    workers: int,
+    memmap_bytes: int,
+) -> np.ndarray:
+    """CLAHE/HE need the whole luminance plane; only that 1-byte plane is held in full."""
+    func = CANONICAL_OPERATIONS["hist_eq_clahe"]
+    if image.ndim != 3:
+        return func(image, params)
+    mode = params.get("mode", "clahe_lab")
+    height, width = image.shape[:2]
+    rgb, alpha = split_alpha(image)
+    tiles = list(iter_tiles(height, width, tile_size))
+    plane = allocate_output((height, width), np.uint8, memmap_bytes)
+
+    def extract(bounds: Bounds) -> None:
+        y0, y1, x0, x1 = bounds
+        block = np.ascontiguousarray(rgb[y0:y1, x0:x1])
+        if mode == "he_gray":
+            plane[y0:y1, x0:x1] = to_gray(block)
+        else:
+            plane[y0:y1, x0:x1] = cv2.cvtColor(block, cv2.COLOR_BGR2LAB)[:, :, 0]
+
+    with progress.stage(0, 2):
+        _run_tiles(tiles, extract, workers)
+    if mode == "he_gray":
+        equalized = cv2.equalizeHist(np.asarray(plane))
+    else:
+        clip_limit = float(params.get("clip_limit", 2.0))
+        tile_grid = max(2, int(params.get("tile_grid", 8)))
+        clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=(tile_grid, tile_grid))
+        equalized = clahe.apply(np.asarray(plane))
+    del plane
+
+    channels = 4 if alpha is not None else 3
+    out = allocate_output((height, width, channels), np.uint8, memmap_bytes)
+
+    def merge(bounds: Bounds) -> None:
+        y0, y1, x0, x1 = bounds
+        if mode == "he_gray":
+            bgr = cv2.cvtColor(equalized[y0:y1, x0:x1], cv2.COLOR_GRAY2BGR)
+        else:
+            lab = cv2.cvtColor(np.ascontiguousarray(rgb[y0:y1, x0:x1]), cv2.COLOR_BGR2LAB)
+            lab[:, :, 0] = equalized[y0:y1, x0:x1]
+            bgr = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
+        out[y0:y1, x0:x1, :3] = bgr
+        if alpha is not None:
+            out[y0:y1, x0:x1, 3] = alpha[y0:y1, x0:x1]
+
+    with progress.stage(1, 2):
+        _run_tiles(tiles, merge, workers)
+    return out
+
+
+def apply_operation(image: np.ndarray, operation: str, params: Optional[OperationParams]) -> np.ndarray:
+    """Drop-in for ``image_ops.apply_operation`` that tiles large inputs of tileable operations."""
+    if should_tile(image, operation):
+        return apply_tiled(image, operation, params)
+    func = CANONICAL_OPERATIONS.get(normalise_operation_name(operation))
+    if func is None:
+        raise ValueError(f"Operation {operation} is not supported")
+    return func(image, prepare_operation_params(operation, params or {}))
+
+
+__all__ = [
+    "TILE_HALOS",
+    "allocate_output",
+    "apply_operation",
+    "apply_tiled",
+    "is_tileable",
+    "iter_tiles",
+    "limit_workers",
+    "should_tile",
+]
@@ -1,33 +1,61 @@
-﻿import json
+﻿import asyncio
+import hashlib
 import os
 import logging
+import threading
 import time
 import uuid
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Optional
+from typing import BinaryIO, Callable, List, Optional, Tuple
 
 import numpy as np
 import cv2
 from fastapi import HTTPException, UploadFile
+from PIL import Image, UnidentifiedImageError
+
+from . import histograms
+from .metadata_store import MetadataStore
 
 MAX_UPLOAD_SIZE = 25 * 1024 * 1024  # 25 MB
 ALLOWED_MIME = {"image/png", "image/jpeg", "image/jpg", "image/webp"}
 ALLOWED_EXT = {".png", ".jpg", ".jpeg", ".webp"}
+MAX_UPLOAD_PIXELS = int(float(os.getenv("AINTRA_MAX_UPLOAD_MEGAPIXELS", "100")) * 1_000_000)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# format hasil probe header (Pillow) -> ekstensi file / MIME yang disimpan
+FORMAT_EXTENSIONS = {"PNG": ".png", "JPEG": ".jpg", "WEBP": ".webp"}
+FORMAT_MIME = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
 TTL_HOURS = int(os.getenv("AINTRA_STORAGE_TTL_HOURS", "72"))
 
 STORAGE_ROOT = Path(os.getenv("AINTRA_STORAGE", "data")).resolve()
 UPLOAD_DIR = STORAGE_ROOT / "uploads"
 PREVIEW_DIR = STORAGE_ROOT / "previews"
 RESULT_DIR = STORAGE_ROOT / "results"
+CACHE_DIR = STORAGE_ROOT / "cache"
+PYRAMID_DIR = STORAGE_ROOT / "pyramid"
 METADATA_SUFFIX = ".json"
-
-for directory in (STORAGE_ROOT, UPLOAD_DIR, PREVIEW_DIR, RESULT_DIR):
+# histogram (lihat app/histograms.py) disimpan di samping citranya: <key>.hist.npy
+HISTOGRAM_SUFFIX = ".hist.npy"
+# Lebar level piramida preview; hanya level yang lebih kecil dari lebar asli yang dibuat.
+PYRAMID_LEVELS: Tuple[int, ...] = (256, 512, 1024, 2048)
+# Upload yang hasil decode-nya lebih besar dari ini disimpan sekali sebagai raster mentah (.npy) dan dibaca
+# lewat memmap oleh job; ambangnya sama dengan keluaran memmap tiling (services/tiling.py).
+RASTER_MEMMAP_BYTES = int(float(os.getenv("AINTRA_TILE_MEMMAP_MB", "256")) * 1024 * 1024)
+
+for directory in (STORAGE_ROOT, UPLOAD_DIR, PREVIEW_DIR, RESULT_DIR, CACHE_DIR, PYRAMID_DIR):
     directory.mkdir(parents=True, exist_ok=True)
 
 logger = logging.getLogger("aintra.storage")
 
+METADATA_DB = STORAGE_ROOT / "metadata.sqlite3"
+# dibuka saat pertama dipakai, bukan saat import: import modul tidak boleh membuat database
+_metadata_store: Optional[MetadataStore] = None
+_metadata_store_lock = threading.Lock()
+
+# dipanggil dengan image_id setiap kali cleanup_expired menghapus sebuah upload
+_upload_expiry_listeners: List[Callable[[str], None]] = []
+
 
 @dataclass
 class StoredImage:
@@ -38,6 +66,11 @@ class StoredImage:
     size: int
     created_at: datetime
     url: str
+    sha256: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    # lebar level piramida yang tersedia (urut naik); None = belum dibuat (dibuat saat preview pertama)
+    pyramid: Optional[Tuple[int, ...]] = None
 
 
 class StorageError(HTTPException):
@@ -90,20 +123,61 @@ def prepare_image_for_save(data: np.ndarray) -> np.ndarray:
         raise StorageError(status_code=500, detail="Jumlah kanal citra tidak didukung")
 
     raise StorageError(status_code=500, detail="Format citra tidak didukung")
-def _metadata_path(image_id: str, target_dir: Path) -> Path:
-    return target_dir / f"{image_id}{METADATA_SUFFIX}"
+
+
+def encode_for_save(data: np.ndarray, extension: str = ".png", params: Optional[List[int]] = None) -> bytes:
+    """Encode an array the way results are written, without touching disk."""
+    image = prepare_image_for_save(data)
+    ok, buffer = cv2.imencode(extension, image, params or [])
+    if not ok:
+        raise StorageError(status_code=500, detail="Gagal meng-encode citra")
+    return buffer.tobytes()
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _metadata_kind(directory: Path) -> str:
+    if directory == UPLOAD_DIR:
+        return "upload"
+    if directory == PREVIEW_DIR:
+        return "preview"
+    if directory == RESULT_DIR:
+        return "result"
+    raise ValueError(f"Direktori tanpa metadata: {directory}")
+
+
+def get_metadata_store() -> MetadataStore:
+    global _metadata_store
+    if _metadata_store is None:
+        with _metadata_store_lock:
+            if _metadata_store is None:
+                _metadata_store = MetadataStore(METADATA_DB)
+    return _metadata_store
+
+
+def migrate_sidecars() -> int:
+    """Import legacy ``*.json`` sidecars into the metadata store and delete them."""
+    return get_metadata_store().import_sidecars(
+        [("upload", UPLOAD_DIR), ("preview", PREVIEW_DIR), ("result", RESULT_DIR)],
+        METADATA_SUFFIX,
+    )
 
 
 def _write_metadata(image_id: str, directory: Path, metadata: dict) -> None:
-    metadata_path = _metadata_path(image_id, directory)
-    metadata_path.write_text(json.dumps(metadata, ensure_ascii=False, indent=2), encoding="utf-8")
+    get_metadata_store().put(_metadata_kind(directory), image_id, metadata)
 
 
 def _load_metadata(image_id: str, directory: Path) -> dict:
-    metadata_path = _metadata_path(image_id, directory)
-    if not metadata_path.exists():
+    metadata = get_metadata_store().get(_metadata_kind(directory), image_id)
+    if metadata is None:
         raise StorageError(status_code=404, detail="Metadata tidak ditemukan")
-    return json.loads(metadata_path.read_text())
+    return metadata
 
 
 def _public_url(directory: Path, filename: str) -> str:
@@ -117,42 +191,136 @@ def _public_url(directory: Path, filename: str) -> str:
     return f"/media/{relative}"
 
 
-async def save_upload(file: UploadFile) -> StoredImage:
-    raw = await file.read(MAX_UPLOAD_SIZE + 1)
-    if len(raw) == 0:
-        raise StorageError(status_code=400, detail="File kosong")
-    if len(raw) > MAX_UPLOAD_SIZE:
-        raise StorageError(status_code=413, detail="Ukuran file melebihi batas 25MB")
-
-    content_type = file.content_type or "application/octet-stream"
-    if content_type not in ALLOWED_MIME:
-        raise StorageError(status_code=400, detail="Tipe MIME tidak didukung")
-
-    image_array = cv2.imdecode(np.frombuffer(raw, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
-    if image_array is None:
+def pyramid_path(image_id: str, level: int) -> Path:
+    return PYRAMID_DIR / f"{image_id}_{level}.png"
+
+
+def build_pyramid(image_id: str, image: np.ndarray) -> Tuple[int, ...]:
+    """Write downscaled copies of ``image`` for every level narrower than it; returns the levels written."""
+    width = image.shape[1]
+    levels = [level for level in PYRAMID_LEVELS if level < width]
+    built = []
+    current = image
+    # dari level terbesar ke terkecil: tiap level di-resize dari level sebelumnya, bukan dari asli
+    for level in sorted(levels, reverse=True):
+        h, w = current.shape[:2]
+        height = max(1, int(round(h * level / float(w))))
+        current = cv2.resize(current, (level, height), interpolation=cv2.INTER_AREA)
+        if not cv2.imwrite(str(pyramid_path(image_id, level)), current, [cv2.IMWRITE_PNG_COMPRESSION, 1]):
+            logger.warning("gagal menyimpan level piramida image_id=%s level=%d", image_id, level)
+            continue
+        built.append(level)
+    return tuple(sorted(built))
+
+
+def raster_path(image_id: str) -> Path:
+    return PYRAMID_DIR / f"{image_id}_raw.npy"
+
+
+def load_upload_raster(path: Path, memmap_bytes: int = RASTER_MEMMAP_BYTES) -> np.ndarray:
+    """Decode an upload for a job; large ones are decoded once and then read memory-mapped."""
+    # nama file upload = <image_id><ext>
+    raw = raster_path(path.stem)
+    if raw.exists():
+        try:
+            return np.load(raw, mmap_mode="r")
+        except (OSError, ValueError):
+            # raster rusak/terpotong: decode ulang dari file asli
+            raw.unlink(missing_ok=True)
+    image = cv2.imread(str(path), cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise ValueError("Gagal memuat citra")
+    if image.nbytes <= memmap_bytes:
+        return image
+    temp_path = raw.with_name(f".{raw.name}.{uuid.uuid4().hex[:8]}.part")
+    try:
+        spilled = np.lib.format.open_memmap(temp_path, mode="w+", dtype=image.dtype, shape=image.shape)
+        spilled[...] = image
+        spilled.flush()
+        del spilled
+        os.replace(temp_path, raw)
+    except OSError:
+        logger.warning("gagal menyimpan raster %s, citra tetap dipakai dari memori", raw.name)
+        return image
+    finally:
+        temp_path.unlink(missing_ok=True)
+    # salinan hasil decode dilepas; job membaca piksel dari page cache sesuai kebutuhan tile
+    del image
+    return np.load(raw, mmap_mode="r")
+
+
+def select_pyramid_level(stored: StoredImage, width: int) -> Optional[int]:
+    """Smallest pyramid level at least ``width`` wide, or None when only the original covers it."""
+    for level in stored.pyramid or ():
+        if level >= width:
+            return level
+    return None
+
+
+def _stream_to_file(source: BinaryIO, destination: Path) -> Tuple[int, str]:
+    """Copy ``source`` in chunks, enforcing MAX_UPLOAD_SIZE as bytes arrive; returns (size, sha256)."""
+    digest = hashlib.sha256()
+    size = 0
+    with destination.open("wb") as handle:
+        while True:
+            chunk = source.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > MAX_UPLOAD_SIZE:
+                raise StorageError(status_code=413, detail="Ukuran file melebihi batas 25MB")
+            digest.update(chunk)
+            handle.write(chunk)
+    return size, digest.hexdigest()
+
+
+def _probe_image(path: Path) -> Tuple[str, int, int]:
+    """Read only the header: returns (format, width, height) without decoding pixels."""
+    try:
+        with Image.open(path) as probe:
+            image_format = (probe.format or "").upper()
+            width, height = probe.size
+    except Image.DecompressionBombError as exc:
+        raise StorageError(status_code=413, detail="Resolusi citra melebihi batas") from exc
+    except (UnidentifiedImageError, OSError) as exc:
+        raise StorageError(status_code=400, detail="File bukan citra valid") from exc
+    if image_format not in FORMAT_EXTENSIONS:
+        raise StorageError(status_code=400, detail="Format citra tidak didukung")
+    if width <= 0 or height <= 0:
         raise StorageError(status_code=400, detail="File bukan citra valid")
+    if width * height > MAX_UPLOAD_PIXELS:
+        raise StorageError(status_code=413, detail="Resolusi citra melebihi batas")
+    return image_format, width, height
 
-    extension = {
-        "image/png": ".png",
-        "image/jpeg": ".jpg",
-        "image/jpg": ".jpg",
-        "image/webp": ".webp",
-    }.get(content_type, ".png")
 
+def _save_upload_sync(file: UploadFile) -> StoredImage:
     image_id = uuid.uuid4().hex
-    filename = f"{image_id}{extension}"
-    path = UPLOAD_DIR / filename
-
-    if not cv2.imwrite(str(path), image_array):
-        raise StorageError(status_code=500, detail="Gagal menyimpan file")
-
+    temp_path = UPLOAD_DIR / f".{image_id}.part"
+    try:
+        size, digest = _stream_to_file(file.file, temp_path)
+        if size == 0:
+            raise StorageError(status_code=400, detail="File kosong")
+        image_format, width, height = _probe_image(temp_path)
+        filename = f"{image_id}{FORMAT_EXTENSIONS[image_format]}"
+        path = UPLOAD_DIR / filename
+        # rename atomik: pembaca tidak pernah melihat file setengah jadi
+        os.replace(temp_path, path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+    created_at = datetime.now(timezone.utc)
+    # MIME disimpan dari format hasil probe, bukan dari header klien
+    content_type = FORMAT_MIME[image_format]
     metadata = {
         "image_id": image_id,
         "filename": file.filename or filename,
         "content_type": content_type,
-        "size": len(raw),
+        "size": size,
         "saved_filename": filename,
-        "created_at": datetime.now(timezone.utc).isoformat(),
+        "sha256": digest,
+        "width": width,
+        "height": height,
+        "created_at": created_at.isoformat(),
     }
     _write_metadata(image_id, UPLOAD_DIR, metadata)
 
@@ -161,18 +329,49 @@ async def save_upload(file: UploadFile) -> StoredImage:
         path=path,
         filename=file.filename or filename,
         content_type=content_type,
-        size=len(raw),
-        created_at=datetime.now(timezone.utc),
+        size=size,
+        created_at=created_at,
         url=_public_url(UPLOAD_DIR, filename),
+        sha256=digest,
+        width=width,
+        height=height,
     )
 
 
+async def save_upload(file: UploadFile) -> StoredImage:
+    content_type = file.content_type or "application/octet-stream"
+    if content_type not in ALLOWED_MIME:
+        raise StorageError(status_code=400, detail="Tipe MIME tidak didukung")
+    # byte asli disimpan apa adanya; decode (dan piramida preview) ditunda sampai dipakai pertama kali
+    return await asyncio.to_thread(_save_upload_sync, file)
+
+
+def ensure_pyramid(stored: StoredImage, image: np.ndarray) -> StoredImage:
+    """Build the preview pyramid on first use and record it in the upload metadata."""
+    if stored.pyramid is not None:
+        return stored
+    levels = build_pyramid(stored.image_id, image)
+    try:
+        metadata = _load_metadata(stored.image_id, UPLOAD_DIR)
+    except StorageError:
+        return replace(stored, pyramid=levels)
+    metadata["pyramid"] = list(levels)
+    _write_metadata(stored.image_id, UPLOAD_DIR, metadata)
+    return replace(stored, pyramid=levels)
+
+
 def get_upload(image_id: str) -> StoredImage:
     metadata = _load_metadata(image_id, UPLOAD_DIR)
     saved_filename = metadata["saved_filename"]
     path = UPLOAD_DIR / saved_filename
     if not path.exists():
         raise StorageError(status_code=404, detail="File tidak ditemukan")
+    digest = metadata.get("sha256")
+    if not digest:
+        # upload lama (sebelum sha256 disimpan): hash sekali lalu simpan, bukan di setiap panggilan
+        digest = _file_sha256(path)
+        metadata["sha256"] = digest
+        _write_metadata(image_id, UPLOAD_DIR, metadata)
     return StoredImage(
         image_id=image_id,
         path=path,
@@ -181,15 +380,20 @@ def get_upload(image_id: str) -> StoredImage:
         size=metadata.get("size", path.stat().st_size),
         created_at=datetime.fromisoformat(metadata.get("created_at")),
         url=_public_url(UPLOAD_DIR, saved_filename),
+        sha256=digest,
+        width=metadata.get("width"),
+        height=metadata.get("height"),
+        pyramid=tuple(metadata["pyramid"]) if "pyramid" in metadata else None,
     )
 
 
-def save_preview(image_id: str, data: np.ndarray, suffix: str = "preview") -> str:
-    filename = f"{image_id}_{suffix}.png"
+def save_preview_bytes(image_id: str, data: bytes, suffix: str = "preview", extension: str = ".png") -> str:
+    filename = f"{image_id}_{suffix}{extension}"
     path = PREVIEW_DIR / filename
-    image = prepare_image_for_save(data)
-    if not cv2.imwrite(str(path), image):
-        raise StorageError(status_code=500, detail="Gagal menyimpan preview")
+    try:
+        path.write_bytes(data)
+    except OSError as exc:
+        raise StorageError(status_code=500, detail="Gagal menyimpan preview") from exc
     metadata = {
         "image_id": image_id,
         "filename": filename,
@@ -199,20 +403,19 @@ def save_preview(image_id: str, data: np.ndarray, suffix: str = "preview") -> st
     return _public_url(PREVIEW_DIR, filename)
 
 
-def save_result(job_id: str, data: np.ndarray) -> str:
-    filename = f"{job_id}.png"
+def save_result_bytes(job_id: str, data: bytes, extension: str = ".png") -> str:
+    """Write already-encoded bytes (fresh encode or cache hit) as the job result."""
+    if not data:
+        raise StorageError(status_code=500, detail="File hasil kosong")
+    filename = f"{job_id}{extension}"
     path = RESULT_DIR / filename
-    image = prepare_image_for_save(data)
     start = time.perf_counter()
-    if not cv2.imwrite(str(path), image):
-        raise StorageError(status_code=500, detail="Gagal menyimpan hasil operasi")
-    if not path.exists():
-        raise StorageError(status_code=500, detail="File hasil tidak ditemukan setelah penyimpanan")
-    size_bytes = path.stat().st_size
-    if size_bytes <= 0:
-        raise StorageError(status_code=500, detail="File hasil kosong")
+    try:
+        path.write_bytes(data)
+    except OSError as exc:
+        raise StorageError(status_code=500, detail="Gagal menyimpan hasil operasi") from exc
     elapsed_ms = (time.perf_counter() - start) * 1000.0
-    logger.info("saved result path=%s size_bytes=%d elapsed_ms=%.2f", str(path), size_bytes, elapsed_ms)
+    logger.info("saved result path=%s size_bytes=%d elapsed_ms=%.2f", str(path), len(data), elapsed_ms)
     metadata = {
         "job_id": job_id,
         "filename": filename,
@@ -222,6 +425,41 @@ def save_result(job_id: str, data: np.ndarray) -> str:
     return _public_url(RESULT_DIR, filename)
 
 
+def histogram_path(directory: Path, key: str) -> Path:
+    return directory / f"{key}{HISTOGRAM_SUFFIX}"
+
+
+def save_histogram(directory: Path, key: str, counts: np.ndarray) -> None:
+    """Persist histogram counts next to the image; cleanup_expired removes them with it (``<key>.*``)."""
+    path = histogram_path(directory, key)
+    temp_path = directory / f".{key}.hist.part"
+    try:
+        with temp_path.open("wb") as handle:
+            np.save(handle, np.asarray(counts, dtype=np.int64), allow_pickle=False)
+        os.replace(temp_path, path)
+    except OSError as exc:
+        logger.warning("gagal menyimpan histogram key=%s: %s", key, exc)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+def store_histogram(directory: Path, key: str, image: np.ndarray) -> np.ndarray:
+    """Compute the histogram of an in-memory image and persist it next to the stored file."""
+    counts = histograms.compute(image)
+    save_histogram(directory, key, counts)
+    return counts
+
+
+def load_histogram(directory: Path, key: str) -> Optional[np.ndarray]:
+    try:
+        counts = np.load(histogram_path(directory, key), allow_pickle=False)
+    except (OSError, ValueError):
+        return None
+    if counts.ndim != 2 or counts.shape[1] != 256:
+        return None
+    return counts
+
+
 def get_result_path(job_id: str) -> Path:
     metadata = _load_metadata(job_id, RESULT_DIR)
     filename = metadata.get("filename")
@@ -231,32 +469,37 @@ def get_result_path(job_id: str) -> Path:
     return path
 
 
+def add_upload_expiry_listener(callback: Callable[[str], None]) -> None:
+    """Register a callback (e.g. a cache invalidator) run for every expired upload."""
+    _upload_expiry_listeners.append(callback)
+
+
 def cleanup_expired(now: Optional[datetime] = None) -> int:
     now = now or datetime.now(timezone.utc)
     threshold = now - timedelta(hours=TTL_HOURS)
+    directories = {"upload": UPLOAD_DIR, "preview": PREVIEW_DIR, "result": RESULT_DIR}
+    # migrasi: sidecar *.json versi lama diimpor dulu agar ikut kedaluwarsa
+    migrate_sidecars()
+    metadata_store = get_metadata_store()
     removed = 0
-    for directory in (UPLOAD_DIR, PREVIEW_DIR, RESULT_DIR):
-        for metadata_path in directory.glob(f"*{METADATA_SUFFIX}"):
-            try:
-                data = json.loads(metadata_path.read_text())
-            except json.JSONDecodeError:
-                continue
-            created_at_str = data.get("created_at")
-            if not created_at_str:
-                continue
-            created_at = datetime.fromisoformat(created_at_str)
-            if created_at < threshold:
-                stem = metadata_path.stem
-                image_path = directory / stem
-                if not image_path.suffix:
-                    for candidate in directory.glob(f"{stem}.*"):
-                        if candidate.suffix != METADATA_SUFFIX:
-                            candidate.unlink(missing_ok=True)
-                            removed += 1
-                else:
-                    image_path.unlink(missing_ok=True)
-                    removed += 1
-                metadata_path.unlink(missing_ok=True)
+    for kind, key, filename in metadata_store.expired(threshold):
+        directory = directories.get(kind)
+        if directory is None:
+            continue
+        candidates = set(directory.glob(f"{key}.*"))
+        if filename:
+            candidates.add(directory / filename)
+        for candidate in candidates:
+            if candidate.exists():
+                candidate.unlink(missing_ok=True)
+                removed += 1
+        metadata_store.delete(kind, key)
+        if kind == "upload":
+            for level_path in PYRAMID_DIR.glob(f"{key}_*.png"):
+                level_path.unlink(missing_ok=True)
+            raster_path(key).unlink(missing_ok=True)
+            for callback in _upload_expiry_listeners:
+                callback(key)
     return removed
 
 
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Coalescing progress subscriptions.
+
+A :class:`Subscription` is the mailbox of one consumer (usually one
+WebSocket) and may watch any number of jobs and batches. It keeps only the
+latest undelivered status per key: a newer update overwrites the pending
+one instead of queueing behind it. A slow client therefore costs at most
+one status per watched key and always catches up to the current state,
+and publishing never blocks the job that produced the update.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Dict, List, Set
+
+from .schemas import JobStatusResponse
+
+
+class Subscription:
+    __slots__ = ("keys", "_pending", "_ready", "coalesced")
+
+    def __init__(self) -> None:
+        self.keys: Set[str] = set()
+        self._pending: Dict[str, JobStatusResponse] = {}
+        self._ready = asyncio.Event()
+        # jumlah update yang tertimpa sebelum sempat dikirim
+        self.coalesced = 0
+
+    def publish(self, key: str, response: JobStatusResponse) -> None:
+        """Record ``response`` as the latest state of ``key``; never blocks."""
+        if self._pending.pop(key, None) is not None:
+            self.coalesced += 1
+        self._pending[key] = response
+        self._ready.set()
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def drain(self) -> List[JobStatusResponse]:
+        """Wait for at least one update, then take every pending one (oldest key first)."""
+        while not self._pending:
+            self._ready.clear()
+            await self._ready.wait()
+        updates = list(self._pending.values())
+        self._pending.clear()
+        return updates
+
+    async def get(self) -> JobStatusResponse:
+        """Wait for and take the oldest pending update."""
+        while not self._pending:
+            self._ready.clear()
+            await self._ready.wait()
+        key = next(iter(self._pending))
+        return self._pending.pop(key)
+
+
+__all__ = ["Subscription"]
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+In-process counters, gauges and histograms rendered for ``GET /metrics``
+in the Prometheus text exposition format (0.0.4).
+
+Recording is a dict lookup, a bisect and a few additions under a per-series
+lock, so it is cheap enough for every operation and stage. Process-pool
+children record into :func:`capture` and the parent replays the observations
+(see ``executors``). Every process keeps its own registry: in shared mode
+each API process exposes the work it ran itself.
+"""
+from __future__ import annotations
+
+import bisect
+import math
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# bucket detik: dari titik-operasi sub-milidetik sampai nlmeans/snake puluhan detik
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SIZE_CLASSES_MP = (0.25, 1.0, 4.0, 16.0, 64.0)
+
+Observation = Tuple[str, Tuple[str, ...], float]
+_CAPTURE: ContextVar[Optional[List[Observation]]] = ContextVar("aintra_telemetry_capture", default=None)
+_METRICS: Dict[str, "_Metric"] = {}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        if name in _METRICS:
+            raise ValueError(f"Metrik {name} sudah terdaftar")
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            # seri tanpa label selalu diekspos, bernilai 0 sebelum observasi pertama
+            self._children[()] = self._new_child()
+        _METRICS[name] = self
+
+    def _new_child(self) -> Any:
+        raise NotImplementedError
+
+    def labels(self, *values: str) -> Any:
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} membutuhkan label {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _label_text(self, values: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._samples(values, child))
+        return lines
+
+    def _samples(self, values: Tuple[str, ...], child: Any) -> List[str]:
+        return [f"{self.name}{self._label_text(values)} {_format_value(child.value)}"]
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = float(value)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0, *labels: str) -> None:
+        self.labels(*labels).inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def set(self, value: float, *labels: str) -> None:
+        self.labels(*labels).set(value)
+
+    def inc(self, amount: float = 1.0, *labels: str) -> None:
+        self.labels(*labels).inc(amount)
+
+    def dec(self, amount: float = 1.0, *labels: str) -> None:
+        self.labels(*labels).dec(amount)
+
+
+class _Buckets:
+    __slots__ = ("counts", "sum", "_lock")
+
+    def __init__(self, size: int) -> None:
+        self.counts = [0] * size
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> None:
+        self.bounds = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> _Buckets:
+        return _Buckets(len(self.bounds))
+
+    def observe(self, value: float, *labels: str) -> None:
+        captured = _CAPTURE.get()
+        if captured is not None:
+            captured.append((self.name, labels, value))
+            return
+        child = self.labels(*labels)
+        index = bisect.bisect_left(self.bounds, value)
+        with child._lock:
+            child.counts[index] += 1
+            child.sum += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        """Observe the wall time of the block; nothing is recorded when it raises."""
+        start = time.perf_counter()
+        yield
+        self.observe(time.perf_counter() - start, *labels)
+
+    def _samples(self, values: Tuple[str, ...], child: _Buckets) -> List[str]:
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.bounds, counts):
+            cumulative += count
+            label = self._label_text(values, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{label} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_text(values)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{self._label_text(values)} {cumulative}")
+        return lines
+
+
+def size_class(image: Any) -> str:
+    """Megapixel bucket label of an image array: the smallest bound that holds it."""
+    megapixels = image.shape[0] * image.shape[1] / 1e6
+    for bound in SIZE_CLASSES_MP:
+        if megapixels <= bound:
+            return f"{bound:g}"
+    return "+Inf"
+
+
+@contextmanager
+def capture() -> Iterator[List[Observation]]:
+    """Collect histogram observations instead of recording them (for a process-pool child)."""
+    observed: List[Observation] = []
+    reset = _CAPTURE.set(observed)
+    try:
+        yield observed
+    finally:
+        _CAPTURE.reset(reset)
+
+
+def replay(observations: Sequence[Observation]) -> None:
+    for name, labels, value in observations:
+        metric = _METRICS.get(name)
+        if isinstance(metric, Histogram):
+            metric.observe(value, *labels)
+
+
+def render() -> bytes:
+    lines: List[str] = []
+    for metric in list(_METRICS.values()):
+        lines.extend(metric.collect())
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+OPERATION_SECONDS = Histogram(
+    "aintra_operation_seconds",
+    "Compute time of one operation handler by operation id and input size class (megapixels, upper bound).",
+    ("operation", "size_mp"),
+)
+STAGE_SECONDS = Histogram(
+    "aintra_stage_seconds",
+    "Wall time of a request/job stage (decode, compute, metrics, encode, write).",
+    ("path", "stage"),
+)
+UPLOADS = Counter("aintra_uploads_total", "Uploaded images.")
+UPLOAD_BYTES = Counter("aintra_upload_bytes_total", "Bytes of uploaded images.")
+JOBS_QUEUED = Gauge("aintra_jobs_queued", "Jobs waiting in the queue.")
+JOBS_RUNNING = Gauge("aintra_jobs_running", "Jobs being processed.")
+JOBS_RETAINED = Gauge("aintra_jobs_retained", "Finished jobs and batches whose status is still kept.")
+EXECUTOR_WORKERS = Gauge("aintra_executor_workers", "Worker threads/processes of an executor pool.", ("pool",))
+EXECUTOR_TASKS = Gauge(
+    "aintra_executor_tasks", "Tasks submitted to a pool and not finished; above workers means queueing.", ("pool",)
+)
+WEBSOCKET_CONNECTIONS = Gauge("aintra_websocket_connections", "Open progress WebSocket connections.")
+PROGRESS_SUBSCRIPTIONS = Gauge("aintra_progress_subscriptions", "Job/batch subscriptions held by progress listeners.")
+UPTIME = Gauge("aintra_uptime_seconds", "Seconds since the process started.")
+
+
+class _TrackedPool:
+    """Executor mixin keeping ``aintra_executor_tasks`` / ``_workers`` for its pool label."""
+
+    def __init__(self, *args: Any, pool: str, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._tasks = EXECUTOR_TASKS.labels(pool)
+        EXECUTOR_WORKERS.set(self._max_workers, pool)
+
+    def submit(self, fn: Any, /, *args: Any, **kwargs: Any) -> Future:
+        # naikkan dulu: tugas yang selesai seketika tidak boleh membuat gauge negatif
+        self._tasks.inc()
+        try:
+            future = super().submit(fn, *args, **kwargs)
+        except BaseException:
+            self._tasks.dec()
+            raise
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, _future: Future) -> None:
+        self._tasks.dec()
+
+
+class TrackedThreadPool(_TrackedPool, ThreadPoolExecutor):
+    pass
+
+
+class TrackedProcessPool(_TrackedPool, ProcessPoolExecutor):
+    pass
+
+
+__all__ = [
+    "CONTENT_TYPE",
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "TrackedProcessPool",
+    "TrackedThreadPool",
+    "capture",
+    "render",
+    "replay",
+    "size_class",
+]
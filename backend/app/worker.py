@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Standalone job worker for shared mode: ``python -m app.worker``.
+
+Claims jobs from the shared journal queue (``AINTRA_JOB_MODE=shared``) and
+runs them with the same pipeline as the API process. Results go through
+``storage``, so every worker and API process must see the same
+``AINTRA_STORAGE``. Scale out by starting more workers; SIGTERM hands the
+jobs still in progress back to the queue.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import signal
+
+from .job_manager import job_manager
+
+logger = logging.getLogger("aintra.worker")
+
+
+async def run() -> None:
+    if not job_manager.shared:
+        raise SystemExit("app.worker membutuhkan AINTRA_JOB_MODE=shared")
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    await job_manager.start()
+    logger.info("Worker %s aktif dengan %d slot", job_manager.worker_id, job_manager.worker_count)
+    await stopping.wait()
+    logger.info("Worker %s berhenti, job berjalan dikembalikan ke antrian", job_manager.worker_id)
+    await job_manager.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    asyncio.run(run())
@@ -21,6 +21,12 @@ def test_app(tmp_path, monkeypatch):
     from app import storage
 
     reload(storage)
+    from app import result_cache
+
+    reload(result_cache)
+    from app import image_cache
+
+    reload(image_cache)
     from app import job_manager
 
     reload(job_manager)
@@ -1,5 +1,10 @@
 ﻿# -*- coding: utf-8 -*-
+import base64
+import io
+import json
+import tarfile
 import time
+import zipfile
 from typing import Tuple
 
 import cv2
@@ -79,3 +84,348 @@ def test_upload_rejects_invalid_format(client):
     )
     assert response.status_code == 400
 
+
+
+@pytest.mark.usefixtures("client")
+def test_pipeline_preview_and_process(client):
+    upload = client.post(
+        "/api/upload",
+        files={"file": ("sample.png", _make_image_bytes(), "image/png")},
+    ).json()
+    steps = [
+        {"operation": "gaussian", "params": {"ksize": 3}},
+        {"operation": "hist_eq_clahe", "params": {}},
+        {"operation": "sharpen", "params": {"method": "unsharp"}},
+    ]
+
+    preview = client.post("/api/pipeline/preview", json={"image_id": upload["image_id"], "steps": steps})
+    assert preview.status_code == 200
+    assert preview.json()["operation"] == "gaussian+hist_eq_clahe+sharpen"
+
+    process = client.post("/api/pipeline/process", json={"image_id": upload["image_id"], "steps": steps})
+    assert process.status_code == 200
+    job_id = process.json()["job_id"]
+    status = None
+    for _ in range(20):
+        status = client.get(f"/api/jobs/{job_id}").json()
+        if status["status"] == "completed":
+            break
+        time.sleep(0.2)
+    assert status["status"] == "completed"
+
+
+@pytest.mark.usefixtures("client")
+def test_pipeline_rejects_invalid_step_before_submit(client):
+    upload = client.post(
+        "/api/upload",
+        files={"file": ("sample.png", _make_image_bytes(), "image/png")},
+    ).json()
+    response = client.post(
+        "/api/pipeline/process",
+        json={
+            "image_id": upload["image_id"],
+            "steps": [{"operation": "gamma", "params": {}}, {"operation": "gaussian", "params": {"ksize": 99}}],
+        },
+    )
+    assert response.status_code == 400
+    assert "Langkah 2" in response.json()["detail"]
+
+
+@pytest.mark.usefixtures("client")
+def test_repeated_preview_is_served_from_result_cache(client, monkeypatch):
+    from app import img_ops
+
+    upload = client.post(
+        "/api/upload",
+        files={"file": ("sample.png", _make_image_bytes(), "image/png")},
+    ).json()
+    body = {"image_id": upload["image_id"], "operation": "gamma", "params": {"gamma": 1.3}}
+    first = client.post("/api/preview", json=body)
+    assert first.status_code == 200
+
+    def _fail(*args, **kwargs):  # noqa: ANN001
+        raise AssertionError("cache hit tidak boleh decode ulang")
+
+    monkeypatch.setattr(img_ops, "load_image", _fail)
+    second = client.post("/api/preview", json=body)
+    assert second.status_code == 200
+    assert second.json()["resultB64"] == first.json()["resultB64"]
+    # hit tidak meng-encode ulang, jadi tidak ada encode_ms
+    assert "encode_ms" in first.json()["metrics"]
+    assert "encode_ms" not in second.json()["metrics"]
+
+
+@pytest.mark.usefixtures("client")
+def test_preview_binary_mode_and_download_streaming(client):
+    upload = client.post(
+        "/api/upload",
+        files={"file": ("sample.png", _make_image_bytes(), "image/png")},
+    ).json()
+    preview = client.post(
+        "/api/preview",
+        json={"image_id": upload["image_id"], "operation": "negative", "params": {}},
+        headers={"Accept": "image/png"},
+    )
+    assert preview.status_code == 200
+    assert preview.headers["content-type"] == "image/png"
+    assert preview.headers["x-operation"] == "negative"
+    assert isinstance(json.loads(preview.headers["x-metrics"]), dict)
+    decoded = cv2.imdecode(np.frombuffer(preview.content, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    assert decoded.shape[:2] == (128, 128)
+
+    job_id = client.post(
+        "/api/process",
+        json={"image_id": upload["image_id"], "operation": "negative", "params": {}},
+    ).json()["job_id"]
+    for _ in range(20):
+        if client.get(f"/api/jobs/{job_id}").json()["status"] == "completed":
+            break
+        time.sleep(0.2)
+
+    full = client.get(f"/api/download/{job_id}")
+    partial = client.get(f"/api/download/{job_id}", headers={"Range": "bytes=0-15"})
+    assert partial.status_code == 206
+    assert partial.content == full.content[:16]
+
+    legacy = client.get(f"/api/download/{job_id}", headers={"Accept": "application/json"})
+    assert legacy.headers["content-type"] == "application/json"
+    assert base64.b64decode(legacy.json()["b64"]) == full.content
+
+
+@pytest.mark.usefixtures("client")
+def test_preview_format_negotiation(client):
+    upload = client.post(
+        "/api/upload",
+        files={"file": ("sample.png", _make_image_bytes(), "image/png")},
+    ).json()
+    body = {"image_id": upload["image_id"], "operation": "negative", "params": {}}
+
+    webp = client.post("/api/preview", json=body, headers={"Accept": "image/webp, image/png;q=0.5"})
+    assert webp.headers["content-type"] == "image/webp"
+    assert webp.content[8:12] == b"WEBP"
+
+    jpeg = client.post("/api/preview", json={**body, "format": "jpeg"})
+    payload = jpeg.json()
+    assert payload["mediaType"] == "image/jpeg"
+    assert base64.b64decode(payload["resultB64"])[:2] == b"\xff\xd8"
+    assert payload["preview_url"].endswith(".jpg")
+
+
+@pytest.mark.usefixtures("client")
+def test_process_result_format_follows_request(client):
+    upload = client.post(
+        "/api/upload",
+        files={"file": ("sample.png", _make_image_bytes(), "image/png")},
+    ).json()
+    job_id = client.post(
+        "/api/process",
+        json={"image_id": upload["image_id"], "operation": "negative", "params": {}, "format": "webp"},
+    ).json()["job_id"]
+    status = None
+    for _ in range(20):
+        status = client.get(f"/api/jobs/{job_id}").json()
+        if status["status"] == "completed":
+            break
+        time.sleep(0.2)
+    assert status["result_url"].endswith(".webp")
+    assert "encode_ms" in status["metrics"]
+    download = client.get(f"/api/download/{job_id}")
+    assert download.headers["content-type"] == "image/webp"
+
+
+@pytest.mark.usefixtures("client")
+def test_batch_process_and_archive(client):
+    files = [
+        ("files", (f"sample{index}.png", _make_image_bytes((64 + index, 48)), "image/png"))
+        for index in range(3)
+    ]
+    uploads = client.post("/api/upload/batch", files=files)
+    assert uploads.status_code == 200
+    image_ids = [item["image_id"] for item in uploads.json()]
+    assert len(image_ids) == 3
+
+    invalid = client.post("/api/batch", json={"image_ids": image_ids, "operation": "gamma", "params": {"gamma": -1}})
+    assert invalid.status_code == 400
+
+    batch = client.post("/api/batch", json={"image_ids": image_ids, "operation": "negative", "params": {}})
+    assert batch.status_code == 200
+    batch_id = batch.json()["batch_id"]
+    assert len(batch.json()["job_ids"]) == 3
+
+    with client.websocket_connect(f"/api/progress/{batch_id}") as websocket:
+        status = websocket.receive_json()
+        while status["status"] not in {"completed", "error"}:
+            status = websocket.receive_json()
+    assert status["status"] == "completed"
+    assert status["progress"] == 100
+    assert status["batch"] == {"total": 3, "completed": 3, "failed": 0, "cancelled": 0}
+
+    archive = client.get(status["result_url"])
+    assert archive.headers["content-type"] == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(archive.content)) as bundle:
+        assert bundle.namelist() == ["0001_sample0.png", "0002_sample1.png", "0003_sample2.png"]
+    tar = client.get(f"/api/batch/{batch_id}/archive", params={"format": "tar"})
+    with tarfile.open(fileobj=io.BytesIO(tar.content)) as bundle:
+        assert len(bundle.getnames()) == 3
+
+
+@pytest.mark.usefixtures("client")
+def test_registry_is_served_with_etag(client):
+    first = client.get("/api/ops/registry")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "public, no-cache"
+    ops = {item["id"]: item for item in first.json()["ops"]}
+    assert ops["gamma"]["defaults"] == {"gamma": 1.0}
+    assert ops["clahe"]["canonical"] == "hist_eq_clahe"
+
+    revalidated = client.get("/api/ops/registry", headers={"If-None-Match": f'"stale", W/{etag}'})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+    assert client.get("/api/operations", headers={"If-None-Match": '"stale"'}).content == first.content
+
+
+@pytest.mark.usefixtures("client")
+def test_histogram_data_is_stored_and_served(client):
+    from app import storage
+
+    upload = client.post(
+        "/api/upload",
+        files={"file": ("sample.png", _make_image_bytes(), "image/png")},
+    ).json()
+    image_id = upload["image_id"]
+    data = client.get(f"/api/histogram/upload/{image_id}/data")
+    assert data.status_code == 200
+    payload = data.json()
+    assert payload["channels"] == ["b", "g", "r", "luminance"]
+    assert payload["pixels"] == 128 * 128
+    assert payload["stats"]["b"]["max"] == 255
+    assert storage.histogram_path(storage.UPLOAD_DIR, image_id).exists()
+
+    job_id = client.post(
+        "/api/process",
+        json={"image_id": image_id, "operation": "negative", "params": {}},
+    ).json()["job_id"]
+    for _ in range(20):
+        if client.get(f"/api/jobs/{job_id}").json()["status"] == "completed":
+            break
+        time.sleep(0.2)
+    # histogram hasil dihitung oleh job dari array di memori
+    assert storage.histogram_path(storage.RESULT_DIR, job_id).exists()
+    binary = client.get(f"/api/histogram/result/{job_id}/data", headers={"Accept": "application/octet-stream"})
+    assert binary.headers["x-histogram-channels"] == "b,g,r,luminance"
+    counts = np.frombuffer(binary.content, dtype="<u4").reshape(4, 256)
+    assert counts[2, 255 - 120] == 128 * 128
+    png = client.get(f"/api/histogram/result/{job_id}", params={"mode": "luminance"})
+    assert png.headers["content-type"] == "image/png"
+
+
+def test_metrics_selection_and_deferred_job(client):
+    upload = client.post(
+        "/api/upload",
+        files={"file": ("sample.png", _make_image_bytes(), "image/png")},
+    ).json()
+    preview = client.post(
+        "/api/preview",
+        json={"image_id": upload["image_id"], "operation": "negative", "params": {}, "metrics": []},
+    ).json()
+    assert "ssim" not in preview["metrics"]
+
+    job_id = client.post(
+        "/api/process",
+        json={
+            "image_id": upload["image_id"],
+            "operation": "negative",
+            "params": {},
+            "metrics": ["mse"],
+            "defer_metrics": True,
+        },
+    ).json()["job_id"]
+    status = None
+    for _ in range(20):
+        status = client.get(f"/api/jobs/{job_id}").json()
+        if status["status"] == "completed" and not status["metrics_pending"]:
+            break
+        time.sleep(0.2)
+    assert status["result_url"]
+    assert "mse" in status["metrics"] and "ssim" not in status["metrics"]
+
+
+@pytest.mark.usefixtures("client")
+def test_multiplexed_progress_socket(client):
+    files = [
+        ("files", (f"sample{index}.png", _make_image_bytes((48 + index, 32)), "image/png"))
+        for index in range(3)
+    ]
+    image_ids = [item["image_id"] for item in client.post("/api/upload/batch", files=files).json()]
+    job_ids = client.post(
+        "/api/batch", json={"image_ids": image_ids, "operation": "negative", "params": {}}
+    ).json()["job_ids"]
+
+    latest = {}
+    with client.websocket_connect("/api/progress") as websocket:
+        websocket.send_json({"subscribe": job_ids + ["missing"]})
+        while len(latest) < len(job_ids) or any(s["status"] != "completed" for s in latest.values()):
+            message = websocket.receive_json()
+            if "errors" in message:
+                assert message["errors"] == {"missing": "Job tidak ditemukan"}
+                continue
+            latest.update({update["job_id"]: update for update in message["updates"]})
+    assert set(latest) == set(job_ids)
+    assert all(status["progress"] == 100 for status in latest.values())
+
+
+@pytest.mark.usefixtures("client")
+def test_cancel_job_and_preview_deadline(client, monkeypatch):
+    from app import main
+
+    assert client.post("/api/jobs/missing/cancel").status_code == 404
+    upload = client.post(
+        "/api/upload",
+        files={"file": ("sample.png", _make_image_bytes(), "image/png")},
+    ).json()
+    endless = {"image_id": upload["image_id"], "operation": "kmeans-color", "params": {"attempts": 10_000_000}}
+
+    job_id = client.post("/api/process", json=endless).json()["job_id"]
+    cancelled = client.post(f"/api/jobs/{job_id}/cancel").json()
+    assert cancelled["status"] == "cancelled"
+    assert client.get(f"/api/jobs/{job_id}").json()["status"] == "cancelled"
+
+    # preview yang berjalan lebih lama dari interval polling tetap selesai normal
+    slow = {"image_id": upload["image_id"], "operation": "kmeans-color", "params": {"attempts": 60}}
+    assert client.post("/api/preview", json=slow).status_code == 200
+
+    monkeypatch.setattr(main, "PREVIEW_TIMEOUT", 0.2)
+    overdue = client.post("/api/preview", json=endless)
+    assert overdue.status_code == 504
+    assert "batas waktu" in overdue.json()["detail"]
+    assert len(main.preview_gate) == 0
+
+
+@pytest.mark.usefixtures("client")
+def test_metrics_exposition(client):
+    upload = client.post(
+        "/api/upload",
+        files={"file": ("sample.png", _make_image_bytes(), "image/png")},
+    ).json()
+    body = {"image_id": upload["image_id"], "operation": "gaussian", "params": {"ksize": 7}}
+    assert client.post("/api/preview", json=body).status_code == 200
+    job_id = client.post("/api/process", json=body).json()["job_id"]
+    for _ in range(20):
+        if client.get(f"/api/jobs/{job_id}").json()["status"] == "completed":
+            break
+        time.sleep(0.2)
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert 'aintra_operation_seconds_bucket{operation="gaussian",size_mp="0.25",le="+Inf"}' in text
+    for stage in ("decode", "compute", "metrics", "encode", "write"):
+        assert f'aintra_stage_seconds_count{{path="job",stage="{stage}"}}' in text
+        assert f'aintra_stage_seconds_count{{path="preview",stage="{stage}"}}' in text
+    for name in ("aintra_jobs_queued 0", "aintra_jobs_running 0", "aintra_websocket_connections 0"):
+        assert name in text
+    assert 'aintra_executor_workers{pool="job"}' in text
+    assert 'aintra_executor_tasks{pool="default"}' in text
+    assert "aintra_upload_bytes_total " in text
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from app import benchmark, img_ops
+from app.services.image_ops import CANONICAL_OPERATIONS
+
+
+def test_cases_cover_registry_and_legacy_handlers():
+    names = {case.name for case in benchmark.iter_cases()}
+    assert set(CANONICAL_OPERATIONS) <= names
+    assert {benchmark.LEGACY_PREFIX + operation.value for operation in img_ops.OPERATION_MAP} <= names
+    with pytest.raises(ValueError):
+        benchmark.iter_cases(["tidak-ada"])
+
+
+def test_synthetic_image_sizes_and_modes():
+    shapes = {mode: benchmark.synthetic_image(0.06, mode).shape for mode in benchmark.MODES}
+    assert shapes == {"gray": (200, 300), "bgr": (200, 300, 3), "bgra": (200, 300, 4)}
+    assert (benchmark.synthetic_image(0.06, "bgr") == benchmark.synthetic_image(0.06, "bgr")).all()
+
+
+def test_run_writes_comparable_report(tmp_path):
+    baseline_path, current_path = tmp_path / "baseline.json", tmp_path / "current.json"
+    argv = ["run", "--sizes", "0.02", "--modes", "bgr,bgra", "--ops", "gaussian,legacy:histogram-match", "--repeat", "2"]
+    assert benchmark.main(argv + ["-o", str(baseline_path)]) == 0
+    report = json.loads(baseline_path.read_text(encoding="utf-8"))
+    keys = [entry["key"] for entry in report["results"]]
+    assert "gaussian[k15]/bgra/0.02MP" in keys
+    assert "legacy:histogram-match[luminance]/bgr/0.02MP" in keys
+    for entry in report["results"]:
+        assert "error" not in entry
+        assert entry["seconds"] > 0 and entry["mp_per_s"] > 0 and entry["peak_mb"] >= 0
+
+    # baseline 10x lebih cepat + satu kasus yang kini gagal: keduanya regresi
+    slowed = json.loads(json.dumps(report))
+    for entry in slowed["results"]:
+        entry["seconds"] *= 10
+        entry["peak_mb"] = 1.0
+    slowed["results"][0] = {"key": slowed["results"][0]["key"], "error": "error: gagal"}
+    current_path.write_text(json.dumps(slowed), encoding="utf-8")
+    findings = benchmark.compare(report, slowed, min_delta_ms=0)
+    assert len(findings["regressions"]) == len(keys)
+    assert findings["regressions"][0]["metric"] == "error"
+    assert benchmark.main(["compare", str(baseline_path), str(current_path), "--min-delta-ms", "0"]) == 1
+    assert benchmark.main(["compare", str(baseline_path), str(baseline_path)]) == 0
+
+
+def test_max_rss_is_optional_without_resource_module(monkeypatch):
+    import sys
+
+    assert benchmark.max_rss_mb() > 0
+    # Windows tidak punya modul resource
+    monkeypatch.setitem(sys.modules, "resource", None)
+    assert benchmark.max_rss_mb() is None
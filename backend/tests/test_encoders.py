@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import cv2
+import numpy as np
+
+from app import encoders
+
+
+def test_format_from_accept_respects_q_values():
+    assert encoders.format_from_accept("image/png;q=0.5, image/webp") == "webp"
+    assert encoders.format_from_accept("image/jpeg, image/webp") == "jpeg"
+    assert encoders.format_from_accept("application/json, */*") is None
+    assert encoders.format_from_accept("image/webp;q=0, image/png") == "png"
+
+
+def test_negotiate_keeps_default_settings_for_other_formats():
+    default = encoders.EncodePolicy(format="png", quality=70, png_compression=5)
+    assert encoders.negotiate(default) is default
+    chosen = encoders.negotiate(default, None, "image/jpeg")
+    assert chosen.format == "jpeg" and chosen.quality == 70
+    assert encoders.negotiate(default, "webp", "image/jpeg").format == "webp"
+    assert default.tag != chosen.tag
+
+
+def test_lossless_webp_round_trips():
+    image = np.random.default_rng(0).integers(0, 256, (16, 16, 3), dtype=np.uint8)
+    policy = encoders.EncodePolicy(format="webp", quality=encoders.WEBP_LOSSLESS_QUALITY)
+    data, elapsed_ms = encoders.encode(image, policy)
+    decoded = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    assert np.array_equal(decoded, image)
+    assert elapsed_ms >= 0
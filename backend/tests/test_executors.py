@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import numpy as np
+
+from app import executors, img_ops
+from app.services import tiling
+from app.schemas import OperationEnum
+
+
+def _sample_image() -> np.ndarray:
+    x = np.tile(np.linspace(0, 255, 64, dtype=np.uint8), (64, 1))
+    return np.dstack([255 - x, x.T, x])
+
+
+def test_executor_for_reads_registry_and_legacy_map():
+    assert img_ops.executor_for("nlmeans") == "process"
+    assert img_ops.executor_for("gamma") == "thread"
+    assert img_ops.executor_for(OperationEnum.ACTIVE_CONTOUR) == "process"
+    assert img_ops.executor_for("kmeans-color") == "process"
+    assert img_ops.executor_for(OperationEnum.NEGATIVE) == "thread"
+
+
+def test_process_backend_matches_in_process_result():
+    image = _sample_image()
+    expected, _ = img_ops.apply_operation_with_metrics(image, "negative", {"mode": "rgb", "blend": 1.0})
+
+    async def scenario():
+        backend = executors.ProcessBackend(workers=1)
+        try:
+            return await backend.run(image, "negative", {"mode": "rgb", "blend": 1.0})
+        finally:
+            backend.shutdown()
+
+    result, metrics = asyncio.run(scenario())
+    assert metrics == {}
+    assert np.array_equal(result, expected)
+
+
+def test_process_backend_forwards_progress():
+    image = _sample_image()
+    seen = []
+
+    async def scenario():
+        backend = executors.ProcessBackend(workers=1)
+        try:
+            return await backend.run(image, OperationEnum.ACTIVE_CONTOUR, {"max_iter": 40}, None, seen.append)
+        finally:
+            backend.shutdown()
+
+    result, _ = asyncio.run(scenario())
+    assert result.shape == image.shape
+    assert seen and seen[-1] == 1.0
+    assert seen == sorted(seen)
+
+
+def test_process_backend_accepts_without_shm_dir(monkeypatch, tmp_path):
+    # tanpa /dev/shm (macOS/Windows) process pool tetap dipakai
+    monkeypatch.setattr(executors, "SHM_DIR", str(tmp_path / "tidak-ada"))
+    runner = executors.OperationRunner(process=executors.ProcessBackend(workers=1))
+    assert runner.backend_for("nlmeans", _sample_image()) == "process"
+
+
+def test_process_result_is_memory_mapped_when_large(monkeypatch):
+    monkeypatch.setattr(tiling, "TILE_MEMMAP_BYTES", 0)
+    image = _sample_image()
+    expected, _ = img_ops.apply_operation_with_metrics(image, "negative", {"mode": "rgb", "blend": 1.0})
+
+    async def scenario():
+        backend = executors.ProcessBackend(workers=1)
+        try:
+            return await backend.run(image, "negative", {"mode": "rgb", "blend": 1.0})
+        finally:
+            backend.shutdown()
+
+    result, _ = asyncio.run(scenario())
+    assert isinstance(result, np.memmap)
+    assert np.array_equal(np.asarray(result), expected)
+
+
+def test_process_children_share_the_cpus_for_tile_threads(monkeypatch):
+    # N anak x TILE_WORKERS thread tile masing-masing tidak boleh menjadi cpu^2 thread
+    monkeypatch.setattr(executors.os, "cpu_count", lambda: 8)
+    backend = executors.ProcessBackend(workers=4)
+    try:
+        pool = backend._ensure_pool()
+        assert pool._initializer is executors._init_child
+        assert pool._initargs == (2,)
+    finally:
+        backend.shutdown()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import cv2
+import numpy as np
+import pytest
+
+from app import histograms
+
+
+def _image(shape=(90, 70, 3)) -> np.ndarray:
+    rng = np.random.default_rng(5)
+    return (rng.beta(2, 5, shape) * 255).astype(np.uint8)
+
+
+def test_counts_cover_channels_and_luminance():
+    image = _image((40, 30, 4))
+    counts = histograms.compute(image)
+    assert counts.shape == (4, 256)
+    assert histograms.channel_names(counts) == ("b", "g", "r", "luminance")
+    gray = cv2.cvtColor(image[:, :, :3], cv2.COLOR_BGR2GRAY)
+    assert np.array_equal(counts[-1], np.bincount(gray.ravel(), minlength=256))
+    assert histograms.channel_names(histograms.compute(gray)) == ("gray", "luminance")
+
+
+def test_stats_match_pixel_statistics():
+    image = _image()
+    stats = histograms.stats(histograms.compute(image))
+    red = image[:, :, 2].astype(np.float64)
+    assert stats["r"]["mean"] == pytest.approx(red.mean())
+    assert stats["r"]["std"] == pytest.approx(red.std())
+    assert stats["r"]["min"] == red.min()
+    assert stats["r"]["max"] == red.max()
+
+
+@pytest.mark.parametrize("mode", ["rgb", "luminance"])
+def test_vectorized_render_matches_line_drawing(mode):
+    image = _image()
+    counts = histograms.compute(image)
+    height = 120
+    expected = np.full((height, 256, 3), 255, dtype=np.uint8)
+    rows = [counts[-1]] if mode == "luminance" else counts[:3]
+    for row, color in zip(rows, histograms.OVERLAY_COLORS):
+        scaled = [int((value / max(float(row.max()), 1e-6)) * (height - 10)) for value in row]
+        for x in range(256):
+            if mode == "luminance":
+                cv2.line(expected, (x, height), (x, height - scaled[x]), histograms.BAR_COLOR, 1)
+            elif x:
+                cv2.line(expected, (x - 1, height - scaled[x - 1]), (x, height - scaled[x]), color, 1)
+    assert np.array_equal(histograms.render(counts, mode), expected)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import threading
+from datetime import datetime, timedelta, timezone
+
+import cv2
+import numpy as np
+import pytest
+
+
+def _upload(client, size=32, height=None):
+    image = np.full((height or size, size, 3), 90, dtype=np.uint8)
+    ok, buffer = cv2.imencode(".png", image)
+    assert ok
+    response = client.post("/api/upload", files={"file": ("a.png", buffer.tobytes(), "image/png")})
+    assert response.status_code == 200
+    return response.json()["image_id"]
+
+
+@pytest.mark.usefixtures("client")
+def test_load_is_cached_and_read_only(client):
+    from app.image_cache import image_cache
+
+    image_id = _upload(client)
+    stored, first = image_cache.load(image_id)
+    _, second = image_cache.load(image_id)
+    assert second is first
+    assert image_cache.get_upload(image_id) is stored
+    assert not first.flags.writeable
+
+
+@pytest.mark.usefixtures("client")
+def test_lru_respects_byte_budget(client):
+    from app import image_cache as module
+
+    cache = module.DecodedImageCache(max_bytes=32 * 32 * 3 * 2)
+    ids = [_upload(client) for _ in range(3)]
+    for image_id in ids:
+        cache.load(image_id)
+    cache.load(ids[1])
+    cache.load(_upload(client))
+    assert cache.stats()["entries"] == 2
+    assert (ids[1], 0) in cache._entries
+    assert (ids[0], 0) not in cache._entries
+
+
+@pytest.mark.usefixtures("client")
+def test_cleanup_expired_invalidates_entry(client):
+    from app import storage
+    from app.image_cache import image_cache
+
+    image_id = _upload(client)
+    image_cache.load(image_id)
+    storage.cleanup_expired(datetime.now(timezone.utc) + timedelta(hours=storage.TTL_HOURS + 1))
+    assert image_cache.stats()["entries"] == 0
+    with pytest.raises(storage.StorageError):
+        image_cache.load(image_id)
+
+
+@pytest.mark.usefixtures("client")
+def test_preview_reads_smallest_covering_pyramid_level(client):
+    from app import storage
+    from app.image_cache import image_cache
+
+    image_id = _upload(client, size=1300, height=650)
+    # upload hanya menyimpan byte asli; piramida dibuat saat preview pertama
+    assert storage.get_upload(image_id).pyramid is None
+
+    _, base = image_cache.load_preview(image_id, 640)
+    assert base.shape[:2] == (512, 1024)
+    assert storage.get_upload(image_id).pyramid == (256, 512, 1024)
+    assert storage.pyramid_path(image_id, 1024).exists()
+    _, small = image_cache.load_preview(image_id, 200)
+    assert small.shape[1] == 256
+
+    response = client.post("/api/preview", json={"image_id": image_id, "operation": "negative", "params": {}})
+    assert response.status_code == 200
+
+    storage.cleanup_expired(datetime.now(timezone.utc) + timedelta(hours=storage.TTL_HOURS + 1))
+    assert not list(storage.PYRAMID_DIR.glob(f"{image_id}_*"))
+
+
+@pytest.mark.usefixtures("client")
+def test_concurrent_first_previews_build_pyramid_once(client, monkeypatch):
+    from app import storage
+    from app.image_cache import image_cache
+
+    image_id = _upload(client, size=1300, height=650)
+    calls = []
+    build = storage.build_pyramid
+
+    def counting_build(*args):
+        calls.append(args[0])
+        return build(*args)
+
+    monkeypatch.setattr(storage, "build_pyramid", counting_build)
+    barrier = threading.Barrier(4)
+    shapes = []
+
+    def preview():
+        barrier.wait()
+        shapes.append(image_cache.load_preview(image_id, 640)[1].shape[:2])
+
+    threads = [threading.Thread(target=preview) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [image_id]
+    assert shapes == [(512, 1024)] * 4
+    assert image_cache.get_upload(image_id).pyramid == (256, 512, 1024)
+    assert not image_cache._building
@@ -0,0 +1,447 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import sqlite3
+import threading
+
+import numpy as np
+import pytest
+
+from app import job_manager
+from app.job_journal import JobJournal, JournalJob
+
+
+def test_submit_rejects_when_queue_full(tmp_path):
+    async def scenario():
+        manager = job_manager.JobManager(workers=1, queue_size=1)
+        manager._process_job = lambda record: asyncio.sleep(0)  # type: ignore[method-assign]
+        await manager.submit(tmp_path / "a.png", "negative", {})
+        with pytest.raises(job_manager.QueueFullError):
+            await manager.submit(tmp_path / "b.png", "negative", {})
+        await manager.stop()
+
+    asyncio.run(scenario())
+
+
+def test_interactive_jobs_run_before_batch(tmp_path):
+    async def scenario():
+        manager = job_manager.JobManager(workers=1, queue_size=8)
+        order = []
+
+        async def fake_process(record):
+            order.append(record.priority)
+
+        manager._process_job = fake_process  # type: ignore[method-assign]
+        for priority in ("batch", "batch", "interactive"):
+            await manager.submit(tmp_path / "x.png", "negative", {}, priority=priority)
+        await manager._queue.join()
+        await manager.stop()
+        return order
+
+    assert asyncio.run(scenario()) == ["interactive", "batch", "batch"]
+
+
+def _completing_manager(**kwargs):
+    manager = job_manager.JobManager(workers=1, queue_size=8, **kwargs)
+
+    async def fake_process(record):
+        await manager._update(record.job_id, status="completed", progress=100)
+
+    manager._process_job = fake_process  # type: ignore[method-assign]
+    return manager
+
+
+def test_finished_jobs_are_evicted_by_count(tmp_path):
+    async def scenario():
+        manager = _completing_manager(retention_max=2)
+        records = [await manager.submit(tmp_path / "x.png", "negative", {}) for _ in range(4)]
+        await manager._queue.join()
+        with pytest.raises(KeyError):
+            await manager.get_status(records[0].job_id)
+        assert (await manager.get_status(records[-1].job_id)).status == "completed"
+        counts = await manager.job_counts()
+        await manager.stop()
+        return counts
+
+    assert asyncio.run(scenario()) == (0, 0, 2)
+
+
+def test_finished_jobs_are_evicted_by_age(tmp_path):
+    async def scenario():
+        manager = _completing_manager(retention_seconds=0.05, evict_interval=0.02)
+        record = await manager.submit(tmp_path / "x.png", "negative", {})
+        await manager._queue.join()
+        queue = await manager.subscribe(record.job_id)
+        await manager.unsubscribe(record.job_id, queue)
+        assert not manager._subscribers
+        await asyncio.sleep(0.2)
+        count = await manager.jobs_count()
+        await manager.stop()
+        return count, record
+
+    count, record = asyncio.run(scenario())
+    assert count == 0
+    assert not hasattr(record, "__dict__")
+
+
+def test_journal_restores_jobs_after_restart(tmp_path):
+    journal_path = tmp_path / "jobs.sqlite3"
+
+    async def first_run():
+        manager = _completing_manager(journal=JobJournal(journal_path))
+        done = await manager.submit(tmp_path / "a.png", "negative", {})
+        await manager._queue.join()
+        # proses "macet" lalu berhenti (deploy/crash) sebelum job berikutnya selesai
+        manager._process_job = lambda record: asyncio.Event().wait()  # type: ignore[method-assign]
+        pending = await manager.submit(tmp_path / "b.png", "gamma", {"gamma": 1.2}, priority="batch")
+        batch = await manager.submit_batch([(tmp_path / "c.png", None), (tmp_path / "d.png", None)], "negative", {})
+        await asyncio.sleep(0.05)
+        await manager.stop()
+        return done.job_id, pending.job_id, batch.batch_id
+
+    async def second_run(done_id, pending_id, batch_id):
+        manager = _completing_manager(journal=JobJournal(journal_path))
+        await manager.start()
+        assert (await manager.get_status(done_id)).status == "completed"
+        for _ in range(50):
+            if (await manager.get_status(batch_id)).status == "completed":
+                break
+            await asyncio.sleep(0.02)
+        restored = manager._jobs[pending_id]
+        statuses = (restored.status, restored.params, restored.priority, (await manager.get_status(batch_id)).status)
+        await manager.stop()
+        return statuses
+
+    done_id, pending_id, batch_id = asyncio.run(first_run())
+    assert asyncio.run(second_run(done_id, pending_id, batch_id)) == ("completed", {"gamma": 1.2}, "batch", "completed")
+
+
+def test_journal_path_is_opened_on_start_and_closed_on_stop(tmp_path):
+    journal_path = tmp_path / "jobs.sqlite3"
+
+    async def scenario():
+        manager = _completing_manager(journal_path=journal_path)
+        # konstruksi (import modul) tidak membuat file jurnal
+        assert not journal_path.exists()
+        record = await manager.submit(tmp_path / "a.png", "negative", {})
+        await manager._queue.join()
+        await manager.stop()
+        assert manager._journal is None
+        restarted = _completing_manager(journal_path=journal_path)
+        await restarted.start()
+        status = await restarted.get_status(record.job_id)
+        await restarted.stop()
+        return status.status
+
+    assert asyncio.run(scenario()) == "completed"
+
+
+def test_shared_queue_runs_job_in_another_manager(tmp_path):
+    journal_path = tmp_path / "jobs.sqlite3"
+
+    async def scenario():
+        front = job_manager.JobManager(
+            workers=0, queue_size=8, journal=JobJournal(journal_path), shared=True, poll_interval=0.02
+        )
+        worker = _completing_manager(journal=JobJournal(journal_path), shared=True, poll_interval=0.02)
+        await front.start()
+        record = await front.submit(tmp_path / "x.png", "negative", {})
+        queue = await front.subscribe(record.job_id)
+        await worker.start()
+        seen = []
+        while not seen or seen[-1].status != "completed":
+            seen.append(await asyncio.wait_for(queue.get(), 2))
+        # proses API lain melihat job yang tidak pernah ia terima sendiri
+        other = job_manager.JobManager(workers=0, journal=JobJournal(journal_path), shared=True)
+        status = await other.get_status(record.job_id)
+        counts = await front.job_counts()
+        for manager in (front, worker, other):
+            await manager.stop()
+        return seen[-1].progress, status.status, counts[0]
+
+    assert asyncio.run(scenario()) == (100, "completed", 0)
+
+
+def test_shared_cancel_during_write_stage_is_not_overwritten(tmp_path):
+    journal_path = tmp_path / "jobs.sqlite3"
+
+    async def scenario():
+        front = job_manager.JobManager(workers=0, journal=JobJournal(journal_path), shared=True, poll_interval=0.02)
+        worker = job_manager.JobManager(workers=1, journal=JobJournal(journal_path), shared=True, poll_interval=0.02)
+        writing, release = asyncio.Event(), asyncio.Event()
+
+        async def slow_write(record):
+            # operasi sudah lewat checkpoint terakhir; job tinggal menulis hasil
+            await worker._update(record.job_id, status="processing", progress=90)
+            writing.set()
+            await release.wait()
+            await worker._update(record.job_id, status="completed", progress=100, result_url="/media/results/x.png")
+
+        worker._process_job = slow_write  # type: ignore[method-assign]
+        await front.start()
+        record = await front.submit(tmp_path / "x.png", "negative", {})
+        await worker.start()
+        await asyncio.wait_for(writing.wait(), 2)
+        await front.cancel(record.job_id)
+
+        async def cancel_applied():
+            while worker._jobs[record.job_id].status != "cancelled":
+                await asyncio.sleep(0.01)
+
+        await asyncio.wait_for(cancel_applied(), 2)
+        release.set()
+        await asyncio.sleep(0.05)
+        # tulisan "completed" yang terlambat (mis. sebelum worker melihat pembatalan) juga ditolak jurnal
+        await asyncio.wrap_future(worker._journal.update(record.job_id, "completed", {}, None))
+        journaled = (await asyncio.to_thread(worker._journal.get_jobs, [record.job_id]))[0].status
+        for manager in (front, worker):
+            await manager.stop()
+        return journaled, worker._jobs[record.job_id].status
+
+    assert asyncio.run(scenario()) == ("cancelled", "cancelled")
+
+
+def test_slow_subscriber_only_holds_latest_state(tmp_path):
+    async def scenario():
+        manager = job_manager.JobManager(workers=1, queue_size=8)
+        manager._process_job = lambda record: asyncio.Event().wait()  # type: ignore[method-assign]
+        first = await manager.submit(tmp_path / "a.png", "negative", {})
+        second = await manager.submit(tmp_path / "b.png", "negative", {})
+        subscription = await manager.subscribe(first.job_id)
+        await manager.subscribe(second.job_id, subscription)
+        for progress in range(0, 101, 10):
+            await manager._update(first.job_id, progress=progress)
+        await manager._update(second.job_id, status="completed", progress=100)
+        updates = await subscription.drain()
+        await manager.stop()
+        expected = [(first.job_id, 100, "queued"), (second.job_id, 100, "completed")]
+        return [(update.job_id, update.progress, update.status) for update in updates], expected, subscription
+
+    updates, expected, subscription = asyncio.run(scenario())
+    # status awal + 11 update progres menyusut menjadi satu status terbaru per job
+    assert updates == expected
+    assert subscription.coalesced == 12
+    assert subscription.pending() == 0
+
+
+def test_operation_progress_is_mapped_and_never_regresses(tmp_path):
+    async def scenario():
+        manager = job_manager.JobManager(workers=1, queue_size=8)
+        manager._process_job = lambda record: asyncio.Event().wait()  # type: ignore[method-assign]
+        record = await manager.submit(tmp_path / "a.png", "negative", {})
+        await manager._update(record.job_id, status="processing", progress=20)
+        sink = manager._progress_sink(record.job_id, 20, 90)
+        await asyncio.to_thread(sink, 0.5)
+        await asyncio.sleep(0.05)
+        halfway = (await manager.get_status(record.job_id)).progress
+        await manager._update(record.job_id, status="completed", progress=100)
+        await manager._report_progress(record.job_id, 90)
+        final = (await manager.get_status(record.job_id)).progress
+        await manager.stop()
+        return halfway, final
+
+    assert asyncio.run(scenario()) == (55, 100)
+
+
+def _sample_image(tmp_path):
+    import cv2
+    import numpy as np
+
+    image = np.zeros((96, 96, 3), dtype=np.uint8)
+    cv2.circle(image, (48, 48), 20, (255, 255, 255), -1)
+    path = tmp_path / "sample.png"
+    cv2.imwrite(str(path), image)
+    return path
+
+
+def test_cancel_stops_running_and_queued_jobs(tmp_path):
+    from app.schemas import OperationEnum
+
+    path = _sample_image(tmp_path)
+    # percobaan k-means praktis tak berujung: job hanya berhenti karena dibatalkan
+    params = {"K": 3, "attempts": 10_000_000}
+
+    async def scenario():
+        manager = job_manager.JobManager(workers=1, queue_size=8)
+        manager._runner.process = None
+        running = await manager.submit(path, OperationEnum.KMEANS_COLOR, params)
+        queued = await manager.submit(path, OperationEnum.KMEANS_COLOR, params)
+        while manager._jobs[running.job_id].status != "processing":
+            await asyncio.sleep(0.01)
+        assert (await manager.cancel(queued.job_id)).status == "cancelled"
+        assert (await manager.cancel(running.job_id)).status == "cancelled"
+        await asyncio.wait_for(manager._queue.join(), 5)
+        statuses = [(await manager.get_status(record.job_id)).status for record in (running, queued)]
+        await manager.stop()
+        return statuses, queued.progress
+
+    assert asyncio.run(scenario()) == (["cancelled", "cancelled"], 0)
+
+
+def test_operation_deadline_fails_the_job(tmp_path):
+    from app.schemas import OperationEnum
+
+    path = _sample_image(tmp_path)
+
+    async def scenario():
+        manager = job_manager.JobManager(workers=1, queue_size=8)
+        manager._runner.process = None
+        record = await manager.submit(path, OperationEnum.KMEANS_COLOR, {"attempts": 10_000_000}, timeout=0.2)
+        await asyncio.wait_for(manager._queue.join(), 5)
+        status = await manager.get_status(record.job_id)
+        await manager.stop()
+        return status
+
+    status = asyncio.run(scenario())
+    assert status.status == "error"
+    assert "batas waktu" in status.error
+
+
+def test_deferred_metrics_release_the_worker_slot(test_app, tmp_path, monkeypatch):
+    import threading
+
+    from app import img_ops
+    from app.result_cache import ResultCache
+    from app.services.metrics import policy
+
+    path = _sample_image(tmp_path)
+    release = threading.Event()
+    compute_metrics = img_ops.compute_metrics
+
+    def slow_deferred_metrics(original, processed, selection):
+        if selection.deferred:
+            release.wait(5)
+        return compute_metrics(original, processed, selection)
+
+    monkeypatch.setattr(img_ops, "compute_metrics", slow_deferred_metrics)
+
+    async def scenario():
+        cache = ResultCache(tmp_path / "cache")
+        manager = job_manager.JobManager(workers=1, queue_size=8, cache=cache)
+        deferred = await manager.submit(
+            path, "negative", {}, cache_key="k", metrics_policy=policy(["mse"], deferred=True)
+        )
+        following = await manager.submit(path, "negative", {})
+        # slot satu-satunya sudah bebas walau metrik job pertama belum selesai
+        await asyncio.wait_for(manager._queue.join(), 5)
+        early = await manager.get_status(deferred.job_id)
+        assert (await manager.get_status(following.job_id)).status == "completed"
+        assert early.status == "completed" and early.metrics_pending
+        assert cache.get("k") is not None
+        release.set()
+        while (await manager.get_status(deferred.job_id)).metrics_pending:
+            await asyncio.sleep(0.01)
+        final = await manager.get_status(deferred.job_id)
+        cached = cache.get("k")
+        await manager.stop()
+        return final, cached
+
+    final, cached = asyncio.run(scenario())
+    assert "mse" in final.metrics and "encode_ms" in final.metrics
+    assert "mse" in cached.metrics
+
+
+def test_pipeline_job_fuses_consecutive_point_steps(test_app, tmp_path, monkeypatch):
+    import cv2
+
+    from app import img_ops
+    from app.schemas import OperationEnum
+
+    path = _sample_image(tmp_path)
+    steps = img_ops.resolve_pipeline([("gamma", {"gamma": 0.6}), ("log", {"gain": 2.0}), ("gaussian", {})])
+    steps.insert(2, (OperationEnum.GAMMA, {"gamma": 1.4, "gain": 0.9}))
+    expected, _ = img_ops.apply_pipeline_with_metrics(cv2.imread(str(path), cv2.IMREAD_UNCHANGED), steps)
+    encoded = []
+    encode = job_manager.encoders.encode
+
+    def capture(image, policy):
+        encoded.append(np.array(image))
+        return encode(image, policy)
+
+    monkeypatch.setattr(job_manager.encoders, "encode", capture)
+
+    async def scenario():
+        manager = job_manager.JobManager(workers=1, queue_size=8)
+        run = manager._runner.run
+        dispatched = []
+
+        async def counting_run(image, operation, *args, **kwargs):
+            dispatched.append(img_ops.operation_name(operation))
+            return await run(image, operation, *args, **kwargs)
+
+        manager._runner.run = counting_run
+        record = await manager.submit(path, "pipeline", {}, steps=steps)
+        await asyncio.wait_for(manager._queue.join(), 5)
+        status = await manager.get_status(record.job_id)
+        await manager.stop()
+        return status, dispatched
+
+    status, dispatched = asyncio.run(scenario())
+    assert status.status == "completed"
+    # tiga operasi titik (registry + legacy) menjadi satu LUT; hanya gaussian yang lewat runner
+    assert dispatched == ["gaussian"]
+    assert np.array_equal(encoded[0], expected)
+
+
+def test_concurrent_batches_share_the_worker_slots(tmp_path):
+    async def scenario():
+        manager = job_manager.JobManager(workers=1, queue_size=2)
+        release = asyncio.Event()
+
+        async def blocked(record):
+            await release.wait()
+            await manager._update(record.job_id, status="completed", progress=100)
+
+        manager._process_job = blocked  # type: ignore[method-assign]
+        items = [(tmp_path / f"{index}.png", None) for index in range(3)]
+        batches = [await manager.submit_batch(items, "negative", {}) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        # satu worker: seluruh batch bersama hanya menempati satu slot antrian/berjalan
+        occupied = manager._queue.qsize() + manager._running
+        interactive = await manager.submit(tmp_path / "x.png", "negative", {})
+        release.set()
+        await asyncio.wait_for(manager._queue.join(), 5)
+        for batch in batches:
+            while not (await manager.get_batch(batch.batch_id))[0].done:
+                await asyncio.sleep(0.01)
+        status = await manager.get_status(interactive.job_id)
+        await manager.stop()
+        return occupied, status.status, manager._slotted
+
+    assert asyncio.run(scenario()) == (1, "completed", set())
+
+
+def test_expired_worker_cannot_overwrite_a_reclaimed_job(tmp_path):
+    journal = JobJournal(tmp_path / "jobs.sqlite3")
+    journal.submit([JournalJob("j", None, {}, "queued", {}, 1.0, None)]).result()
+    assert journal.claim("lama", lease_seconds=-1).job_id == "j"
+    # lease "lama" sudah kedaluwarsa: job diklaim ulang oleh worker lain
+    assert journal.claim("baru", lease_seconds=60).job_id == "j"
+    journal.update("j", "completed", {"progress": 100}, 2.0, claimed_by="lama").result()
+    assert journal.get_jobs(["j"])[0].status == "processing"
+    journal.update("j", "completed", {"progress": 100}, 2.0, claimed_by="baru").result()
+    assert journal.get_jobs(["j"])[0].status == "completed"
+    journal.close()
+
+
+def test_journal_close_closes_every_thread_connection(tmp_path):
+    journal = JobJournal(tmp_path / "jobs.sqlite3")
+    connections = []
+
+    def read():
+        journal.queued_count()
+        connections.append(journal._connection())
+
+    threads = [threading.Thread(target=read) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    read()
+    journal.close()
+    assert len(set(map(id, connections))) == 4
+    for conn in connections:
+        with pytest.raises(sqlite3.ProgrammingError, match="closed"):
+            conn.execute("SELECT 1")
+    # jurnal tetap bisa dipakai setelah close: koneksi baru dibuka
+    assert journal.queued_count() == 0
+    journal.close()
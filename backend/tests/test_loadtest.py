@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from app import loadtest
+
+
+def test_slider_sweep_goes_up_and_back_within_schema():
+    sweep = loadtest.slider_values("gaussian", 6)
+    assert [params["ksize"] for params in sweep] == [3, 7, 11, 15, 11, 7]
+    with pytest.raises(ValueError):
+        loadtest.parse_mix("preview=1,lainnya=2")
+    assert loadtest.parse_mix("preview=3, process_ws") == {"preview": 3.0, "process_ws": 1.0}
+
+
+def test_summary_percentiles_and_histogram():
+    recorder = loadtest.Recorder()
+    for ms in range(1, 101):
+        recorder.record("preview", ms / 1000)
+    recorder.fail("preview", "503")
+    step = loadtest.summarize(recorder, elapsed=2.0)["preview"]
+    assert (step["p50_ms"], step["p95_ms"], step["p99_ms"], step["max_ms"]) == pytest.approx((50, 95, 99, 100))
+    assert step["rps"] == 50 and step["error_reasons"] == {"503": 1}
+    assert sum(step["histogram_ms"].values()) == 100
+    assert step["histogram_ms"]["100"] == 50
+
+
+def test_in_process_run_covers_every_flow(test_app, monkeypatch):
+    config = loadtest.LoadConfig(
+        concurrency=2,
+        iterations=1,
+        mix={"preview": 1, "process_poll": 1, "process_ws": 1},
+        previews=3,
+        megapixels=0.02,
+        poll_interval=0.02,
+        job_timeout=30,
+    )
+
+    # pilihan acak diganti urutan tetap: tiap user menjalankan ketiga skenario sekali
+    async def every_scenario(self, deadline):
+        for name in loadtest.SCENARIOS:
+            await self.scenario(name)
+
+    monkeypatch.setattr(loadtest.VirtualUser, "run", every_scenario)
+    report = asyncio.run(loadtest.run_load(config))
+    steps = report["steps"]
+    assert all(step["errors"] == 0 for step in steps.values())
+    assert steps["upload"]["count"] == 6 and steps["preview"]["count"] == 18
+    assert steps["process"]["count"] == steps["download"]["count"] == 4
+    assert steps["job_poll"]["count"] == steps["job_ws"]["count"] == 2
+    assert "p99" in loadtest.format_report(report)
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import json
+from datetime import datetime, timedelta, timezone
+
+from app.metadata_store import MetadataStore
+
+
+def test_put_get_and_expiry_range(tmp_path):
+    store = MetadataStore(tmp_path / "meta.sqlite3")
+    old = (datetime.now(timezone.utc) - timedelta(days=10)).isoformat()
+    store.put("upload", "a", {"image_id": "a", "saved_filename": "a.png", "created_at": old})
+    store.put("result", "job1", {"job_id": "job1", "filename": "job1.png", "created_at": datetime.now(timezone.utc).isoformat()})
+
+    assert store.get("upload", "a")["saved_filename"] == "a.png"
+    assert store.get("upload", "missing") is None
+
+    expired = store.expired(datetime.now(timezone.utc) - timedelta(days=1))
+    assert expired == [("upload", "a", "a.png")]
+    store.delete("upload", "a")
+    assert store.get("upload", "a") is None
+
+
+def test_import_sidecars_migrates_and_removes_json(tmp_path):
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    sidecar = uploads / "abc.json"
+    sidecar.write_text(
+        json.dumps({"image_id": "abc", "saved_filename": "abc.png", "created_at": "2024-01-01T00:00:00+00:00"}),
+        encoding="utf-8",
+    )
+    (uploads / "broken.json").write_text("{not json", encoding="utf-8")
+
+    store = MetadataStore(tmp_path / "meta.sqlite3")
+    assert store.import_sidecars([("upload", uploads)]) == 1
+    assert not sidecar.exists()
+    assert (uploads / "broken.json").exists()
+    assert store.get("upload", "abc")["saved_filename"] == "abc.png"
+    # impor kedua tidak menimpa data yang sudah ada
+    assert store.import_sidecars([("upload", uploads)]) == 0
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import cv2
+import numpy as np
+import pytest
+from skimage.metrics import peak_signal_noise_ratio, structural_similarity
+
+from app.services import metrics
+
+
+def _scene(height: int, width: int, noise: float = 4.0) -> np.ndarray:
+    rng = np.random.default_rng(5)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    image = 127 + 60 * np.sin(x / 57.0) + 40 * np.cos(y / 31.0)
+    for _ in range(30):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        cv2.circle(image, center, int(rng.integers(20, 200)), float(rng.integers(0, 255)), -1)
+    image = cv2.GaussianBlur(image, (0, 0), 1.2) + rng.normal(0, noise, (height, width))
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def test_ssim_and_psnr_match_scikit_image():
+    original = _scene(150, 170)
+    processed = cv2.GaussianBlur(original, (5, 5), 1.5)
+    result = metrics.compute(original, processed, metrics.policy(["ssim", "psnr", "mse"]))
+    expected_ssim = structural_similarity(
+        original, processed, data_range=255, gaussian_weights=True, sigma=1.5, use_sample_covariance=False
+    )
+    assert result["ssim"] == pytest.approx(expected_ssim, abs=1e-9)
+    assert result["psnr"] == pytest.approx(peak_signal_noise_ratio(original, processed, data_range=255), abs=1e-9)
+    assert result["mse"] == pytest.approx(np.mean((original.astype(float) - processed) ** 2))
+
+
+def test_selection_and_identical_images():
+    image = _scene(64, 64)
+    assert metrics.compute(image, image, metrics.policy([])) == {}
+    # PSNR tak hingga dibatasi agar tetap valid di JSON
+    assert metrics.compute(image, image, metrics.policy(["psnr"])) == {"psnr": metrics.PSNR_MAX}
+    assert metrics.policy(["psnr", "ssim", "psnr"]).names == ("psnr", "ssim")
+    assert metrics.policy(["ssim"]).tag != metrics.policy(["ssim"], approximate=True).tag
+    assert metrics.policy(["ssim"]).tag == metrics.policy(["ssim"], deferred=True).tag
+
+
+def test_original_is_resized_to_preview_shape():
+    original = cv2.cvtColor(_scene(300, 400), cv2.COLOR_GRAY2BGR)
+    preview = cv2.resize(original, (200, 150), interpolation=cv2.INTER_AREA)
+    result = metrics.compute(original, preview)
+    assert result["ssim"] == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize(
+    "operation",
+    [
+        lambda image: cv2.GaussianBlur(image, (5, 5), 1.5),
+        lambda image: cv2.medianBlur(image, 5),
+        lambda image: cv2.LUT(image, np.array([((i / 255.0) ** 0.7) * 255 for i in range(256)], dtype=np.uint8)),
+    ],
+)
+def test_sampled_metrics_stay_within_reported_interval(operation, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_SAMPLE_PIXELS", 200_000)
+    original = _scene(900, 1200)
+    processed = operation(original)
+    exact = metrics.compute(original, processed, metrics.policy(["ssim", "psnr", "mse"]))
+    approx = metrics.compute(original, processed, metrics.policy(["ssim", "psnr", "mse"], approximate=True))
+    for name in ("ssim", "psnr", "mse"):
+        assert abs(approx[name] - exact[name]) <= approx[f"{name}_err"]
+    assert approx["ssim_err"] < 0.02
+
+
+def test_small_images_are_never_sampled():
+    original = _scene(100, 100)
+    processed = cv2.GaussianBlur(original, (5, 5), 1.5)
+    approx = metrics.compute(original, processed, metrics.policy(["ssim"], approximate=True))
+    assert set(approx) == {"ssim"}
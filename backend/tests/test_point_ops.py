@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import math
+
+import cv2
+import numpy as np
+import pytest
+
+from app import img_ops
+from app.schemas import OperationEnum
+from app.services import image_ops, point_ops
+
+
+def _image(channels: int = 3, low: int = 0, high: int = 256) -> np.ndarray:
+    rng = np.random.default_rng(11)
+    shape = (61, 47) if channels == 1 else (61, 47, channels)
+    return rng.integers(low, high, shape, dtype=np.uint8)
+
+
+# implementasi per-piksel sebelum kompilasi LUT, sebagai acuan
+def _reference(image, operation, params):
+    rgb, alpha = image_ops.split_alpha(image)
+    if operation == "negative":
+        blend = params["blend"]
+        out = cv2.addWeighted(cv2.bitwise_not(rgb), blend, rgb, 1.0 - blend, 0.0)
+    elif operation == "gamma":
+        inv_gamma = 1.0 / params["gamma"]
+        table = np.array([((i / 255.0) ** inv_gamma) * 255 for i in range(256)], dtype=np.float32)
+        out = cv2.LUT(rgb, np.clip(table, 0, 255).astype(np.uint8))
+    elif operation == "log":
+        logged = params["gain"] * np.log1p(rgb.astype(np.float32) / 255.0)
+        out = image_ops.ensure_uint8(cv2.normalize(logged, None, 0, 255, cv2.NORM_MINMAX))
+    elif operation == "thresh_global":
+        _, binary = cv2.threshold(image_ops.to_gray(rgb), params["thresh"], 255, point_ops.THRESH_TYPES[params["type"]])
+        out = cv2.cvtColor(binary, cv2.COLOR_GRAY2BGR)
+    else:
+        out = np.empty_like(rgb)
+        for idx in range(rgb.shape[2]):
+            channel = rgb[..., idx].astype(np.float32)
+            lo, hi = np.percentile(channel, params["p_low"]), np.percentile(channel, params["p_high"])
+            if math.isclose(hi, lo, abs_tol=1e-3):
+                out[..., idx] = channel
+            else:
+                out[..., idx] = np.clip((channel - lo) * (255.0 / (hi - lo)), 0, 255)
+    return image_ops.merge_alpha(out, alpha)
+
+
+STEPS = [
+    ("negative", {"blend": 0.35}),
+    ("gamma", {"gamma": 0.45}),
+    ("log", {"gain": 2.5}),
+    ("contrast_stretch", {"p_low": 7.5, "p_high": 92.5}),
+    ("thresh_global", {"thresh": 100, "type": "truncate"}),
+]
+
+
+@pytest.mark.parametrize("channels", [3, 4])
+@pytest.mark.parametrize("operation, params", STEPS)
+def test_lut_matches_per_pixel_reference(channels, operation, params):
+    image = _image(channels, 40, 190)
+    validated = image_ops.prepare_operation_params(operation, params)
+    expected = _reference(image, operation, validated)
+    assert np.array_equal(image_ops.apply_operation(image, operation, params), expected)
+
+
+@pytest.mark.parametrize("channels", [1, 3, 4])
+def test_fused_pipeline_matches_step_by_step(channels):
+    image = _image(channels, 30, 200)
+    steps = img_ops.resolve_pipeline(STEPS[:4] + [STEPS[1], STEPS[4], STEPS[2]])
+    expected = image
+    for operation, params in steps:
+        if operation == "contrast_stretch" and expected.ndim == 2:
+            continue
+        expected = _reference(expected, operation, params)
+    if channels == 1:
+        steps = [step for step in steps if step[0] != "contrast_stretch"]
+    fused, _ = img_ops.apply_pipeline_with_metrics(image, steps)
+    assert np.array_equal(fused, expected)
+
+
+def test_histogram_percentile_matches_numpy():
+    rng = np.random.default_rng(3)
+    for _ in range(200):
+        values = rng.integers(0, 256, int(rng.integers(1, 400)), dtype=np.uint8)
+        percent = float(rng.uniform(0, 100))
+        histogram = np.bincount(values, minlength=256)
+        assert point_ops.histogram_percentile(histogram, percent) == np.percentile(values.astype(np.float32), percent)
+
+
+def test_luma_negative_is_not_fused():
+    assert point_ops.is_point_op("negative", {"mode": "rgb"})
+    assert not point_ops.is_point_op("negative", {"mode": "luma"})
+    assert not point_ops.is_point_op("gaussian", {})
+
+
+# handler legacy img_ops sebelum dikompilasi menjadi LUT, sebagai acuan
+def _legacy_reference(image, operation, params):
+    rgb, alpha = img_ops.split_alpha(image)
+    if operation == "log":
+        normalized = rgb.astype(np.float32) / 255.0
+        base = params.get("base", "e")
+        log = {"10": np.log10, "2": np.log2}.get(base)
+        logged = params["gain"] * (log(1 + normalized) if log else np.log1p(normalized))
+        out = img_ops.to_uint8(cv2.normalize(logged, None, 0, 255, cv2.NORM_MINMAX))
+    else:
+        inv_gamma = 1.0 / max(0.01, params["gamma"])
+        table = np.array([(params["gain"] * ((i / 255.0) ** inv_gamma) * 255) for i in range(256)])
+        out = cv2.LUT(rgb, table.clip(0, 255).astype("uint8"))
+    return img_ops.merge_alpha(out, alpha)
+
+
+@pytest.mark.parametrize("channels", [1, 3, 4])
+@pytest.mark.parametrize(
+    "operation, params",
+    [
+        (OperationEnum.LOG, {"gain": 1.5}),
+        (OperationEnum.LOG, {"gain": 0.7, "base": "10"}),
+        (OperationEnum.LOG, {"gain": 2.0, "base": "2"}),
+        (OperationEnum.GAMMA, {"gamma": 0.45, "gain": 1.0}),
+        (OperationEnum.GAMMA, {"gamma": 2.2, "gain": 1.3}),
+    ],
+)
+def test_legacy_handlers_match_reference(channels, operation, params):
+    handler = img_ops.OPERATION_MAP[operation]
+    for image in (_image(channels, 40, 190), np.full_like(_image(channels), 77)):
+        assert np.array_equal(handler(image, params), _legacy_reference(image, operation.value, params))
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from app import img_ops
+from app.services import progress
+
+
+def test_reports_outside_a_reporting_block_are_ignored():
+    progress.report(1, 2)
+    with progress.stage(0, 2):
+        progress.report(1)
+
+
+def test_stage_maps_nested_reports_onto_a_slice():
+    seen = []
+    with progress.reporting(seen.append):
+        with progress.stage(1, 4):
+            progress.report(1, 2)
+            with progress.stage(1, 2):
+                progress.report(0.5)
+    assert seen == [0.375, 0.4375, 0.5, 0.5]
+
+
+def test_reporter_throttles_and_never_goes_back():
+    seen = []
+    reporter = progress.Reporter(seen.append, interval=60)
+    for fraction in (0.1, 0.2, 0.05, 0.9, 1.0, 1.0):
+        reporter(fraction)
+    assert seen == [0.1, 1.0]
+
+
+def test_kmeans_reports_every_attempt():
+    rng = np.random.default_rng(0)
+    image = (rng.random((32, 32, 3)) * 255).astype(np.uint8)
+    seen = []
+    with progress.reporting(seen.append):
+        img_ops.kmeans_color_operation(image, {"K": 2, "attempts": 3})
+    assert seen == [1 / 3, 2 / 3, 1.0]
+
+
+def test_cancelled_token_stops_handler_at_next_checkpoint():
+    import pytest
+
+    rng = np.random.default_rng(0)
+    image = (rng.random((32, 32, 3)) * 255).astype(np.uint8)
+    token = progress.CancelToken()
+    token.cancel("stop")
+    with pytest.raises(progress.OperationCancelled, match="stop"):
+        progress.guarded(token, img_ops.kmeans_color_operation, image, {"K": 2, "attempts": 3})
+
+    overdue = progress.CancelToken(timeout=1e-9)
+    with pytest.raises(progress.DeadlineExceeded):
+        progress.guarded(overdue, img_ops.kmeans_color_operation, image, {"K": 2, "attempts": 3})
+
+
+def test_latest_request_wins_per_scope():
+    from app.cancellation import LatestWins
+
+    gate = LatestWins()
+    first = gate.enter(("client", "image"))
+    other = gate.enter(("client", "other-image"))
+    second = gate.enter(("client", "image"))
+    assert first.cancelled and not second.cancelled and not other.cancelled
+    gate.leave(("client", "image"), first)
+    assert len(gate) == 2
+    gate.leave(("client", "image"), second)
+    gate.leave(("client", "other-image"), other)
+    assert len(gate) == 0
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from app import result_cache
+
+
+def test_make_key_depends_on_params_and_variant():
+    base = result_cache.make_key("abc", "gamma", {"gamma": 1.1}, variant="result")
+    assert base == result_cache.make_key("abc", "gamma", {"gamma": 1.1}, variant="result")
+    assert base != result_cache.make_key("abc", "gamma", {"gamma": 1.2}, variant="result")
+    assert base != result_cache.make_key("abc", "gamma", {"gamma": 1.1}, variant="preview:640")
+    assert base != result_cache.make_key("abd", "gamma", {"gamma": 1.1}, variant="result")
+
+
+def test_memory_tier_evicts_least_recently_used(tmp_path):
+    cache = result_cache.ResultCache(tmp_path, memory_bytes=10, disk_bytes=0)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") is not None
+    cache.put("c", b"cccc")
+    assert cache.get("b") is None
+    assert cache.get("a").data == b"aaaa"
+    assert cache.get("c").data == b"cccc"
+
+
+def test_disk_tier_survives_restart_and_respects_budget(tmp_path):
+    cache = result_cache.ResultCache(tmp_path, memory_bytes=0, disk_bytes=10)
+    cache.put("a", b"aaaa", {"psnr": 30.0})
+    cache.put("b", b"bbbb")
+    cache.put("c", b"cccc")
+    assert cache.stats()["disk_bytes"] <= 10
+    assert not (tmp_path / "a.bin").exists()
+
+    reopened = result_cache.ResultCache(tmp_path, memory_bytes=0, disk_bytes=10)
+    hit = reopened.get("c")
+    assert hit is not None and hit.data == b"cccc"
+    assert reopened.get("a") is None
+
+
+def test_rejected_replacement_drops_the_old_entry(tmp_path):
+    cache = result_cache.ResultCache(tmp_path / "cache", memory_bytes=8, disk_bytes=8)
+    # direktori belum disentuh sebelum dipakai
+    assert not (tmp_path / "cache").exists()
+    cache.put("a", b"lama")
+    assert cache.get("a").data == b"lama"
+    cache.put("a", b"baru-terlalu-besar")
+    assert cache.get("a") is None
+    assert not list((tmp_path / "cache").iterdir())
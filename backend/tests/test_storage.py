@@ -22,34 +22,117 @@ def test_prepare_image_for_save_uint16_to_uint8():
     assert prepared.max() == 255
 
 
-def test_save_result_raises_when_imwrite_fails(monkeypatch, tmp_path):
-    monkeypatch.setattr(storage, "RESULT_DIR", tmp_path)
-    tmp_path.mkdir(parents=True, exist_ok=True)
-
-    called = {}
-
-    def _fake_imwrite(path, image):  # noqa: ANN001
-        called["attempt"] = (path, image.shape)
-        return False
-
-    monkeypatch.setattr(storage.cv2, "imwrite", _fake_imwrite)
+def test_save_result_bytes_raises_when_write_fails(monkeypatch, tmp_path):
+    monkeypatch.setattr(storage, "RESULT_DIR", tmp_path / "tidak-ada")
+    monkeypatch.setattr(storage, "_write_metadata", lambda *args: None)
 
     with pytest.raises(storage.StorageError) as exc:
-        storage.save_result("job123", np.ones((8, 8), dtype=np.float32))
+        storage.save_result_bytes("job123", storage.encode_for_save(np.ones((8, 8), dtype=np.float32)))
     assert exc.value.status_code == 500
     assert "Gagal" in exc.value.detail
+    with pytest.raises(storage.StorageError):
+        storage.save_result_bytes("job123", b"")
 
 
 
-def test_save_result_creates_png(monkeypatch, tmp_path):
+def test_save_result_bytes_creates_png(monkeypatch, tmp_path):
     monkeypatch.setattr(storage, "RESULT_DIR", tmp_path)
+    monkeypatch.setattr(storage, "_write_metadata", lambda *args: None)
     tmp_path.mkdir(parents=True, exist_ok=True)
 
     data = np.random.rand(10, 10, 3).astype(np.float32)
-    url = storage.save_result("job999", data)
+    url = storage.save_result_bytes("job999", storage.encode_for_save(data))
 
     expected_path = tmp_path / "job999.png"
     assert expected_path.exists()
     assert expected_path.stat().st_size > 0
     assert url == "/media/results/job999.png"
 
+
+
+@pytest.mark.usefixtures("client")
+def test_upload_keeps_original_bytes_and_probes_header(client):
+    import cv2
+
+    image = np.random.default_rng(1).integers(0, 256, (40, 60, 3), dtype=np.uint8)
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 70])
+    assert ok
+    raw = buffer.tobytes()
+    response = client.post("/api/upload", files={"file": ("photo.jpg", raw, "image/jpeg")})
+    assert response.status_code == 200
+    stored = storage.get_upload(response.json()["image_id"])
+    assert stored.path.read_bytes() == raw
+    assert (stored.width, stored.height) == (60, 40)
+    assert not list(storage.UPLOAD_DIR.glob("*.part"))
+
+
+@pytest.mark.usefixtures("client")
+def test_upload_rejects_disguised_and_oversized_files(client, monkeypatch):
+    response = client.post("/api/upload", files={"file": ("fake.png", b"not really a png", "image/png")})
+    assert response.status_code == 400
+
+    monkeypatch.setattr(storage, "MAX_UPLOAD_SIZE", 1024)
+    monkeypatch.setattr(storage, "UPLOAD_CHUNK_SIZE", 256)
+    response = client.post("/api/upload", files={"file": ("big.png", b"\x89PNG" + b"0" * 4096, "image/png")})
+    assert response.status_code == 413
+    assert not list(storage.UPLOAD_DIR.glob("*.part"))
+
+
+@pytest.mark.usefixtures("client")
+def test_legacy_upload_without_sha256_is_hashed_once(client, monkeypatch):
+    image = np.zeros((8, 8, 3), dtype=np.uint8)
+    raw = storage.encode_for_save(image)
+    image_id = client.post("/api/upload", files={"file": ("a.png", raw, "image/png")}).json()["image_id"]
+    metadata = storage.get_metadata_store().get("upload", image_id)
+    metadata.pop("sha256")
+    storage.get_metadata_store().put("upload", image_id, metadata)
+
+    digest = storage.hashlib.sha256(raw).hexdigest()
+    assert storage.get_upload(image_id).sha256 == digest
+    assert storage.get_metadata_store().get("upload", image_id)["sha256"] == digest
+
+    def _no_rehash(path):  # noqa: ANN001
+        raise AssertionError("upload di-hash ulang")
+
+    monkeypatch.setattr(storage, "_file_sha256", _no_rehash)
+    assert storage.get_upload(image_id).sha256 == digest
+
+
+def test_metadata_store_opens_lazily_and_migrates_on_cleanup(test_app):
+    import json
+
+    # import/reload modul tidak membuat database; sidecar lama dimigrasi oleh cleanup_expired
+    assert not storage.METADATA_DB.exists()
+    sidecar = storage.UPLOAD_DIR / "lama.json"
+    sidecar.write_text(json.dumps({"image_id": "lama", "saved_filename": "lama.png"}), encoding="utf-8")
+    storage.cleanup_expired()
+    assert not sidecar.exists()
+    assert storage.get_metadata_store().get("upload", "lama")["saved_filename"] == "lama.png"
+
+
+@pytest.mark.usefixtures("client")
+def test_large_upload_is_decoded_once_and_memory_mapped(client, monkeypatch):
+    from datetime import datetime, timedelta, timezone
+
+    image = np.random.default_rng(3).integers(0, 256, (40, 30, 3), dtype=np.uint8)
+    image_id = client.post(
+        "/api/upload", files={"file": ("a.png", storage.encode_for_save(image), "image/png")}
+    ).json()["image_id"]
+    path = storage.get_upload(image_id).path
+
+    assert not isinstance(storage.load_upload_raster(path), np.memmap)
+    mapped = storage.load_upload_raster(path, memmap_bytes=0)
+    assert isinstance(mapped, np.memmap)
+    assert np.array_equal(mapped, image)
+    assert storage.raster_path(image_id).exists()
+
+    def _no_decode(*args, **kwargs):  # noqa: ANN001
+        raise AssertionError("raster di-decode ulang")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(storage.cv2, "imread", _no_decode)
+        assert np.array_equal(storage.load_upload_raster(path, memmap_bytes=0), image)
+    del mapped
+
+    storage.cleanup_expired(datetime.now(timezone.utc) + timedelta(hours=storage.TTL_HOURS + 1))
+    assert not storage.raster_path(image_id).exists()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from app import img_ops
+from app.services import image_ops, tiling
+
+
+def _image(channels: int = 3) -> np.ndarray:
+    rng = np.random.default_rng(7)
+    return rng.integers(0, 256, (180, 150, channels), dtype=np.uint8)
+
+
+@pytest.mark.parametrize(
+    "operation, params",
+    [
+        ("gaussian", {"ksize": 7, "sigma": 2.0}),
+        ("median", {"ksize": 5}),
+        ("bilateral", {"d": 9}),
+        ("morph", {"op": "open", "kernel": 4, "iter": 2}),
+        ("nlmeans", {"search": 15}),
+        ("hist_eq_clahe", {}),
+        ("hist_eq_clahe", {"mode": "he_gray"}),
+    ],
+)
+def test_tiled_result_is_seam_free(operation, params):
+    image = _image()
+    expected = image_ops.apply_operation(image, operation, params)
+    tiled = tiling.apply_tiled(image, operation, params, tile_size=64, workers=3, memmap_bytes=0)
+    assert isinstance(tiled, np.memmap)
+    assert np.array_equal(np.asarray(tiled), expected)
+
+
+def test_alpha_channel_survives_tiling():
+    image = _image(4)
+    expected = image_ops.apply_operation(image, "median", {"ksize": 3})
+    tiled = tiling.apply_tiled(image, "median", {"ksize": 3}, tile_size=50, workers=2)
+    assert np.array_equal(tiled, expected)
+
+
+def test_only_large_images_of_tileable_operations_are_tiled(monkeypatch):
+    monkeypatch.setattr(tiling, "TILE_MIN_PIXELS", 100 * 100)
+    small = np.zeros((50, 50, 3), dtype=np.uint8)
+    large = np.zeros((120, 120, 3), dtype=np.uint8)
+    assert not tiling.should_tile(small, "gaussian")
+    assert tiling.should_tile(large, "gaussian")
+    assert not tiling.should_tile(large, "geo")
+    assert tiling.TILE_HALOS["morph"]({"op": "open", "kernel": 5, "iter": 2}) == 8
+
+
+def test_uint8_memmap_output_is_not_copied_back_to_ram(monkeypatch):
+    monkeypatch.setattr(tiling, "TILE_MIN_PIXELS", 100 * 100)
+    monkeypatch.setattr(tiling, "TILE_MEMMAP_BYTES", 0)
+    image = _image()
+    result, _ = img_ops.apply_operation_with_metrics(image, "median", {"ksize": 5})
+    assert isinstance(result, np.memmap)
+    assert np.array_equal(np.asarray(result), image_ops.apply_operation(image, "median", {"ksize": 5}))
+
+
+def test_limit_workers_only_lowers_the_tile_thread_count(monkeypatch):
+    monkeypatch.setattr(tiling, "TILE_WORKERS", 8)
+    tiling.limit_workers(2)
+    assert tiling.TILE_WORKERS == 2
+    tiling.limit_workers(16)
+    assert tiling.TILE_WORKERS == 2
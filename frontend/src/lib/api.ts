@@ -148,7 +148,9 @@ export function openProgressWS(jobId: string): WebSocket | null {
 }
 
 export async function downloadResult(jobId: string): Promise<string> {
-  const response = await fetch(`${getBaseUrl()}/api/download/${jobId}`);
+  const response = await fetch(`${getBaseUrl()}/api/download/${jobId}`, {
+    headers: { Accept: "application/json" },
+  });
   const data = await handleResponse<DownloadResponse>(response);
   return data.b64;
 }